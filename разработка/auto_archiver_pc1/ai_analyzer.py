@@ -6,19 +6,69 @@ import json
 import re
 from datetime import datetime
 from collections import Counter
+import io
 import zipfile
-import tempfile
-import shutil
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from analysis_engine import FusedAnalyzer, analyze_chunked
+from lexicon import get_lexicon, tokenize, tokenize_lowered
+from json_stream import iter_json_messages
+from analysis_cache import AnalysisCache
+from sketches import AnalysisSketches, merge_sketches
+from burst_detector import detect_bursts
+
+# Файл метаданных больше этого размера (без сжатия) считается кусками в пуле процессов
+PARALLEL_MIN_BYTES = 64 * 1024 * 1024
+
+def iter_ndjson_messages(stream):
+    """
+    Чтение сообщений из messages.ndjson
+    
+    Yields:
+        dict: Сообщения (служебные строки header/footer и правки из живого
+              режима пропускаются - само сообщение уже учтено)
+    """
+    for line in stream:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if record.pop('type', 'message') == 'message' and record.get('event') != 'edited':
+            yield record
+
+def _process_context():
+    """
+    Способ запуска процессов пула без fork
+
+    Анализ запускается и из фонового потока веб-интерфейса: fork
+    многопоточного процесса копирует блокировки, занятые другими потоками,
+    и процессы пула могут зависнуть. forkserver (или spawn, где его нет)
+    запускает их с чистого состояния.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+# Анализатор процесса пула (создается один раз на процесс)
+_worker_analyzer = None
+
+def _init_worker(storage_path):
+    global _worker_analyzer
+    _worker_analyzer = AIAnalyzer(storage_path, max_workers=1)
+
+def _analyze_in_worker(archive_path):
+    return _worker_analyzer.analyze_telegram_archive(archive_path)
 
 class AIAnalyzer:
-    def __init__(self, storage_path="./secure_storage"):
+    def __init__(self, storage_path="./secure_storage", max_workers=None):
         """
         Инициализация AI анализатора
         
         Args:
             storage_path: Путь к хранилищу данных
+            max_workers: Процессов для анализа всех архивов и кусков большого
+                         архива (по умолчанию - по числу ядер)
         """
         self.storage_path = storage_path
+        self.max_workers = max_workers or os.cpu_count() or 1
         self.decrypted_storage = f"{storage_path}/decrypted"
         self.ai_results_path = f"{storage_path}/ai_results"
         
@@ -26,19 +76,37 @@ class AIAnalyzer:
         os.makedirs(self.ai_results_path, exist_ok=True)
         os.makedirs(f"{self.ai_results_path}/reports", exist_ok=True)
         os.makedirs(f"{self.ai_results_path}/stats", exist_ok=True)
+        os.makedirs(f"{self.ai_results_path}/channels", exist_ok=True)
+        
+        # Результаты по хэшу архива, версии анализатора и словарям
+        self.cache = AnalysisCache(f"{self.ai_results_path}/cache")
         
         print("🤖 AI-анализатор инициализирован")
     
-    def analyze_telegram_archive(self, archive_path):
+    def analyze_telegram_archive(self, archive_path, use_cache=True):
         """
         Анализ Telegram архива
         
         Args:
             archive_path: Путь к архиву .zip
+            use_cache: Вернуть готовый результат, если архив уже анализировался
         
         Returns:
             dict: Результаты анализа
         """
+        if use_cache:
+            try:
+                cached = self.cache.lookup(archive_path)
+            except OSError:
+                cached = None
+            if cached:
+                print(f"♻️ Архив не изменился, результат из кэша: {os.path.basename(archive_path)}")
+                if not self.cache.is_recorded(archive_path):
+                    # Те же байты под другим именем: отчеты и запись кэша - под именем этого архива
+                    files = self._save_results(cached, archive_path)
+                    self.cache.store(archive_path, cached, files)
+                return cached
+        
         print(f"🔍 Анализирую архив: {os.path.basename(archive_path)}")
         
         results = {
@@ -53,65 +121,65 @@ class AIAnalyzer:
         }
         
         try:
-            # Создаем временную папку для распаковки
-            temp_dir = tempfile.mkdtemp()
+            # Анализируем каждый файл метаданных: все агрегаторы - за один проход
+            engine = FusedAnalyzer()
             
-            # Распаковываем архив
+            # Архив не распаковываем: файлы метаданных читаются прямо из zip
+            # по центральному каталогу, медиа не читаются вовсе
             with zipfile.ZipFile(archive_path, 'r') as zip_ref:
-                zip_ref.extractall(temp_dir)
-            
-            # Ищем файлы метаданных
-            metadata_files = []
-            for root, dirs, files in os.walk(temp_dir):
-                for file in files:
-                    if file == 'metadata.json' or file.endswith('.json'):
-                        metadata_files.append(os.path.join(root, file))
-            
-            if not metadata_files:
-                results["summary"] = "⚠️ В архиве не найдены метаданные"
-                return results
-            
-            # Анализируем каждый файл метаданных
-            all_messages = []
-            all_users = set()
-            
-            for metadata_file in metadata_files:
+                metadata_files = [info for info in zip_ref.infolist()
+                                  if not info.is_dir() and info.filename.endswith(('.json', '.ndjson'))]
+                
+                if not metadata_files:
+                    results["summary"] = "⚠️ В архиве не найдены метаданные"
+                    return results
+                
+                # Огромный канал не должен считаться на одном ядре:
+                # сообщения большого файла режутся на куски для пула процессов
+                executor = None
+                if self.max_workers > 1 and any(info.file_size >= PARALLEL_MIN_BYTES for info in metadata_files):
+                    executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=_process_context())
+                    print(f"⚡ Большой архив: анализ кусками в {self.max_workers} процессах")
+                
                 try:
-                    with open(metadata_file, 'r', encoding='utf-8') as f:
-                        metadata = json.load(f)
-                    
-                    # Базовый анализ
-                    if 'messages' in metadata:
-                        messages = metadata['messages']
-                        all_messages.extend(messages)
+                    for metadata_file in metadata_files:
+                        try:
+                            with zip_ref.open(metadata_file) as raw:
+                                f = io.TextIOWrapper(raw, encoding='utf-8')
+                                if metadata_file.filename.endswith('.ndjson'):
+                                    # Потоковый формат архиватора: заголовок, сообщения, итоги
+                                    messages = iter_ndjson_messages(f)
+                                else:
+                                    # Старый metadata.json: сообщения разбираются по одному,
+                                    # файл целиком в память не загружается
+                                    messages = iter_json_messages(f)
+                                
+                                if executor and metadata_file.file_size >= PARALLEL_MIN_BYTES:
+                                    analyze_chunked(engine, messages, executor)
+                                else:
+                                    engine.feed_all(messages)
                         
-                        # Собираем пользователей
-                        for msg in messages:
-                            if 'sender_id' in msg:
-                                all_users.add(str(msg['sender_id']))
-                
-                except Exception as e:
-                    print(f"⚠️ Ошибка чтения {metadata_file}: {e}")
+                        except Exception as e:
+                            print(f"⚠️ Ошибка чтения {metadata_file.filename}: {e}")
+                finally:
+                    if executor:
+                        executor.shutdown()
             
-            if not all_messages:
+            if not engine.total_messages:
                 results["summary"] = "📭 В архиве нет сообщений для анализа"
                 return results
             
             # Выполняем анализ
-            results["basic_stats"] = self._analyze_basic_stats(all_messages, all_users)
-            results["sentiment_analysis"] = self._analyze_sentiment(all_messages)
-            results["content_analysis"] = self._analyze_content(all_messages)
-            results["user_analysis"] = self._analyze_users(all_messages)
-            results["anomalies"] = self._detect_anomalies(all_messages)
+            results.update(engine.results())
+            # Сливаемые сводки для общего отчета (отправители, слова, длины сообщений)
+            results["sketches"] = AnalysisSketches.from_engine(engine).to_dict()
             results["summary"] = self._generate_summary(results)
             
             # Сохраняем результаты
-            self._save_results(results, archive_path)
-            
-            # Очищаем временную папку
-            shutil.rmtree(temp_dir)
+            files = self._save_results(results, archive_path)
+            self.cache.store(archive_path, results, files)
             
-            print(f"✅ Анализ завершен: {len(all_messages)} сообщений, {len(all_users)} пользователей")
+            print(f"✅ Анализ завершен: {engine.total_messages} сообщений, {len(engine.user_counter)} пользователей")
             return results
             
         except Exception as e:
@@ -119,6 +187,8 @@ class AIAnalyzer:
             results["summary"] = f"❌ Ошибка анализа: {str(e)}"
             return results
     
+    # Отдельные проходы ниже - эталон для analysis_engine (замер и сверка результатов)
+    
     def _analyze_basic_stats(self, messages, users):
         """Базовая статистика"""
         stats = {
@@ -172,36 +242,22 @@ class AIAnalyzer:
             "dominant_emotion": "neutral"
         }
         
-        # Списки слов для анализа
-        positive_words = {
-            'хорошо', 'отлично', 'прекрасно', 'замечательно', 'супер', 'класс', 'отличный',
-            'хороший', 'прекрасный', 'замечательный', 'великолепно', 'превосходно',
-            'спасибо', 'благодарю', 'рад', 'доволен', 'счастлив', 'успех', 'победа',
-            'любовь', 'нравится', 'восхитительно', 'потрясающе', 'здорово'
-        }
-        
-        negative_words = {
-            'плохо', 'ужасно', 'отвратительно', 'кошмар', 'проблема', 'ошибка',
-            'неправильно', 'нельзя', 'запрещено', 'опасно', 'страшно', 'грустно',
-            'печально', 'разочарован', 'злой', 'сердитый', 'ненавижу', 'не люблю',
-            'проигрыш', 'поражение', 'провал', 'катастрофа', 'беда'
-        }
+        # Словари (фразы и отрицания учитываются)
+        lexicon = get_lexicon()
         
         total_words = 0
         
         for msg in messages:
             if 'text' in msg and msg['text']:
-                text = str(msg['text']).lower()
-                words = re.findall(r'\b[а-яa-z]+\b', text)
+                words = tokenize(str(msg['text']))
+                total_words += len(words)
                 
-                for word in words:
-                    total_words += 1
-                    if word in positive_words:
-                        sentiment["positive_words"] += 1
-                    elif word in negative_words:
-                        sentiment["negative_words"] += 1
-                    else:
-                        sentiment["neutral_words"] += 1
+                positive, negative = lexicon.sentiment(words)
+                sentiment["positive_words"] += positive
+                sentiment["negative_words"] += negative
+        
+        # Фраза из словаря - одно совпадение, остальные слова нейтральны
+        sentiment["neutral_words"] = total_words - sentiment["positive_words"] - sentiment["negative_words"]
         
         # Рассчитываем score
         if total_words > 0:
@@ -230,17 +286,15 @@ class AIAnalyzer:
         
         # Счетчик слов
         word_counter = Counter()
-        stop_words = {'и', 'в', 'не', 'на', 'что', 'это', 'как', 'но', 'а', 'или', 'у', 'за', 'к', 'до', 'по', 'из', 'от', 'же', 'бы', 'для', 'то', 'вы', 'он', 'она', 'они', 'мы', 'вас', 'ваш', 'их', 'те', 'та', 'тот', 'этот', 'такой', 'такие', 'свой'}
+        lexicon = get_lexicon()
         
         for msg in messages:
             if 'text' in msg and msg['text']:
                 text = str(msg['text']).lower()
                 
                 # Считаем слова
-                words = re.findall(r'\b[а-яa-z]{3,}\b', text)
-                for word in words:
-                    if word not in stop_words:
-                        word_counter[word] += 1
+                for word in lexicon.content_words(tokenize_lowered(text)):
+                    word_counter[word] += 1
                 
                 # Считаем URL
                 content["urls_count"] += len(re.findall(r'https?://\S+', text))
@@ -326,6 +380,9 @@ class AIAnalyzer:
                 except:
                     pass
         
+        # Всплески: много сообщений за короткое окно даже у давних пользователей
+        anomalies.extend(detect_bursts(messages))
+        
         # Проверяем на очень длинные сообщения
         for msg in messages:
             if 'text' in msg and msg['text']:
@@ -377,7 +434,12 @@ class AIAnalyzer:
         if analysis_results.get('anomalies'):
             summary_lines.append(f"\n⚠️  АНОМАЛИИ:")
             for anomaly in analysis_results['anomalies'][:3]:
-                summary_lines.append(f"• {anomaly.get('type', 'unknown')}")
+                if anomaly.get('type') == 'message_burst':
+                    summary_lines.append(f"• message_burst: пользователь {anomaly['user_id']}, "
+                                         f"{anomaly['messages_count']} сообщ. за {anomaly['window_seconds'] // 60} мин "
+                                         f"({anomaly['window_start']} - {anomaly['window_end']})")
+                else:
+                    summary_lines.append(f"• {anomaly.get('type', 'unknown')}")
         
         return "\n".join(summary_lines)
     
@@ -404,9 +466,22 @@ class AIAnalyzer:
         print(f"💾 Результаты сохранены:")
         print(f"   📊 JSON: {json_file}")
         print(f"   📝 Отчет: {report_file}")
+        return [json_file, report_file]
     
-    def analyze_all_archives(self):
-        """Анализ всех архивов в хранилище"""
+    def analyze_all_archives(self, max_workers=None, progress_callback=None):
+        """
+        Анализ всех архивов в хранилище
+        
+        Разбор сообщений упирается в GIL, поэтому архивы раздаются пулу
+        процессов; результаты собираются по мере готовности.
+        
+        Args:
+            max_workers: Процессов в пуле (по умолчанию self.max_workers)
+            progress_callback: Функция (готово, всего, результат архива)
+        
+        Returns:
+            list: Результаты в порядке имен архивов
+        """
         archives_path = self.decrypted_storage
         
         if not os.path.exists(archives_path):
@@ -415,30 +490,132 @@ class AIAnalyzer:
         
         # Ищем .zip файлы
         archives = []
-        for file in os.listdir(archives_path):
+        for file in sorted(os.listdir(archives_path)):
             if file.endswith('.zip'):
                 archives.append(os.path.join(archives_path, file))
         
-        print(f"📁 Найдено архивов для анализа: {len(archives)}")
-        
-        results = []
-        for archive in archives:
-            result = self.analyze_telegram_archive(archive)
-            results.append(result)
-        
-        # Создаем общий отчет
+        workers = min(max_workers or self.max_workers, len(archives))
+        print(f"📁 Найдено архивов для анализа: {len(archives)} (процессов: {max(workers, 1)})")
+        
+        results = [None] * len(archives)
+        
+        def finished(index, result):
+            results[index] = result
+            if progress_callback:
+                done = sum(1 for r in results if r is not None)
+                progress_callback(done, len(archives), result)
+        
+        if workers <= 1:
+            for index, archive in enumerate(archives):
+                finished(index, self.analyze_telegram_archive(archive))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(self.storage_path,),
+                                     mp_context=_process_context()) as executor:
+                futures = {executor.submit(_analyze_in_worker, archive): index
+                           for index, archive in enumerate(archives)}
+                for future in as_completed(futures):
+                    index = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # Упал сам процесс пула - архив отмечаем как неудачный
+                        print(f"❌ Ошибка анализа {os.path.basename(archives[index])}: {e}")
+                        result = {
+                            "archive_name": os.path.basename(archives[index]),
+                            "analysis_date": datetime.now().isoformat(),
+                            "basic_stats": {},
+                            "sentiment_analysis": {},
+                            "content_analysis": {},
+                            "user_analysis": {},
+                            "anomalies": [],
+                            "summary": f"❌ Ошибка анализа: {str(e)}"
+                        }
+                    finished(index, result)
+        
+        # Создаем общий отчет (один раз, когда готовы все архивы)
         if results:
             self._create_global_report(results)
         
+        # Результаты удаленных архивов и прошлых версий анализатора больше не нужны
+        self.cache.gc(archives_path)
+        
         return results
     
+    def analyze_channel(self, index_path, max_workers=None):
+        """
+        Анализ многотомного архива канала
+        
+        Тома самостоятельны, поэтому раздаются пулу процессов, как архивы
+        в analyze_all_archives; индекс канала (secure_storage/channels)
+        связывает их в общую сводку.
+        
+        Args:
+            index_path: Путь к индексу канала
+            max_workers: Процессов в пуле (по умолчанию self.max_workers)
+        
+        Returns:
+            dict: Сводка по каналу с результатами томов
+        """
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        
+        volumes = sorted(index.get('volumes', {}).items(), key=lambda item: int(item[0]))
+        archives = [os.path.join(self.decrypted_storage, volume['stored_as']) for _, volume in volumes]
+        
+        print(f"📚 Анализирую канал {index.get('channel_name')}: {len(archives)} томов "
+              f"(ожидается {index.get('total_volumes') or '?'})")
+        
+        workers = min(max_workers or self.max_workers, len(archives))
+        if workers <= 1:
+            results = [self.analyze_telegram_archive(archive) for archive in archives]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(self.storage_path,),
+                                     mp_context=_process_context()) as executor:
+                results = list(executor.map(_analyze_in_worker, archives))
+        
+        summary = {
+            "channel_name": index.get('channel_name'),
+            "run_id": index.get('run_id'),
+            "analysis_date": datetime.now().isoformat(),
+            "complete": index.get('complete', False),
+            "total_volumes": index.get('total_volumes'),
+            "total_messages": sum(r['basic_stats'].get('total_messages', 0) for r in results),
+            "volumes": [{
+                "volume": int(number),
+                "archive_name": result['archive_name'],
+                "min_id": volume.get('min_id'),
+                "max_id": volume.get('max_id'),
+                "total_messages": result['basic_stats'].get('total_messages', 0),
+                "unique_users": result['basic_stats'].get('unique_users', 0),
+                "sentiment_score": result['sentiment_analysis'].get('sentiment_score', 0),
+                "anomalies": len(result['anomalies'])
+            } for (number, volume), result in zip(volumes, results)]
+        }
+        
+        index_name = os.path.basename(index_path).replace('.json', '')
+        summary_file = f"{self.ai_results_path}/channels/{index_name}.json"
+        with open(summary_file, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        
+        print(f"✅ Канал проанализирован: {summary['total_messages']} сообщений в {len(results)} томах")
+        print(f"   📊 Сводка: {summary_file}")
+        return summary
+    
     def _create_global_report(self, all_results):
         """Создание общего отчета по всем архивам"""
         if not all_results:
             return
         
         total_messages = sum(r['basic_stats'].get('total_messages', 0) for r in all_results)
-        total_users = sum(r['basic_stats'].get('unique_users', 0) for r in all_results)
+        
+        # Отправители, общие для нескольких каналов, считаются один раз (слияние сводок);
+        # для результатов без сводок остается сумма по архивам
+        sketches, without_sketches = merge_sketches(all_results)
+        global_stats = sketches.summary() if sketches else {}
+        total_users = global_stats.get('unique_users', 0) + sum(
+            r['basic_stats'].get('unique_users', 0) for r in without_sketches)
         
         # Анализ тональности
         sentiment_scores = [r['sentiment_analysis'].get('sentiment_score', 0) for r in all_results]
@@ -458,6 +635,18 @@ class AIAnalyzer:
 • Общий настрой: {'ПОЗИТИВНЫЙ' if avg_sentiment > 0.1 else 'НЕГАТИВНЫЙ' if avg_sentiment < -0.1 else 'НЕЙТРАЛЬНЫЙ'}
 
 📈 ТОП АРХИВОВ ПО АКТИВНОСТИ:
+"""
+        report_tail = ""
+        if global_stats:
+            top_words = ", ".join(f"{word}({count})" for word, count in global_stats['common_words'][:10])
+            length = global_stats['message_length']
+            report_tail = f"""
+🔍 ЧАСТЫЕ СЛОВА ВО ВСЕХ АРХИВАХ:
+• {top_words or '-'}
+
+📏 ДЛИНА СООБЩЕНИЙ:
+• Медиана: {length['median'] or 0:.0f} симв.
+• 90% сообщений короче: {length['p90'] or 0:.0f} симв.
 """
         
         # Сортируем по количеству сообщений
@@ -467,6 +656,7 @@ class AIAnalyzer:
             stats = result['basic_stats']
             report += f"{i}. {result['archive_name']}: {stats.get('total_messages', 0)} сообщений, {stats.get('unique_users', 0)} пользователей\n"
         
+        report += report_tail
         report += f"\n⚠️  ВСЕГО АНОМАЛИЙ: {sum(len(r['anomalies']) for r in all_results)}"
         
         # Сохраняем общий отчет
@@ -0,0 +1,183 @@
+"""
+Кэш результатов AI анализа
+Результат хранится по ключу: SHA256 архива + версия анализатора + отпечаток
+словарей. Неизмененный архив не анализируется повторно и не порождает новых
+файлов stats/reports; смена версии или словарей меняет ключ, и старое
+поколение результатов удаляется сборкой мусора.
+
+Файлы кэша (ai_results/cache):
+    archives/<архив>.json - размер, mtime и SHA256 архива, ключ результата, файлы отчетов
+    results/<ключ>.json   - полный результат анализа
+"""
+import os
+import json
+import hashlib
+from datetime import datetime
+from analysis_engine import ANALYZER_VERSION, lexicon_fingerprint
+
+
+def file_sha256(path, block_size=1024 * 1024):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _write_json(path, data):
+    """Атомарная запись (кэш пишут параллельные процессы анализа)"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class AnalysisCache:
+    def __init__(self, cache_path):
+        """
+        Инициализация кэша
+
+        Args:
+            cache_path: Папка кэша (archives/ и results/)
+        """
+        self.archives_dir = os.path.join(cache_path, "archives")
+        self.results_dir = os.path.join(cache_path, "results")
+        os.makedirs(self.archives_dir, exist_ok=True)
+        os.makedirs(self.results_dir, exist_ok=True)
+
+        # Поколение: при смене кода анализатора или словарей кэш устаревает целиком
+        self.generation = f"{ANALYZER_VERSION}:{lexicon_fingerprint()}"
+        self._digests = {}    # путь -> (размер, mtime_ns, sha256) до записи в archives/
+
+    def _record_path(self, archive_name):
+        return os.path.join(self.archives_dir, f"{archive_name}.json")
+
+    def _result_path(self, key):
+        return os.path.join(self.results_dir, f"{key}.json")
+
+    def archive_digest(self, archive_path):
+        """
+        SHA256 архива; не пересчитывается, если размер и mtime не менялись
+
+        Returns:
+            tuple: (sha256, запись архива или None)
+        """
+        stat = os.stat(archive_path)
+        record = _read_json(self._record_path(os.path.basename(archive_path)))
+        if record and record.get('size') == stat.st_size and record.get('mtime_ns') == stat.st_mtime_ns:
+            return record['sha256'], record
+
+        known = self._digests.get(archive_path)
+        if known and known[:2] == (stat.st_size, stat.st_mtime_ns):
+            return known[2], record
+        sha256 = file_sha256(archive_path)
+        self._digests[archive_path] = (stat.st_size, stat.st_mtime_ns, sha256)
+        return sha256, record
+
+    def key(self, sha256):
+        return hashlib.sha256(f"{sha256}:{self.generation}".encode('utf-8')).hexdigest()
+
+    def lookup(self, archive_path):
+        """
+        Готовый результат для архива
+
+        Ключ - содержимое архива, поэтому результат мог быть сохранен для
+        другого архива с теми же байтами: имя архива в нем заменяется на текущее.
+
+        Returns:
+            dict: Результат анализа или None
+        """
+        sha256, _ = self.archive_digest(archive_path)
+        entry = _read_json(self._result_path(self.key(sha256)))
+        if not entry or entry.get('generation') != self.generation:
+            return None
+        results = entry['results']
+        results['archive_name'] = os.path.basename(archive_path)
+        return results
+
+    def is_recorded(self, archive_path):
+        """Сохранен ли текущий результат именно для этого архива (со своими отчетами)"""
+        sha256, record = self.archive_digest(archive_path)
+        return bool(record) and record.get('key') == self.key(sha256)
+
+    def store(self, archive_path, results, files=()):
+        """
+        Сохранение результата; отчеты прошлого результата архива удаляются
+
+        Args:
+            archive_path: Путь к архиву
+            results: Результат анализа
+            files: Файлы stats/reports, созданные для этого результата
+        """
+        stat = os.stat(archive_path)
+        sha256, old_record = self.archive_digest(archive_path)
+        key = self.key(sha256)
+
+        _write_json(self._result_path(key), {
+            "generation": self.generation,
+            "archive_sha256": sha256,
+            "created": datetime.now().isoformat(),
+            "results": results
+        })
+        _write_json(self._record_path(os.path.basename(archive_path)), {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": sha256,
+            "key": key,
+            "files": list(files)
+        })
+        self._digests.pop(archive_path, None)
+
+        if old_record:
+            for path in set(old_record.get('files', [])) - set(files):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def gc(self, archives_dir=None):
+        """
+        Сборка мусора
+
+        Удаляются результаты прошлых поколений и ни на что не ссылающиеся,
+        а также записи (и отчеты) архивов, которых больше нет в archives_dir.
+
+        Returns:
+            int: Удалено файлов кэша
+        """
+        removed = 0
+        live_keys = set()
+
+        for name in os.listdir(self.archives_dir):
+            if not name.endswith('.json'):
+                continue
+            record_path = os.path.join(self.archives_dir, name)
+            record = _read_json(record_path) or {}
+            archive_name = name[:-len('.json')]
+
+            if archives_dir and not os.path.exists(os.path.join(archives_dir, archive_name)):
+                for path in record.get('files', []):
+                    if os.path.exists(path):
+                        os.remove(path)
+                os.remove(record_path)
+                removed += 1
+                continue
+
+            if record.get('sha256') and record.get('key') == self.key(record['sha256']):
+                live_keys.add(record['key'])
+
+        for name in os.listdir(self.results_dir):
+            if not name.endswith('.json') or name[:-len('.json')] in live_keys:
+                continue
+            os.remove(os.path.join(self.results_dir, name))
+            removed += 1
+
+        if removed:
+            print(f"🧹 Кэш анализа: удалено устаревших файлов {removed}")
+        return removed
@@ -0,0 +1,456 @@
+"""
+Однопроходный движок анализа сообщений
+Каждое сообщение разбирается один раз (текст, слова, дата), и все
+агрегаторы - статистика, тональность, контент, пользователи, аномалии -
+обновляются в том же проходе. Результат совпадает с отдельными методами
+AIAnalyzer (_analyze_basic_stats, _analyze_sentiment, ...) до значения.
+
+Большой поток сообщений можно разбить на куски и посчитать их в пуле
+процессов (analyze_chunked): частичные агрегаты сливаются в порядке кусков,
+поэтому итог тот же, что и при последовательном проходе.
+"""
+import re
+import sys
+import time
+import random
+from datetime import datetime, timedelta
+from collections import Counter, deque
+from itertools import islice
+from lexicon import get_lexicon, tokenize_lowered
+from burst_detector import BurstDetector, datetime_timestamp
+from message_frame import MessageFrame
+
+# Версия алгоритмов анализа: менять при любом изменении результатов (сбрасывает кэш)
+ANALYZER_VERSION = "4"
+
+URL_RE = re.compile(r'https?://\S+')
+HASHTAG_RE = re.compile(r'#\w+')
+MENTION_RE = re.compile(r'@\w+')
+
+
+def lexicon_fingerprint():
+    """Отпечаток словарей: результаты, посчитанные с другими словарями, устарели"""
+    return get_lexicon().fingerprint
+
+
+SPAM_MIN_MESSAGES = 50
+LONG_MESSAGE = 1000
+
+CHUNK_SIZE = 50000          # Сообщений в куске для пула процессов
+
+
+class _UserDates:
+    """Даты сообщений пользователя для поиска спама: только счетчик и границы"""
+    __slots__ = ('count', 'first', 'last', 'failed')
+
+    def __init__(self):
+        self.count = 0
+        self.first = None
+        self.last = None
+        self.failed = False
+
+    def add(self, parsed):
+        self.count += 1
+        if self.failed:
+            return
+        if parsed is None:
+            self.failed = True
+            return
+        try:
+            if self.first is None:
+                self.first = self.last = parsed
+            elif parsed < self.first:
+                self.first = parsed
+            elif parsed > self.last:
+                self.last = parsed
+        except TypeError:
+            # Даты с часовым поясом и без него несравнимы
+            self.failed = True
+
+    def merge(self, other):
+        """Добавление дат того же пользователя из следующего куска"""
+        self.count += other.count
+        if self.failed:
+            return
+        if other.failed:
+            self.failed = True
+            return
+        if other.first is None:
+            return
+        if self.first is None:
+            self.first, self.last = other.first, other.last
+            return
+        try:
+            self.first = min(self.first, other.first)
+            self.last = max(self.last, other.last)
+        except TypeError:
+            self.failed = True
+
+
+class FusedAnalyzer:
+    def __init__(self, detect_bursts=True):
+        """
+        Пустые агрегаторы; сообщения подаются через feed()
+
+        Args:
+            detect_bursts: Искать всплески активности. Куски analyze_chunked
+                           считаются без этого: всплеск может пересечь границу
+                           куска, поэтому окна ведет основной процесс, а кусок
+                           только записывает (отправитель, время) сообщений
+                           в колоночную ленту timeline (MessageFrame) - даты
+                           разбирает процесс пула.
+        """
+        self.total_messages = 0
+        self.media_count = 0
+        self.total_length = 0
+        self.length_counter = Counter()
+        self.first_date = None
+        self.last_date = None
+
+        self.total_words = 0
+        self.positive_words = 0
+        self.negative_words = 0
+        self.word_counter = Counter()
+
+        self.urls_count = 0
+        self.hashtags_count = 0
+        self.mentions_count = 0
+
+        self.user_counter = Counter()
+        self.hour_counter = Counter()
+        self.user_dates = {}
+        self.long_messages = []
+        self.bursts = BurstDetector() if detect_bursts else None
+        self.burst_anomalies = []
+        self.timeline = None if detect_bursts else MessageFrame()
+
+        self.lexicon = get_lexicon()
+
+    def feed(self, msg):
+        """Учет одного сообщения всеми агрегаторами"""
+        self.total_messages += 1
+
+        if msg.get('media_type'):
+            self.media_count += 1
+
+        if 'sender_id' in msg:
+            self.user_counter[str(msg['sender_id'])] += 1
+
+        # Дата: строка дня для периода, разобранное время для часов и спама
+        date = msg.get('date')
+        parsed = None
+        if date:
+            try:
+                day = date.split('T')[0] if 'T' in date else date
+                if self.first_date is None:
+                    self.first_date = self.last_date = day
+                elif day < self.first_date:
+                    self.first_date = day
+                elif day > self.last_date:
+                    self.last_date = day
+            except Exception:
+                pass
+            try:
+                parsed = datetime.fromisoformat(date.replace('Z', '+00:00'))
+                self.hour_counter[parsed.hour] += 1
+            except Exception:
+                parsed = None
+
+        if parsed is not None and 'sender_id' in msg:
+            if self.bursts is not None:
+                finished = self.bursts.add(msg['sender_id'], datetime_timestamp(parsed))
+                if finished:
+                    self.burst_anomalies.extend(finished)
+            else:
+                self.timeline.append(msg['sender_id'], parsed)
+
+        if 'sender_id' in msg and 'date' in msg:
+            dates = self.user_dates.get(msg['sender_id'])
+            if dates is None:
+                dates = self.user_dates[msg['sender_id']] = _UserDates()
+            dates.add(parsed)
+
+        text = msg.get('text')
+        if not text:
+            return
+
+        text = str(text)
+        length = len(text)
+        self.total_length += length
+        self.length_counter[length] += 1
+        if length > LONG_MESSAGE:
+            self.long_messages.append({
+                "type": "very_long_message",
+                "message_id": msg.get('id', 'unknown'),
+                "length": length
+            })
+
+        # Нижний регистр - один раз на сообщение: и для слов, и для регулярных выражений
+        text = text.lower()
+        words = tokenize_lowered(text)
+        self.total_words += len(words)
+        positive, negative = self.lexicon.sentiment(words)
+        self.positive_words += positive
+        self.negative_words += negative
+        self.word_counter.update(self.lexicon.content_words(words))
+
+        # Регулярные выражения - только если в тексте есть нужный символ
+        if '://' in text:
+            self.urls_count += len(URL_RE.findall(text))
+        if '#' in text:
+            self.hashtags_count += len(HASHTAG_RE.findall(text))
+        if '@' in text:
+            self.mentions_count += len(MENTION_RE.findall(text))
+
+    def feed_all(self, messages):
+        for msg in messages:
+            self.feed(msg)
+        return self
+
+    def feed_timeline(self, timeline):
+        """Окна всплесков по ленте (MessageFrame) куска, посчитанного без них"""
+        add = self.bursts.add
+        for sender_id, timestamp in timeline.events():
+            finished = add(sender_id, timestamp)
+            if finished:
+                self.burst_anomalies.extend(finished)
+
+    def merge(self, other):
+        """
+        Слияние агрегатов следующего куска сообщений
+
+        Куски сливаются в порядке потока: счетчики дополняются новыми
+        ключами в порядке первого появления, как при одном проходе, поэтому
+        совпадает и порядок равных по частоте слов и пользователей.
+        Сообщения куска попадают в окна всплесков в том же порядке.
+        """
+        if self.bursts is not None and other.timeline:
+            self.feed_timeline(other.timeline)
+        elif self.timeline is not None and other.timeline:
+            self.timeline.extend(other.timeline)
+
+        self.total_messages += other.total_messages
+        self.media_count += other.media_count
+        self.total_length += other.total_length
+        self.length_counter.update(other.length_counter)
+        if other.first_date is not None:
+            if self.first_date is None:
+                self.first_date, self.last_date = other.first_date, other.last_date
+            else:
+                self.first_date = min(self.first_date, other.first_date)
+                self.last_date = max(self.last_date, other.last_date)
+
+        self.total_words += other.total_words
+        self.positive_words += other.positive_words
+        self.negative_words += other.negative_words
+        self.word_counter.update(other.word_counter)
+
+        self.urls_count += other.urls_count
+        self.hashtags_count += other.hashtags_count
+        self.mentions_count += other.mentions_count
+
+        self.user_counter.update(other.user_counter)
+        self.hour_counter.update(other.hour_counter)
+        for user_id, dates in other.user_dates.items():
+            if user_id in self.user_dates:
+                self.user_dates[user_id].merge(dates)
+            else:
+                self.user_dates[user_id] = dates
+        self.long_messages.extend(other.long_messages)
+        return self
+
+    def basic_stats(self):
+        stats = {
+            "total_messages": self.total_messages,
+            "unique_users": len(self.user_counter),
+            "time_period": {},
+            "media_count": self.media_count,
+            "avg_message_length": 0
+        }
+        if self.first_date is not None:
+            stats["time_period"] = {
+                "first_date": self.first_date,
+                "last_date": self.last_date,
+                "days_span": (datetime.fromisoformat(self.last_date) - datetime.fromisoformat(self.first_date)).days
+            }
+        if self.total_messages:
+            stats["avg_message_length"] = self.total_length / self.total_messages
+        return stats
+
+    def sentiment(self):
+        sentiment = {
+            "positive_words": self.positive_words,
+            "negative_words": self.negative_words,
+            "neutral_words": self.total_words - self.positive_words - self.negative_words,
+            "sentiment_score": 0,
+            "dominant_emotion": "neutral"
+        }
+        if self.total_words > 0:
+            positive_ratio = self.positive_words / self.total_words
+            negative_ratio = self.negative_words / self.total_words
+            sentiment["sentiment_score"] = positive_ratio - negative_ratio
+
+            if sentiment["sentiment_score"] > 0.1:
+                sentiment["dominant_emotion"] = "positive"
+            elif sentiment["sentiment_score"] < -0.1:
+                sentiment["dominant_emotion"] = "negative"
+        return sentiment
+
+    def content(self):
+        return {
+            "common_words": self.word_counter.most_common(20),
+            "message_frequency": {},
+            "urls_count": self.urls_count,
+            "hashtags_count": self.hashtags_count,
+            "mentions_count": self.mentions_count
+        }
+
+    def users(self):
+        return {
+            "top_posters": self.user_counter.most_common(10),
+            "user_activity": dict(self.hour_counter),
+            "avg_messages_per_user": self.total_messages / len(self.user_counter) if self.user_counter else 0
+        }
+
+    def anomalies(self):
+        anomalies = []
+        for user_id, dates in self.user_dates.items():
+            if dates.count > SPAM_MIN_MESSAGES and not dates.failed:
+                time_span = (dates.last - dates.first).total_seconds()
+                if time_span < 3600:
+                    anomalies.append({
+                        "type": "possible_spam",
+                        "user_id": user_id,
+                        "messages_count": dates.count,
+                        "time_span_seconds": time_span
+                    })
+        bursts = self.burst_anomalies + self.bursts.active() if self.bursts is not None else []
+        return anomalies + bursts + self.long_messages
+
+    def results(self):
+        """Разделы результата в формате analyze_telegram_archive"""
+        return {
+            "basic_stats": self.basic_stats(),
+            "sentiment_analysis": self.sentiment(),
+            "content_analysis": self.content(),
+            "user_analysis": self.users(),
+            "anomalies": self.anomalies()
+        }
+
+
+def _analyze_chunk(messages):
+    """Частичные агрегаты куска (выполняется в процессе пула)"""
+    return FusedAnalyzer(detect_bursts=False).feed_all(messages)
+
+
+def analyze_chunked(engine, messages, executor, chunk_size=CHUNK_SIZE, max_pending=None):
+    """
+    Map-reduce анализ потока сообщений в пуле процессов
+
+    Поток режется на куски по chunk_size, куски считаются в executor,
+    частичные результаты сливаются в engine строго в порядке кусков.
+    В работе не больше max_pending кусков, так что память ограничена
+    и при потоковом чтении файла.
+
+    Args:
+        engine: FusedAnalyzer, в который сливаются результаты
+        messages: Итератор сообщений
+        executor: ProcessPoolExecutor
+        chunk_size: Сообщений в куске
+        max_pending: Кусков в работе (по умолчанию - два на процесс)
+
+    Returns:
+        FusedAnalyzer: engine
+    """
+    max_pending = max_pending or 2 * getattr(executor, '_max_workers', 1)
+    pending = deque()
+    messages = iter(messages)
+    try:
+        while True:
+            chunk = list(islice(messages, chunk_size))
+            if not chunk:
+                break
+            # Окна всплесков ведет engine: время сообщений приходит из куска
+            # (timeline), и слияние по порядку кусков дает тот же порядок потока
+            pending.append(executor.submit(_analyze_chunk, chunk))
+            if len(pending) >= max_pending:
+                engine.merge(pending.popleft().result())
+    finally:
+        # При ошибке чтения уже прочитанные куски тоже учитываются,
+        # как при последовательном проходе
+        while pending:
+            engine.merge(pending.popleft().result())
+    return engine
+
+
+def iter_synthetic_messages(count, users=500, seed=42):
+    """Синтетические сообщения для замеров (тексты, ссылки, хэштеги, медиа, спам)"""
+    rng = random.Random(seed)
+    lexicon = get_lexicon()
+    words = [" ".join(entry) for entry in lexicon.positive + lexicon.negative] + [
+        'канал', 'новости', 'сегодня', 'telegram', 'update', 'фото', 'видео', 'завтра', 'и', 'в', 'на']
+    start = datetime(2024, 1, 1)
+    for i in range(count):
+        spam = i < 1000 and i % 10 == 0
+        sender = 0 if spam else rng.randrange(1, users)
+        text = " ".join(rng.choice(words) for _ in range(rng.randrange(3, 30)))
+        if i % 7 == 0:
+            text += f" https://t.me/c/{i} #тег{i % 13} @user{i % 17}"
+        if i % 5000 == 0:
+            text *= 40
+        yield {
+            'id': i,
+            'date': (start + timedelta(seconds=i if spam else i * 37)).isoformat(),
+            'sender_id': sender,
+            'text': text,
+            'media_type': 'photo' if i % 4 == 0 else None
+        }
+
+
+def synthetic_messages(count, users=500, seed=42):
+    return list(iter_synthetic_messages(count, users, seed))
+
+
+def benchmark(count=200000):
+    """
+    Замер: отдельные проходы AIAnalyzer против однопроходного движка
+
+    Returns:
+        dict: {'messages', 'legacy_per_sec', 'fused_per_sec', 'speedup', 'identical'}
+    """
+    from ai_analyzer import AIAnalyzer
+
+    messages = synthetic_messages(count)
+    legacy = AIAnalyzer.__new__(AIAnalyzer)
+
+    started = time.perf_counter()
+    users = {str(msg['sender_id']) for msg in messages if 'sender_id' in msg}
+    expected = {
+        "basic_stats": legacy._analyze_basic_stats(messages, users),
+        "sentiment_analysis": legacy._analyze_sentiment(messages),
+        "content_analysis": legacy._analyze_content(messages),
+        "user_analysis": legacy._analyze_users(messages),
+        "anomalies": legacy._detect_anomalies(messages)
+    }
+    legacy_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    fused = FusedAnalyzer().feed_all(messages).results()
+    fused_seconds = time.perf_counter() - started
+
+    return {
+        "messages": count,
+        "legacy_per_sec": round(count / legacy_seconds),
+        "fused_per_sec": round(count / fused_seconds),
+        "speedup": round(legacy_seconds / fused_seconds, 2),
+        "identical": fused == expected
+    }
+
+
+if __name__ == "__main__":
+    # Замер: python analysis_engine.py [число_сообщений]
+    result = benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
+    print(f"📊 Сообщений: {result['messages']}")
+    print(f"   Отдельные проходы: {result['legacy_per_sec']} сообщ/с")
+    print(f"   Один проход:       {result['fused_per_sec']} сообщ/с (x{result['speedup']})")
+    print(f"   Результаты совпадают: {'✅' if result['identical'] else '❌'}")
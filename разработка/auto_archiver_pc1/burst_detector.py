@@ -0,0 +1,128 @@
+"""
+Поиск всплесков активности пользователей скользящим окном
+Для каждого пользователя и окна хранится очередь времен его сообщений
+за последние window секунд: каждое время добавляется и удаляется один раз,
+поэтому весь поток обрабатывается за O(n). Всплеск - в окне набралось
+не меньше threshold сообщений; в аномалию попадает самое плотное окно.
+
+Работает и на целом архиве, и на потоке сообщений (живой режим):
+add() возвращает всплески, которые уже закончились.
+"""
+from bisect import bisect_left
+from collections import deque
+from datetime import datetime, timezone
+
+# (окно в секундах, сообщений в окне): 30 сообщений за 5 минут, 120 за час
+DEFAULT_WINDOWS = ((300, 30), (3600, 120))
+
+
+def message_timestamp(date):
+    """
+    Секунды эпохи из даты ISO (время без часового пояса считается UTC)
+
+    Returns:
+        float: Время или None, если дата не разбирается
+    """
+    try:
+        parsed = datetime.fromisoformat(date.replace('Z', '+00:00'))
+    except (TypeError, ValueError, AttributeError):
+        return None
+    return datetime_timestamp(parsed)
+
+
+def datetime_timestamp(parsed):
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _iso(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+class BurstDetector:
+    def __init__(self, windows=DEFAULT_WINDOWS):
+        """
+        Args:
+            windows: Пары (окно в секундах, порог сообщений в окне)
+        """
+        self.windows = tuple(windows)
+        # user_id -> [[очередь времен, всплеск или None] на каждое окно]
+        self._users = {}
+
+    def add(self, user_id, timestamp):
+        """
+        Учет сообщения
+
+        Сообщения пользователя могут идти по возрастанию или по убыванию
+        времени (архивы Telegram пишутся от новых к старым); редкие
+        сообщения не по порядку вставляются в очередь на свое место.
+
+        Returns:
+            list: Закончившиеся всплески (аномалии), обычно пустой
+        """
+        states = self._users.get(user_id)
+        if states is None:
+            states = self._users[user_id] = [[deque(), None] for _ in self.windows]
+
+        finished = None
+        for (window, threshold), state in zip(self.windows, states):
+            times = state[0]
+            if not times or timestamp >= times[-1]:
+                times.append(timestamp)
+                while timestamp - times[0] > window:
+                    times.popleft()
+            elif timestamp <= times[0]:
+                times.appendleft(timestamp)
+                while times[-1] - timestamp > window:
+                    times.pop()
+            else:
+                times.insert(bisect_left(times, timestamp), timestamp)
+
+            count = len(times)
+            burst = state[1]
+            if count >= threshold:
+                if burst is None or count > burst[0]:
+                    state[1] = (count, times[0], times[-1])
+            elif burst is not None:
+                state[1] = None
+                if finished is None:
+                    finished = []
+                finished.append(self._anomaly(user_id, window, burst))
+        return finished or []
+
+    def active(self):
+        """Всплески, которые еще продолжаются (для конца архива или сегмента)"""
+        return [self._anomaly(user_id, window, state[1])
+                for user_id, states in self._users.items()
+                for (window, _), state in zip(self.windows, states)
+                if state[1] is not None]
+
+    @staticmethod
+    def _anomaly(user_id, window, burst):
+        count, start, end = burst
+        return {
+            "type": "message_burst",
+            "user_id": user_id,
+            "window_seconds": window,
+            "messages_count": count,
+            "window_start": _iso(start),
+            "window_end": _iso(end)
+        }
+
+
+def detect_bursts(messages, windows=DEFAULT_WINDOWS):
+    """
+    Всплески в списке сообщений (sender_id, date)
+
+    Returns:
+        list: Аномалии message_burst в порядке завершения
+    """
+    detector = BurstDetector(windows)
+    anomalies = []
+    for msg in messages:
+        if 'sender_id' in msg and msg.get('date'):
+            timestamp = message_timestamp(msg['date'])
+            if timestamp is not None:
+                anomalies.extend(detector.add(msg['sender_id'], timestamp))
+    return anomalies + detector.active()
@@ -0,0 +1,191 @@
+"""
+Инкрементальный разбор больших JSON файлов метаданных
+Сообщения из массива "messages" верхнего объекта выдаются по одному по мере
+чтения файла (или члена zip), поэтому память не зависит от числа сообщений:
+в буфере держится только текущий кусок файла и одно сообщение.
+"""
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import zipfile
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+READ_SIZE = 1024 * 1024
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_decoder = json.JSONDecoder()
+
+
+class _Reader:
+    """Буфер поверх текстового потока с разбором значений через raw_decode"""
+
+    def __init__(self, stream, read_size):
+        self.stream = stream
+        self.read_size = read_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size):
+        # Разобранное начало буфера больше не нужно
+        if self.pos:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        chunk = self.stream.read(size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer += chunk
+        return True
+
+    def peek(self):
+        """Следующий значимый символ (None - конец файла)"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill(self.read_size):
+                return None
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"ожидался '{char}' в позиции {self.pos}")
+        self.pos += 1
+
+    def decode(self):
+        """Очередное значение JSON; недочитанное значение дочитывается (буфер растет вдвое)"""
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self._fill(max(self.read_size, len(self.buffer)))
+                continue
+            # Число на границе буфера могло быть обрезано ("12" из "123") - дочитываем и повторяем
+            if end == len(self.buffer) and not self.eof:
+                self._fill(self.read_size)
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_messages(stream, key='messages', read_size=READ_SIZE):
+    """
+    Сообщения из {"messages": [...], ...} по одному
+
+    Остальные поля верхнего объекта пропускаются. Если верхний уровень -
+    не объект или ключа нет, сообщений нет (как 'messages' in metadata).
+
+    Args:
+        stream: Текстовый поток (файл или io.TextIOWrapper над членом zip)
+        key: Имя массива сообщений
+        read_size: Размер чтения (символов)
+
+    Yields:
+        Элементы массива
+    """
+    reader = _Reader(stream, read_size)
+    if reader.peek() != '{':
+        return
+    reader.pos += 1
+
+    while True:
+        char = reader.peek()
+        if char == '}':
+            return
+        if char is None:
+            raise ValueError("неожиданный конец JSON")
+        if char == ',':
+            reader.pos += 1
+            continue
+
+        name = reader.decode()
+        reader.expect(':')
+
+        if reader.peek() != '[' or name != key:
+            reader.decode()
+            continue
+
+        reader.pos += 1
+        while True:
+            char = reader.peek()
+            if char == ']':
+                reader.pos += 1
+                break
+            if char is None:
+                raise ValueError("неожиданный конец массива сообщений")
+            if char == ',':
+                reader.pos += 1
+                continue
+            yield reader.decode()
+
+
+def _write_synthetic_archive(path, count):
+    """Zip с одним metadata.json на count сообщений (пишется потоком)"""
+    from analysis_engine import iter_synthetic_messages
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as zipf:
+        with zipf.open("channel/metadata.json", 'w', force_zip64=True) as raw:
+            raw.write(b'{"channel": "synthetic", "messages": [')
+            for i, msg in enumerate(iter_synthetic_messages(count)):
+                raw.write((',' if i else '').encode('utf-8') + json.dumps(msg, ensure_ascii=False).encode('utf-8'))
+            raw.write(f'], "total_messages": {count}}}'.encode('utf-8'))
+
+
+def _measure(count, workdir):
+    """Анализ синтетического архива в отдельном процессе: пик RSS и скорость"""
+    import io
+    import resource
+    from analysis_engine import FusedAnalyzer
+
+    path = os.path.join(workdir, f"synthetic_{count}.zip")
+    _write_synthetic_archive(path, count)
+
+    started = time.perf_counter()
+    engine = FusedAnalyzer()
+    with zipfile.ZipFile(path) as zipf, zipf.open("channel/metadata.json") as raw:
+        engine.feed_all(iter_json_messages(io.TextIOWrapper(raw, encoding='utf-8')))
+    seconds = time.perf_counter() - started
+    os.remove(path)
+
+    return {
+        "messages": engine.total_messages,
+        "seconds": round(seconds, 1),
+        "messages_per_sec": round(engine.total_messages / seconds),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+
+
+def memory_check(counts=(500000, 5000000), workdir=None):
+    """
+    Проверка: пик памяти анализа не зависит от числа сообщений
+    Каждый размер - в новом процессе, чтобы пик RSS мерился отдельно.
+
+    Returns:
+        list: [{messages, seconds, messages_per_sec, peak_rss_mb}, ...]
+    """
+    temp_dir = tempfile.mkdtemp(prefix="json_stream_", dir=workdir)
+    results = []
+    try:
+        for count in counts:
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                result = executor.submit(_measure, count, temp_dir).result()
+            if result["messages"] != count:
+                raise ValueError(f"разобрано {result['messages']} сообщений из {count}")
+            results.append(result)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return results
+
+
+if __name__ == "__main__":
+    # Проверка памяти: python json_stream.py [число_сообщений ...]
+    counts = [int(arg) for arg in sys.argv[1:]] or [500000, 5000000]
+    for result in memory_check(counts):
+        print(f"📊 {result['messages']:>9} сообщений | {result['seconds']:7.1f} сек | "
+              f"{result['messages_per_sec']} сообщ/с | пик RSS {result['peak_rss_mb']} MB")
@@ -0,0 +1,232 @@
+"""
+Словари тональности и стоп-слов
+Списки слов читаются из lexicons/*.txt один раз на процесс и компилируются
+в префиксное дерево по словам: записи могут быть фразами ("не люблю"),
+в тексте выбирается самое длинное совпадение. Отрицание ("не", "нет", ...)
+меняет тональность следующего совпадения в пределах окна слов.
+
+Разбор на слова - по буквам Unicode: учитываются "ё", латиница и любые
+другие алфавиты, цифры и подчеркивание разделяют слова.
+"""
+import os
+import re
+import sys
+import time
+import random
+import hashlib
+
+LEXICON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lexicons")
+NEGATION_WINDOW = 3        # Отрицание действует на совпадение не дальше 3 слов
+
+TOKEN_RE = re.compile(r'[^\W\d_]+')
+
+POSITIVE = 1
+NEGATIVE = -1
+
+
+def tokenize(text):
+    """Слова текста в нижнем регистре"""
+    return TOKEN_RE.findall(text.lower())
+
+
+def tokenize_lowered(text):
+    """Слова текста, уже приведенного к нижнему регистру (без повторного lower())"""
+    return TOKEN_RE.findall(text)
+
+
+def read_word_list(path):
+    """Записи файла словаря: по одной на строку, '#' - комментарий"""
+    entries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                tokens = tuple(tokenize(line))
+                if tokens:
+                    entries.append(tokens)
+    return entries
+
+
+class Lexicon:
+    def __init__(self, positive=(), negative=(), stop_words=(), negations=(),
+                 negation_window=NEGATION_WINDOW):
+        """
+        Компиляция словарей
+
+        Args:
+            positive: Позитивные записи (кортежи слов)
+            negative: Негативные записи (кортежи слов)
+            stop_words: Стоп-слова (берется первое слово записи)
+            negations: Слова-отрицания
+            negation_window: Окно действия отрицания (слов)
+        """
+        self.positive = sorted(set(positive))
+        self.negative = sorted(set(negative))
+        self.stop_words = frozenset(entry[0] for entry in stop_words)
+        self.negations = frozenset(entry[0] for entry in negations)
+        self.negation_window = negation_window
+
+        # Узел дерева: [тональность записи, кончающейся здесь (0 - нет), дети {слово: узел}]
+        self._trie = {}
+        for polarity, entries in ((POSITIVE, self.positive), (NEGATIVE, self.negative)):
+            for entry in entries:
+                level = self._trie
+                for i, token in enumerate(entry):
+                    node = level.get(token)
+                    if node is None:
+                        node = level[token] = [0, {}]
+                    if i == len(entry) - 1:
+                        node[0] = polarity
+                    level = node[1]
+        # Первые слова записей: текст без них разбирать не нужно
+        self._starts = frozenset(self._trie)
+        self._marked = self._starts | self.negations
+
+        sha = hashlib.sha256()
+        for entries in (self.positive, self.negative, sorted(self.stop_words), sorted(self.negations)):
+            sha.update("\n".join(" ".join(entry) if isinstance(entry, tuple) else entry
+                                 for entry in entries).encode('utf-8'))
+            sha.update(b"\0")
+        sha.update(str(negation_window).encode('utf-8'))
+        self.fingerprint = sha.hexdigest()[:16]
+
+    @classmethod
+    def load(cls, directory=LEXICON_DIR):
+        """Словари из папки: positive.txt, negative.txt, stop_words.txt, negations.txt"""
+        def entries(name):
+            path = os.path.join(directory, name)
+            return read_word_list(path) if os.path.exists(path) else []
+
+        return cls(entries("positive.txt"), entries("negative.txt"),
+                   entries("stop_words.txt"), entries("negations.txt"))
+
+    def sentiment(self, tokens):
+        """
+        Совпадения со словарями в списке слов
+
+        Returns:
+            tuple: (позитивных, негативных) совпадений
+        """
+        if self._starts.isdisjoint(tokens):
+            return 0, 0
+
+        trie = self._trie
+        negations = self.negations
+        window = self.negation_window
+        positive = negative = 0
+        last_negation = -window - 1
+        count = len(tokens)
+        consumed = 0
+
+        # Разбираются только позиции слов из дерева и отрицаний
+        marked = self._marked
+        for i in [i for i, token in enumerate(tokens) if token in marked]:
+            if i < consumed:
+                # Слово внутри уже найденной фразы
+                continue
+            token = tokens[i]
+            node = trie.get(token)
+            polarity = 0
+            if node is not None:
+                # Самое длинное совпадение, начинающееся с этого слова
+                polarity, end = node[0], i + 1
+                children = node[1]
+                j = i + 1
+                while children and j < count:
+                    node = children.get(tokens[j])
+                    if node is None:
+                        break
+                    j += 1
+                    if node[0]:
+                        polarity, end = node[0], j
+                    children = node[1]
+
+            if not polarity:
+                if token in negations:
+                    last_negation = i
+                continue
+
+            if i - last_negation <= window:
+                # Отрицание относится только к ближайшему совпадению
+                polarity = -polarity
+                last_negation = -window - 1
+            if polarity > 0:
+                positive += 1
+            else:
+                negative += 1
+            consumed = end
+
+        return positive, negative
+
+    def content_words(self, tokens):
+        """Слова для частотного словаря: от 3 букв, без стоп-слов"""
+        stop_words = self.stop_words
+        return [word for word in tokens if len(word) >= 3 and word not in stop_words]
+
+
+_loaded = {}
+
+
+def get_lexicon(directory=LEXICON_DIR):
+    """Словари папки (загружаются один раз на процесс)"""
+    lexicon = _loaded.get(directory)
+    if lexicon is None:
+        lexicon = _loaded[directory] = Lexicon.load(directory)
+    return lexicon
+
+
+def benchmark(count=200000, rate=0.005, seed=7):
+    """
+    Замер поиска по словарям: проверка каждого слова по множествам (как было)
+    против скомпилированного дерева. Разбор на слова в замер не входит -
+    он общий с частотным словарем.
+
+    Args:
+        count: Сообщений
+        rate: Доля словарных слов в тексте
+
+    Returns:
+        dict: {'messages', 'set_lookup_per_sec', 'lexicon_per_sec', 'speedup'}
+    """
+    lexicon = get_lexicon()
+    positive = {entry[0] for entry in lexicon.positive if len(entry) == 1}
+    negative = {entry[0] for entry in lexicon.negative if len(entry) == 1}
+
+    # Обычный текст: словарных слов немного
+    rng = random.Random(seed)
+    common = ['канал', 'новости', 'сегодня', 'завтра', 'telegram', 'update', 'фото', 'видео',
+              'город', 'время', 'люди', 'работа', 'вопрос', 'ответ', 'день', 'ещё', 'и', 'в', 'на']
+    special = [" ".join(entry) for entry in lexicon.positive + lexicon.negative]
+    messages = [tokenize(" ".join(rng.choice(special) if rng.random() < rate else rng.choice(common)
+                                  for _ in range(rng.randrange(3, 30)))) for _ in range(count)]
+
+    started = time.perf_counter()
+    for tokens in messages:
+        positive_count = negative_count = 0
+        for word in tokens:
+            if word in positive:
+                positive_count += 1
+            elif word in negative:
+                negative_count += 1
+    old_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for tokens in messages:
+        lexicon.sentiment(tokens)
+    new_seconds = time.perf_counter() - started
+
+    return {
+        "messages": count,
+        "set_lookup_per_sec": round(count / old_seconds),
+        "lexicon_per_sec": round(count / new_seconds),
+        "speedup": round(old_seconds / new_seconds, 2)
+    }
+
+
+if __name__ == "__main__":
+    # Замер: python lexicon.py [число_сообщений [доля_словарных_слов]]
+    result = benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 200000,
+                       float(sys.argv[2]) if len(sys.argv) > 2 else 0.005)
+    print(f"📊 Сообщений: {result['messages']}")
+    print(f"   Проверка слов по множествам: {result['set_lookup_per_sec']} сообщ/с")
+    print(f"   Скомпилированные словари:    {result['lexicon_per_sec']} сообщ/с (x{result['speedup']})")
@@ -0,0 +1,86 @@
+"""
+Колоночная лента сообщений: (отправитель, время) по массиву на поле
+Куски analyze_chunked возвращают ее основному процессу вместо списка
+кортежей: время - микросекунды эпохи UTC в array('q'), отправитель - код
+из таблицы в array('i'). Лента пересылается между процессами пула
+как два буфера и таблица отправителей куска.
+
+Если установлен NumPy, время переводится в секунды векторно поверх того же
+буфера (без копирования), иначе - по одному значению.
+"""
+from array import array
+from datetime import datetime, timedelta, timezone
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def epoch_micros(parsed):
+    """Микросекунды эпохи (время без часового пояса считается UTC, как в burst_detector)"""
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return (parsed - _EPOCH) // _MICROSECOND
+
+
+class _Interner:
+    """Значение -> код (коды по порядку первого появления)"""
+    __slots__ = ('codes', 'values')
+
+    def __init__(self, values=()):
+        self.codes = {}
+        self.values = []
+        for value in values:
+            self.code(value)
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def __reduce__(self):
+        # Словарь кодов восстанавливается из значений
+        return _Interner, (self.values,)
+
+
+class MessageFrame:
+    def __init__(self):
+        """Пустая лента; сообщения добавляются через append()"""
+        self.times = array('q')       # микросекунды эпохи UTC
+        self.senders = array('i')     # код sender_id в sender_table
+        self.sender_table = _Interner()
+
+    def __len__(self):
+        return len(self.times)
+
+    @property
+    def nbytes(self):
+        """Размер колонок (без таблицы отправителей)"""
+        return self.times.itemsize * len(self.times) + self.senders.itemsize * len(self.senders)
+
+    def append(self, sender_id, parsed):
+        self.times.append(epoch_micros(parsed))
+        self.senders.append(self.sender_table.code(sender_id))
+
+    def extend(self, other):
+        """Дописать ленту другого куска (коды отправителей переводятся в свою таблицу)"""
+        mapping = array('i', (self.sender_table.code(value) for value in other.sender_table.values))
+        self.times.extend(other.times)
+        self.senders.extend(mapping[code] for code in other.senders)
+
+    def seconds(self):
+        """Время сообщений в секундах эпохи (float), по порядку ленты"""
+        if np is not None and len(self.times):
+            return (np.frombuffer(self.times, dtype=np.int64) / 1e6).tolist()
+        return [micros / 1e6 for micros in self.times]
+
+    def events(self):
+        """(sender_id, секунды эпохи) по порядку ленты"""
+        values = self.sender_table.values
+        return zip((values[code] for code in self.senders), self.seconds())
@@ -9,8 +9,16 @@ import hashlib
 import hashlib
 from datetime import datetime
 import threading
+import zipfile
+import io
+import struct
 from cryptography.fernet import Fernet, InvalidToken
 
+# Заголовок открытого текста куска CHUNKED_V2: nonce буфера, номер куска, число кусков
+CHUNK_PREFIX = struct.Struct('>16sII')
+# Заголовок открытого текста кадра STREAM: nonce потока, номер кадра, 1 - кадр итогов
+FRAME_PREFIX = struct.Struct('>16sIB')
+
 class SecureMasterServer:
     def __init__(self, host='0.0.0.0', port=9090):
         self.host = host
@@ -24,12 +32,16 @@ class SecureMasterServer:
         self.decrypted_storage = f"{self.base_storage}/decrypted"
         self.logs_path = f"{self.base_storage}/logs"
         self.keys_path = f"{self.base_storage}/keys"
+        self.channels_path = f"{self.base_storage}/channels"
+        self._volume_lock = threading.Lock()  # Индексы каналов обновляются из разных потоков
+        self._analysis_lock = threading.Lock()  # Каналы анализируются по одному
         
         # Создаем структуру папок
         self._create_folders()
         
         # Загружаем ключи шифрования
         self.encryption_keys = self._load_encryption_keys()
+        self._ciphers = {}  # Кэш объектов Fernet по ключу
         
         print("=" * 60)
         print("🚀 АВТОНОМНАЯ СИСТЕМА УПРАВЛЕНИЯ - ЗАЩИЩЕННЫЙ СЕРВЕР")
@@ -47,6 +59,7 @@ class SecureMasterServer:
             self.decrypted_storage,
             self.logs_path,
             self.keys_path,
+            self.channels_path,
             f"{self.logs_path}/decrypted",
             f"{self.logs_path}/encrypted"
         ]
@@ -87,6 +100,49 @@ class SecureMasterServer:
             print(f"❌ Ошибка сохранения ключа: {e}")
             return False
     
+    def _get_cipher(self, key_data):
+        """Кэшированный объект Fernet для ключа"""
+        cipher = self._ciphers.get(key_data)
+        if cipher is None:
+            cipher = self._ciphers[key_data] = Fernet(key_data)
+        return cipher
+    
+    def _decrypt_payload(self, cipher, encrypted_data):
+        """
+        Расшифровка данных агента
+        
+        Форматы:
+            ENCRYPTED::<токен>                  - один Fernet токен
+            CHUNKED_V2::<токен>\n<токен>\n...   - куски, зашифрованные параллельно;
+                                                  в каждом - nonce, номер и число кусков
+        
+        Старый CHUNKED:: (куски без заголовка) не принимается: в нем куски
+        можно переставить, выбросить или подменить незаметно.
+        """
+        if encrypted_data.startswith(b"CHUNKED_V2::"):
+            tokens = encrypted_data[len(b"CHUNKED_V2::"):].split(b"\n")
+            nonce = None
+            parts = []
+            for index, token in enumerate(tokens):
+                plain = cipher.decrypt(token)
+                if len(plain) < CHUNK_PREFIX.size:
+                    raise ValueError("кусок короче заголовка")
+                chunk_nonce, chunk_index, total = CHUNK_PREFIX.unpack_from(plain)
+                if nonce is None:
+                    nonce = chunk_nonce
+                if chunk_nonce != nonce or chunk_index != index or total != len(tokens):
+                    raise ValueError(f"кусок {index}: нарушен порядок или состав кусков")
+                parts.append(plain[CHUNK_PREFIX.size:])
+            return b"".join(parts)
+        
+        if encrypted_data.startswith(b"CHUNKED::"):
+            raise ValueError("формат CHUNKED:: без проверки порядка кусков не поддерживается")
+        
+        if encrypted_data.startswith(b"ENCRYPTED::"):
+            return cipher.decrypt(encrypted_data[len(b"ENCRYPTED::"):])
+        
+        return cipher.decrypt(encrypted_data)
+    
     def log_event(self, message, level="INFO", agent_id=None):
         """Логирование событий"""
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -151,15 +207,12 @@ class SecureMasterServer:
             decryption_success = False
             
             if is_encrypted:
-                # Пробуем расшифровать
-                for key_agent_id, key_data in self.encryption_keys.items():
+                # Пробуем расшифровать (ключ самого агента - первым)
+                keys_order = sorted(self.encryption_keys.items(), key=lambda item: item[0] != agent_id)
+                for key_agent_id, key_data in keys_order:
                     try:
-                        cipher = Fernet(key_data)
-                        
-                        if encrypted_data.startswith(b"ENCRYPTED::"):
-                            decrypted = cipher.decrypt(encrypted_data[10:])
-                        else:
-                            decrypted = cipher.decrypt(encrypted_data)
+                        cipher = self._get_cipher(key_data)
+                        decrypted = self._decrypt_payload(cipher, encrypted_data)
                         
                         # Проверяем хэш
                         computed_hash = hashlib.sha256(decrypted).hexdigest()
@@ -183,8 +236,14 @@ class SecureMasterServer:
                 decryption_success = True
                 self.log_event("📝 Файл не зашифрован", agent_id=agent_id)
             
+            bundle_files = None
+            volume_info = None
+            if decryption_success and decrypted_data and metadata.get('bundle'):
+                # Пакет мелких файлов - распаковываем в отдельные записи хранилища
+                bundle_files = self._unpack_bundle(decrypted_data, agent_id)
+            
             # Сохраняем расшифрованную версию
-            if decryption_success and decrypted_data:
+            elif decryption_success and decrypted_data:
                 decrypted_filename = f"{agent_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{filename}"
                 decrypted_path = f"{self.decrypted_storage}/{decrypted_filename}"
                 
@@ -203,6 +262,9 @@ class SecureMasterServer:
                     self.log_event("✅ Целостность данных проверена", agent_id=agent_id)
                 else:
                     self.log_event("⚠️  Размеры не совпадают!", "WARNING", agent_id)
+                
+                if decrypted_filename.endswith('.zip'):
+                    volume_info = self._register_volume(decrypted_path, agent_id)
             
             # Отправляем ответ
             response = {
@@ -212,8 +274,13 @@ class SecureMasterServer:
                 "decrypted": decryption_success,
                 "verified": decryption_success and decrypted_data is not None
             }
+            if volume_info:
+                response["volume"] = volume_info
+            if bundle_files is not None:
+                response["files"] = bundle_files
+                response["verified"] = response["verified"] and all(f['verified'] for f in bundle_files)
             
-            client_socket.send(json.dumps(response).encode('utf-8'))
+            client_socket.sendall(json.dumps(response).encode('utf-8'))
             
         except Exception as e:
             error_msg = f"❌ Ошибка обработки защищенного файла: {e}"
@@ -224,17 +291,301 @@ class SecureMasterServer:
             except:
                 pass
     
+    def _recv_exact(self, client_socket, size):
+        """Чтение ровно size байт (обрыв соединения - ошибка)"""
+        data = bytearray()
+        while len(data) < size:
+            chunk = client_socket.recv(min(65536, size - len(data)))
+            if not chunk:
+                raise ConnectionError(f"соединение оборвано: получено {len(data)} из {size} байт")
+            data += chunk
+        return bytes(data)
+    
+    def _recv_field(self, client_socket):
+        """Поле размера (20 байт ASCII)"""
+        return int(self._recv_exact(client_socket, 20).decode('utf-8').strip())
+    
+    def _stream_cipher(self, token, agent_id):
+        """Ключ, которым расшифровывается первый кадр потока (ключ самого агента - первым)"""
+        keys_order = sorted(self.encryption_keys.items(), key=lambda item: item[0] != agent_id)
+        for key_agent_id, key_data in keys_order:
+            cipher = self._get_cipher(key_data)
+            try:
+                cipher.decrypt(token)
+            except InvalidToken:
+                continue
+            self.log_event(f"✅ Поток расшифровывается ключом от {key_agent_id}", agent_id=agent_id)
+            return cipher
+        return None
+    
+    def handle_stream(self, client_socket, client_ip):
+        """
+        Прием файла потоком (протокол STREAM)
+        
+        Кадры расшифровываются и пишутся на диск по мере получения, так что
+        файл любого размера не держится в памяти. В каждом зашифрованном
+        кадре проверяются nonce потока и номер; итоги принимаются только
+        зашифрованным кадром с номером после последнего кадра данных.
+        Зашифрованная копия сохраняется как STREAM_V2:: (кадры и кадр итогов).
+        """
+        encrypted_path = None
+        decrypted_partial = None
+        try:
+            metadata = json.loads(self._recv_exact(client_socket, self._recv_field(client_socket)).decode('utf-8'))
+            
+            agent_id = metadata.get('agent_id', client_ip)
+            filename = os.path.basename(metadata.get('filename', 'unknown'))
+            is_encrypted = metadata.get('encrypted', False)
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            
+            self.log_event(f"📡 Поток файла: {filename}", agent_id=agent_id)
+            self.log_event(f"🔐 Зашифрован: {'✅ ДА' if is_encrypted else '❌ НЕТ'}", agent_id=agent_id)
+            
+            encrypted_filename = f"{agent_id}_{timestamp}_{filename}.enc"
+            encrypted_path = f"{self.telegram_storage}/{encrypted_filename}"
+            decrypted_filename = f"{agent_id}_{timestamp}_{filename}"
+            decrypted_path = f"{self.decrypted_storage}/{decrypted_filename}"
+            decrypted_partial = decrypted_path + ".part"
+            
+            cipher = None
+            decryption_success = not is_encrypted
+            sha = hashlib.sha256()
+            received = 0
+            frames = 0
+            nonce = None
+            
+            def open_frame(token, final):
+                """Расшифровка кадра с проверкой nonce, номера и признака итогов"""
+                nonlocal nonce
+                plain = cipher.decrypt(token)
+                if len(plain) < FRAME_PREFIX.size:
+                    raise ValueError("кадр короче заголовка")
+                frame_nonce, sequence, is_final = FRAME_PREFIX.unpack_from(plain)
+                if nonce is None:
+                    nonce = frame_nonce
+                if frame_nonce != nonce or sequence != frames - (0 if final else 1) or bool(is_final) != final:
+                    raise ValueError(f"кадр {frames}: нарушен порядок или состав потока")
+                return plain[FRAME_PREFIX.size:]
+            
+            with open(encrypted_path, 'wb') as enc_file, open(decrypted_partial, 'wb') as dec_file:
+                if is_encrypted:
+                    enc_file.write(b"STREAM_V2::")
+                
+                while True:
+                    frame_size = self._recv_field(client_socket)
+                    if not frame_size:
+                        break
+                    token = self._recv_exact(client_socket, frame_size)
+                    
+                    if is_encrypted and frames:
+                        enc_file.write(b"\n")
+                    enc_file.write(token)
+                    frames += 1
+                    
+                    if is_encrypted:
+                        if frames == 1:
+                            cipher = self._stream_cipher(token, agent_id)
+                            decryption_success = cipher is not None
+                            if not decryption_success:
+                                self.log_event("❌ Не удалось расшифровать поток", "ERROR", agent_id)
+                        if not decryption_success:
+                            continue
+                        data = open_frame(token, final=False)
+                    else:
+                        data = token
+                    
+                    sha.update(data)
+                    received += len(data)
+                    dec_file.write(data)
+            
+                trailer_token = self._recv_exact(client_socket, self._recv_field(client_socket))
+                if is_encrypted:
+                    enc_file.write(b"\n" + trailer_token)
+            
+            if is_encrypted and not frames:
+                # Пустой поток: ключ определяется по кадру итогов
+                cipher = self._stream_cipher(trailer_token, agent_id)
+                decryption_success = cipher is not None
+            
+            if not is_encrypted:
+                trailer = json.loads(trailer_token.decode('utf-8'))
+            elif decryption_success:
+                trailer = json.loads(open_frame(trailer_token, final=True).decode('utf-8'))
+            else:
+                trailer = {}
+            
+            self.log_event(f"💾 Сохранен зашифрованный файл: {encrypted_filename} ({frames} кадров)", agent_id=agent_id)
+            
+            verified = (decryption_success and sha.hexdigest() == trailer.get('hash')
+                        and received == trailer.get('original_size') and frames == trailer.get('frames'))
+            volume_info = None
+            if verified:
+                os.replace(decrypted_partial, decrypted_path)
+                self.log_event(f"💾 Сохранен расшифрованный файл: {decrypted_filename}", agent_id=agent_id)
+                self.log_event(f"✅ Целостность данных проверена ({received} байт)", agent_id=agent_id)
+                if decrypted_filename.endswith('.zip'):
+                    volume_info = self._register_volume(decrypted_path, agent_id)
+            else:
+                os.remove(decrypted_partial)
+                if decryption_success:
+                    self.log_event("⚠️  Хэш или размер потока не совпадает!", "WARNING", agent_id)
+            
+            response = {
+                "status": "success",
+                "message": f"Файл получен: {encrypted_filename}",
+                "encrypted_file": encrypted_filename,
+                "decrypted": decryption_success,
+                "verified": verified
+            }
+            if volume_info:
+                response["volume"] = volume_info
+            
+            client_socket.sendall(json.dumps(response).encode('utf-8'))
+            
+        except Exception as e:
+            self.log_event(f"❌ Ошибка приема потока: {e}", "ERROR", client_ip)
+            
+            # Недописанный поток не оставляем в хранилище
+            for path in (encrypted_path, decrypted_partial):
+                if path and os.path.exists(path):
+                    os.remove(path)
+            
+            try:
+                client_socket.send(json.dumps({"status": "error", "message": str(e)}).encode('utf-8'))
+            except:
+                pass
+    
+    def _unpack_bundle(self, bundle_data, agent_id):
+        """
+        Распаковка пакета мелких файлов с проверкой SHA256 каждого файла
+        
+        Returns:
+            list: [{'name', 'verified', 'stored_as'}, ...]
+        """
+        results = []
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        
+        with zipfile.ZipFile(io.BytesIO(bundle_data)) as zipf:
+            manifest = json.loads(zipf.read("__bundle_manifest__.json").decode('utf-8'))
+            
+            for entry in manifest.get('files', []):
+                name = os.path.basename(entry['name'])
+                result = {'name': entry['name'], 'verified': False, 'stored_as': None}
+                
+                try:
+                    data = zipf.read(entry['name'])
+                    if hashlib.sha256(data).hexdigest() != entry.get('sha256') or len(data) != entry.get('size'):
+                        self.log_event(f"⚠️  Хэш не совпадает для файла пакета: {name}", "WARNING", agent_id)
+                    else:
+                        stored_name = f"{agent_id}_{timestamp}_{name}"
+                        with open(f"{self.decrypted_storage}/{stored_name}", 'wb') as f:
+                            f.write(data)
+                        result.update(verified=True, stored_as=stored_name)
+                        if stored_name.endswith('.zip'):
+                            self._register_volume(f"{self.decrypted_storage}/{stored_name}", agent_id)
+                except KeyError:
+                    self.log_event(f"⚠️  Файл из манифеста отсутствует в пакете: {name}", "WARNING", agent_id)
+                
+                results.append(result)
+        
+        verified = sum(1 for r in results if r['verified'])
+        self.log_event(f"📦 Пакет распакован: {verified}/{len(results)} файлов проверено", agent_id=agent_id)
+        return results
+    
+    def _register_volume(self, archive_path, agent_id):
+        """
+        Учет тома многотомного архива в индексе канала
+        
+        Тома приходят независимо (в любом порядке и параллельно), индекс канала
+        показывает, какие уже получены и все ли на месте. Последний том
+        содержит channel_index.json с общим числом томов.
+        
+        Когда получен последний недостающий том, канал анализируется
+        в фоне (_analyze_channel).
+        
+        Returns:
+            dict: {'volume', 'total_volumes', 'complete'} или None для обычного архива
+        """
+        try:
+            with zipfile.ZipFile(archive_path) as zipf:
+                names = zipf.namelist()
+                manifest_name = next((n for n in names if os.path.basename(n) == "volume_manifest.json"), None)
+                if not manifest_name:
+                    return None
+                manifest = json.loads(zipf.read(manifest_name).decode('utf-8'))
+        except (zipfile.BadZipFile, ValueError) as e:
+            self.log_event(f"⚠️  Не удалось прочитать манифест тома: {e}", "WARNING", agent_id)
+            return None
+        
+        channel_key = manifest.get('channel_id') or "".join(
+            c for c in manifest.get('channel_name', 'unknown') if c.isalnum() or c == '_')
+        index_path = f"{self.channels_path}/{channel_key}_{manifest.get('run_id')}.json"
+        
+        with self._volume_lock:
+            index = {
+                'channel_name': manifest.get('channel_name'),
+                'channel_id': manifest.get('channel_id'),
+                'run_id': manifest.get('run_id'),
+                'total_volumes': None,
+                'volumes': {}
+            }
+            if os.path.exists(index_path):
+                with open(index_path, 'r', encoding='utf-8') as f:
+                    index = json.load(f)
+            was_complete = index.get('complete', False)
+            
+            index['volumes'][str(manifest['volume'])] = {
+                'stored_as': os.path.basename(archive_path),
+                'min_id': manifest.get('min_id'),
+                'max_id': manifest.get('max_id'),
+                'messages': manifest.get('total_messages'),
+                'received': datetime.now().isoformat()
+            }
+            if manifest.get('final'):
+                index['total_volumes'] = manifest['total_volumes']
+            index['complete'] = bool(index['total_volumes']) and len(index['volumes']) >= index['total_volumes']
+            
+            tmp_path = index_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(index, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, index_path)
+        
+        total = index['total_volumes'] or '?'
+        self.log_event(f"📚 Том {manifest['volume']}/{total} канала {index['channel_name']}"
+                       f"{' - все тома получены' if index['complete'] else ''}", agent_id=agent_id)
+        if index['complete'] and not was_complete:
+            threading.Thread(target=self._analyze_channel, args=(index_path, agent_id),
+                             name=f"analyze:{os.path.basename(index_path)}", daemon=True).start()
+        return {'volume': manifest['volume'], 'total_volumes': index['total_volumes'], 'complete': index['complete']}
+    
+    def _analyze_channel(self, index_path, agent_id):
+        """Сводный анализ канала, все тома которого получены (фоновый поток)"""
+        # Анализатор нужен только для многотомных каналов
+        from ai_analyzer import AIAnalyzer
+        
+        with self._analysis_lock:
+            try:
+                summary = AIAnalyzer(self.base_storage).analyze_channel(index_path)
+                self.log_event(f"🤖 Канал {summary['channel_name']} проанализирован: "
+                               f"{summary['total_messages']} сообщений", agent_id=agent_id)
+            except Exception as e:
+                self.log_event(f"❌ Ошибка анализа канала {os.path.basename(index_path)}: {e}",
+                               "ERROR", agent_id)
+    
     def handle_client(self, client_socket, address):
         """Обработка подключения от агента"""
         client_ip = address[0]
         
         try:
-            # Получаем заголовок (первые 10 байт)
-            header = client_socket.recv(10).decode('utf-8').strip()
+            # Получаем заголовок (ровно 10 байт)
+            header = self._recv_exact(client_socket, 10).decode('utf-8').strip()
             
-            if header == "SECURE_FILE":
+            if header == "SECUREFILE":
                 self.log_event(f"🔐 Принимаю защищенный файл от {client_ip}")
                 self.handle_secure_file(client_socket, client_ip)
+            elif header == "STREAM":
+                self.log_event(f"📡 Принимаю поток от {client_ip}")
+                self.handle_stream(client_socket, client_ip)
             elif header == "TELEGRAM":
                 self._handle_legacy_telegram(client_socket, client_ip)
             elif header == "METRICS":
@@ -0,0 +1,323 @@
+"""
+Сливаемые вероятностные сводки для общей статистики по архивам
+Каждый анализ сохраняет компактные сводки, а общий отчет сливает их
+без повторного чтения архивов:
+
+    HyperLogLog   - число разных отправителей (без двойного счета между каналами)
+    CountMinSketch + SpaceSaving - частые слова
+    TDigest       - квантили длины сообщений
+
+Хэши - blake2b: встроенный hash() строк в Python различается между
+процессами, а сводки сливаются из разных процессов и запусков.
+"""
+import math
+import zlib
+import base64
+import hashlib
+from array import array
+
+HLL_PRECISION = 14          # 16384 регистра, погрешность ~0.8%
+CMS_WIDTH = 2048
+CMS_DEPTH = 4
+TOP_CAPACITY = 100          # Кандидатов в частые слова на архив
+TDIGEST_COMPRESSION = 100
+
+
+def _hash64(value):
+    return int.from_bytes(hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def _pack(data):
+    return base64.b64encode(zlib.compress(bytes(data))).decode('ascii')
+
+
+def _unpack(text):
+    return zlib.decompress(base64.b64decode(text))
+
+
+class HyperLogLog:
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.size)
+
+    def add(self, value):
+        h = _hash64(value)
+        index = h >> (64 - self.precision)
+        rest = h & ((1 << (64 - self.precision)) - 1)
+        # Позиция первой единицы в оставшихся битах
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+        return self
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("HyperLogLog с разной точностью не сливаются")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        """Оценка числа разных значений"""
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        # Малые множества: линейный подсчет по пустым регистрам точнее
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+    def to_dict(self):
+        return {"precision": self.precision, "registers": _pack(self.registers)}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["precision"], _unpack(data["registers"]))
+
+
+class CountMinSketch:
+    def __init__(self, width=CMS_WIDTH, depth=CMS_DEPTH, counts=None):
+        self.width = width
+        self.depth = depth
+        self.counts = counts if counts is not None else array('Q', bytes(8 * width * depth))
+
+    def _cells(self, item):
+        h = _hash64(item)
+        h1, h2 = h & 0xFFFFFFFF, h >> 32
+        return [row * self.width + (h1 + row * h2) % self.width for row in range(self.depth)]
+
+    def add(self, item, count=1):
+        for cell in self._cells(item):
+            self.counts[cell] += count
+
+    def query(self, item):
+        """Оценка частоты (не меньше истинной)"""
+        return min(self.counts[cell] for cell in self._cells(item))
+
+    def merge(self, other):
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Count-Min с разными размерами не сливаются")
+        self.counts = array('Q', map(int.__add__, self.counts, other.counts))
+        return self
+
+    def to_dict(self):
+        return {"width": self.width, "depth": self.depth, "counts": _pack(self.counts.tobytes())}
+
+    @classmethod
+    def from_dict(cls, data):
+        counts = array('Q')
+        counts.frombytes(_unpack(data["counts"]))
+        return cls(data["width"], data["depth"], counts)
+
+
+class SpaceSaving:
+    def __init__(self, capacity=TOP_CAPACITY, counters=None):
+        """Частые элементы потока: capacity счетчиков {элемент: [частота, погрешность]}"""
+        self.capacity = capacity
+        self.counters = counters or {}
+
+    def add(self, item, count=1):
+        counter = self.counters.get(item)
+        if counter is not None:
+            counter[0] += count
+        elif len(self.counters) < self.capacity:
+            self.counters[item] = [count, 0]
+        else:
+            # Вытесняем самый редкий элемент: новый наследует его частоту как погрешность
+            victim = min(self.counters, key=lambda key: self.counters[key][0])
+            floor = self.counters.pop(victim)[0]
+            self.counters[item] = [floor + count, floor]
+
+    def top(self, n=None):
+        items = sorted(self.counters.items(), key=lambda item: (-item[1][0], item[0]))
+        return [(item, counter[0]) for item, counter in items[:n]]
+
+    def to_dict(self):
+        return {"capacity": self.capacity, "counters": [[item, c[0], c[1]] for item, c in self.counters.items()]}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["capacity"], {item: [count, error] for item, count, error in data["counters"]})
+
+
+class WordFrequencies:
+    def __init__(self, sketch=None, heavy=None):
+        """Частоты слов: Count-Min для оценки любого слова + кандидаты в частые"""
+        self.sketch = sketch or CountMinSketch()
+        self.heavy = heavy or SpaceSaving()
+
+    @classmethod
+    def from_counter(cls, counter):
+        """Сводка по точному счетчику слов архива"""
+        frequencies = cls()
+        for word, count in counter.items():
+            frequencies.sketch.add(word, count)
+        for word, count in counter.most_common(frequencies.heavy.capacity):
+            frequencies.heavy.add(word, count)
+        return frequencies
+
+    def merge(self, other):
+        """
+        Слияние: частоты кандидатов обеих сводок берутся из общего Count-Min,
+        в кандидатах остаются самые частые
+        """
+        self.sketch.merge(other.sketch)
+        candidates = set(self.heavy.counters) | set(other.heavy.counters)
+        estimates = sorted(((word, self.sketch.query(word)) for word in candidates),
+                           key=lambda item: (-item[1], item[0]))
+        self.heavy = SpaceSaving(self.heavy.capacity, {
+            word: [count, 0] for word, count in estimates[:self.heavy.capacity]
+        })
+        return self
+
+    def top(self, n=20):
+        return [(word, self.sketch.query(word)) for word, _ in self.heavy.top(n)]
+
+    def to_dict(self):
+        return {"count_min": self.sketch.to_dict(), "heavy_hitters": self.heavy.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(CountMinSketch.from_dict(data["count_min"]), SpaceSaving.from_dict(data["heavy_hitters"]))
+
+
+class TDigest:
+    def __init__(self, compression=TDIGEST_COMPRESSION, centroids=None):
+        """Квантили: центроиды [среднее, вес], мелкие у краев распределения"""
+        self.compression = compression
+        self.centroids = centroids or []
+        self._buffer = []
+
+    @property
+    def total(self):
+        self._compress()
+        return sum(weight for _, weight in self.centroids)
+
+    def add(self, value, weight=1):
+        self._buffer.append([float(value), weight])
+        if len(self._buffer) >= 10 * self.compression:
+            self._compress()
+
+    def merge(self, other):
+        other._compress()
+        self._buffer.extend([mean, weight] for mean, weight in other.centroids)
+        self._compress()
+        return self
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        points = sorted(self.centroids + self._buffer)
+        self._buffer = []
+        total = sum(weight for _, weight in points)
+
+        merged = [list(points[0])]
+        cumulative = 0
+        for mean, weight in points[1:]:
+            current = merged[-1]
+            q = (cumulative + (current[1] + weight) / 2) / total
+            limit = max(1, 4 * total * q * (1 - q) / self.compression)
+            if current[1] + weight <= limit:
+                current[0] += (mean - current[0]) * weight / (current[1] + weight)
+                current[1] += weight
+            else:
+                cumulative += current[1]
+                merged.append([mean, weight])
+        self.centroids = merged
+
+    def quantile(self, q):
+        """Значение квантиля q (0..1), None для пустой сводки"""
+        self._compress()
+        if not self.centroids:
+            return None
+        total = sum(weight for _, weight in self.centroids)
+        target = q * total
+        cumulative = 0
+        previous_mean, previous_center = self.centroids[0][0], 0
+        for mean, weight in self.centroids:
+            center = cumulative + weight / 2
+            if target <= center:
+                if center == previous_center:
+                    return mean
+                # Линейная интерполяция между центрами соседних центроидов
+                return previous_mean + (mean - previous_mean) * (target - previous_center) / (center - previous_center)
+            previous_mean, previous_center = mean, center
+            cumulative += weight
+        return self.centroids[-1][0]
+
+    def to_dict(self):
+        self._compress()
+        return {"compression": self.compression, "centroids": self.centroids}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["compression"], [list(c) for c in data["centroids"]])
+
+
+class AnalysisSketches:
+    def __init__(self, users=None, words=None, lengths=None):
+        """Сводки одного или нескольких слитых анализов"""
+        self.users = users or HyperLogLog()
+        self.words = words or WordFrequencies()
+        self.lengths = lengths or TDigest()
+
+    @classmethod
+    def from_engine(cls, engine):
+        """Сводки по точным счетчикам FusedAnalyzer"""
+        lengths = TDigest()
+        for length, count in sorted(engine.length_counter.items()):
+            lengths.add(length, count)
+        return cls(HyperLogLog().update(engine.user_counter),
+                   WordFrequencies.from_counter(engine.word_counter),
+                   lengths)
+
+    def merge(self, other):
+        self.users.merge(other.users)
+        self.words.merge(other.words)
+        self.lengths.merge(other.lengths)
+        return self
+
+    def summary(self, top_words=20):
+        """Итоги для отчетов"""
+        return {
+            "unique_users": self.users.count(),
+            "common_words": self.words.top(top_words),
+            "message_length": {
+                "median": self.lengths.quantile(0.5),
+                "p90": self.lengths.quantile(0.9),
+                "p99": self.lengths.quantile(0.99)
+            }
+        }
+
+    def to_dict(self):
+        return {"users": self.users.to_dict(), "words": self.words.to_dict(), "lengths": self.lengths.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(HyperLogLog.from_dict(data["users"]),
+                   WordFrequencies.from_dict(data["words"]),
+                   TDigest.from_dict(data["lengths"]))
+
+
+def merge_sketches(results):
+    """
+    Слияние сводок из результатов анализов
+
+    Returns:
+        tuple: (AnalysisSketches или None, результаты без сводок - старые или неудачные анализы)
+    """
+    merged = None
+    missing = []
+    for result in results:
+        data = result.get('sketches')
+        if not data:
+            missing.append(result)
+            continue
+        sketches = AnalysisSketches.from_dict(data)
+        merged = sketches if merged is None else merged.merge(sketches)
+    return merged, missing
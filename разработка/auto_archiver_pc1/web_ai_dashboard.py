@@ -10,6 +10,7 @@ import threading
 # Импортируем AI модуль
 try:
     from ai_analyzer import AIAnalyzer, ArchiveManager
+    from sketches import AnalysisSketches
     AI_ENABLED = True
 except ImportError:
     AI_ENABLED = False
@@ -37,6 +38,17 @@ if AI_ENABLED:
     analyzer = AIAnalyzer()
     archive_manager = ArchiveManager()
 
+# Ход анализа всех архивов (обновляется из фонового потока)
+analysis_progress = {
+    'running': False,
+    'done': 0,
+    'total': 0,
+    'last_archive': None,
+    'started': None,
+    'finished': None
+}
+progress_lock = threading.Lock()
+
 def log_web_event(message, agent_id=None):
     """Логирование событий веб-интерфейса"""
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -153,12 +165,15 @@ def analyze_archive(archive_name):
         if not os.path.exists(archive_path):
             return jsonify({'error': 'Архив не найден'}), 404
         
+        # ?force=1 - анализировать заново, даже если результат есть в кэше
+        use_cache = request.args.get('force') != '1'
+        
         log_web_event(f"Запуск AI анализа: {safe_name}")
         
         # Запускаем анализ в отдельном потоке
         def analyze_in_background():
             try:
-                result = analyzer.analyze_telegram_archive(archive_path)
+                result = analyzer.analyze_telegram_archive(archive_path, use_cache=use_cache)
                 log_web_event(f"AI анализ завершен: {safe_name}")
             except Exception as e:
                 log_web_event(f"Ошибка AI анализа: {e}", "ERROR")
@@ -184,18 +199,49 @@ def analyze_all_archives():
         return jsonify({'error': 'AI модуль не загружен'}), 500
     
     try:
+        with progress_lock:
+            if analysis_progress['running']:
+                return jsonify({'error': 'Анализ всех архивов уже выполняется'}), 409
+            analysis_progress.update({
+                'running': True,
+                'done': 0,
+                'total': 0,
+                'last_archive': None,
+                'started': datetime.now().isoformat(),
+                'finished': None
+            })
+        
         log_web_event("Запуск AI анализа всех архивов")
         
+        def on_progress(done, total, result):
+            with progress_lock:
+                analysis_progress.update({
+                    'done': done,
+                    'total': total,
+                    'last_archive': result.get('archive_name')
+                })
+        
         def analyze_all_in_background():
             try:
-                results = analyzer.analyze_all_archives()
+                results = analyzer.analyze_all_archives(progress_callback=on_progress)
                 log_web_event(f"AI анализ всех архивов завершен: {len(results)} архивов")
             except Exception as e:
                 log_web_event(f"Ошибка AI анализа всех архивов: {e}", "ERROR")
+            finally:
+                with progress_lock:
+                    analysis_progress['running'] = False
+                    analysis_progress['finished'] = datetime.now().isoformat()
         
         thread = threading.Thread(target=analyze_all_in_background)
         thread.daemon = True
-        thread.start()
+        try:
+            thread.start()
+        except Exception:
+            # Поток не запустился - иначе флаг так и остался бы установленным
+            with progress_lock:
+                analysis_progress['running'] = False
+                analysis_progress['finished'] = datetime.now().isoformat()
+            raise
         
         return jsonify({
             'success': True,
@@ -205,6 +251,17 @@ def analyze_all_archives():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/ai/progress')
+def get_ai_progress():
+    """Ход анализа всех архивов"""
+    if not AI_ENABLED:
+        return jsonify({'error': 'AI модуль не загружен'}), 500
+    
+    with progress_lock:
+        progress = dict(analysis_progress)
+    progress['percent'] = round(progress['done'] * 100 / progress['total']) if progress['total'] else 0
+    return jsonify(progress)
+
 @app.route('/api/ai/reports')
 def list_ai_reports():
     """Список AI отчетов"""
@@ -265,8 +322,9 @@ def get_ai_stats():
         return jsonify({'error': 'AI модуль не загружен'}), 500
     
     try:
-        # Собираем статистику из JSON файлов
-        stats_files = []
+        # Собираем статистику из JSON файлов: повторный анализ оставляет старые
+        # файлы, поэтому от каждого архива берется только последний результат
+        latest = {}
         if os.path.exists(f"{AI_RESULTS_PATH}/stats"):
             for file in os.listdir(f"{AI_RESULTS_PATH}/stats"):
                 if file.endswith('.json'):
@@ -274,22 +332,38 @@ def get_ai_stats():
                     try:
                         with open(filepath, 'r', encoding='utf-8') as f:
                             data = json.load(f)
-                            
-                            stats_files.append({
-                                'archive': data.get('archive_name', file),
-                                'messages': data.get('basic_stats', {}).get('total_messages', 0),
-                                'users': data.get('basic_stats', {}).get('unique_users', 0),
-                                'sentiment': data.get('sentiment_analysis', {}).get('sentiment_score', 0),
-                                'anomalies': len(data.get('anomalies', [])),
-                                'date': data.get('analysis_date', '')
-                            })
                     except:
                         continue
+                    archive = data.get('archive_name', file)
+                    order = (data.get('analysis_date', ''), file)
+                    if archive not in latest or order > latest[archive][0]:
+                        latest[archive] = (order, data)
+        
+        stats_files = []
+        sketches = None
+        users_without_sketches = 0
+        for archive, (_, data) in latest.items():
+            stats_files.append({
+                'archive': archive,
+                'messages': data.get('basic_stats', {}).get('total_messages', 0),
+                'users': data.get('basic_stats', {}).get('unique_users', 0),
+                'sentiment': data.get('sentiment_analysis', {}).get('sentiment_score', 0),
+                'anomalies': len(data.get('anomalies', [])),
+                'date': data.get('analysis_date', '')
+            })
+            
+            # Сводки сливаются: общие для каналов отправители не суммируются дважды
+            if data.get('sketches'):
+                archive_sketches = AnalysisSketches.from_dict(data['sketches'])
+                sketches = archive_sketches if sketches is None else sketches.merge(archive_sketches)
+            else:
+                users_without_sketches += stats_files[-1]['users']
         
         # Общая статистика
         total_analyzed = len(stats_files)
         total_messages = sum(s['messages'] for s in stats_files)
-        total_users = sum(s['users'] for s in stats_files)
+        global_stats = sketches.summary() if sketches else {}
+        total_users = global_stats.get('unique_users', 0) + users_without_sketches
         avg_sentiment = sum(s['sentiment'] for s in stats_files) / total_analyzed if total_analyzed > 0 else 0
         
         # Распределение по тональности
@@ -305,6 +379,8 @@ def get_ai_stats():
             'total_users': total_users,
             'avg_sentiment': avg_sentiment,
             'sentiment_distribution': sentiment_dist,
+            'common_words': global_stats.get('common_words', []),
+            'message_length': global_stats.get('message_length', {}),
             'recent_analyses': stats_files[:10]  # Последние 10 анализов
         })
         
@@ -13,20 +13,29 @@ from datetime import datetime
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from crypto_engine import CryptoEngine
+from server_pool import ServerPool, DeliveryUnknownError, DELIVERY_UNKNOWN, protocol_header
 
 class SystemAgent:
-    def __init__(self, server_ip='192.168.1.100', server_port=9090):
+    def __init__(self, server_ip='192.168.1.100', server_port=9090, servers=None, spread_uploads=False):
         """
         Инициализация агента
         
         Args:
             server_ip (str): IP адрес главного сервера (ПК1)
             server_port (int): Порт сервера
+            servers (list): Список серверов приема "host:port" (заменяет server_ip/server_port)
+            spread_uploads (bool): Распределять отправку файлов по серверам по хэшу имени
         """
-        self.server_ip = server_ip
-        self.server_port = server_port
+        self.server_pool = ServerPool(servers or [(server_ip, server_port)], spread=spread_uploads)
+        self.server_ip = self.server_pool.primary.host
+        self.server_port = self.server_pool.primary.port
         self.agent_id = f"agent_{socket.gethostname()}"
         self.running = True
+        self.archive_watcher = None
+        
+        # Криптодвижок: кэш шифров и пул для параллельного шифрования кусков
+        self.crypto = CryptoEngine()
         
         # Ключ шифрования (генерируется или загружается)
         self.encryption_key = self._load_or_generate_key()
@@ -41,10 +50,20 @@ class SystemAgent:
         print("🤖 АГЕНТ АВТОНОМНОЙ СИСТЕМЫ УПРАВЛЕНИЯ")
         print("=" * 60)
         print(f"🆔 ID агента: {self.agent_id}")
-        print(f"📡 Сервер: {self.server_ip}:{self.server_port}")
+        print(f"📡 Серверы: {', '.join(e.address for e in self.server_pool.endpoints)}")
+        if spread_uploads:
+            print("⚖️  Распределение отправок по серверам: ✅ ВКЛ")
         print(f"🔐 Шифрование: {'✅ ВКЛ' if self.encryption_key else '❌ ВЫКЛ'}")
         print("=" * 60)
     
+    @property
+    def encryption_key(self):
+        return self.crypto.key
+    
+    @encryption_key.setter
+    def encryption_key(self, key):
+        self.crypto.key = key
+    
     def _load_or_generate_key(self):
         """Загрузка или генерация ключа шифрования"""
         key_file = "./encryption_key.key"
@@ -73,12 +92,9 @@ class SystemAgent:
             return data, None
         
         try:
-            cipher = Fernet(self.encryption_key)
-            encrypted = cipher.encrypt(data)
-            
-            # Добавляем метку что данные зашифрованы
-            header = b"ENCRYPTED::"
-            result = header + encrypted
+            # Маленькие данные - один токен с меткой ENCRYPTED::,
+            # большие - куски, зашифрованные параллельно (метка CHUNKED_V2::)
+            result = self.crypto.encrypt(data)
             
             return result, self.encryption_key
         except Exception as e:
@@ -91,10 +107,8 @@ class SystemAgent:
             return encrypted_data
         
         try:
-            if encrypted_data.startswith(b"ENCRYPTED::"):
-                cipher = Fernet(self.encryption_key)
-                decrypted = cipher.decrypt(encrypted_data[10:])  # Убираем заголовок
-                return decrypted
+            if encrypted_data.startswith((b"ENCRYPTED::", b"CHUNKED_V2::", b"CHUNKED::")):
+                return self.crypto.decrypt(encrypted_data)
             else:
                 return encrypted_data
         except Exception as e:
@@ -108,6 +122,10 @@ class SystemAgent:
         Args:
             file_path (str): Путь к файлу
             file_type (str): Тип файла
+        
+        Returns:
+            bool: Отправлен (или DELIVERY_UNKNOWN - данные ушли, ответа нет;
+                  повторять нельзя, сервер мог файл уже принять)
         """
         if not os.path.exists(file_path):
             print(f"❌ Файл не найден: {file_path}")
@@ -120,44 +138,191 @@ class SystemAgent:
             
             print(f"🔒 Шифрую файл: {os.path.basename(file_path)}")
             
-            # Шифруем данные
-            encrypted_data, key = self.encrypt_data(file_data)
-            
-            # Готовим метаданные
-            metadata = {
-                'filename': os.path.basename(file_path),
-                'original_size': len(file_data),
-                'encrypted_size': len(encrypted_data),
-                'encrypted': key is not None,
-                'hash': hashlib.sha256(file_data).hexdigest(),
-                'timestamp': datetime.now().isoformat(),
-                'agent_id': self.agent_id
-            }
+            response_data = self._send_secure_payload(file_data, os.path.basename(file_path))
             
-            # Создаем пакет: метаданные + данные
-            packet = {
-                'metadata': metadata,
-                'data': base64.b64encode(encrypted_data).decode('utf-8')
-            }
+            if response_data.get('status') == 'success':
+                print(f"✅ Файл отправлен успешно!")
+                print(f"   📝 {response_data.get('message')}")
+                
+                # Безопасное удаление исходного файла
+                if response_data.get('verified', False):
+                    self.secure_delete(file_path)
+                    print(f"🗑️ Исходный файл безопасно удален")
+                
+                return True
+            else:
+                print(f"❌ Ошибка на сервере: {response_data.get('message')}")
+                return False
+                
+        except DeliveryUnknownError as e:
+            print(f"⚠️ Доставка {os.path.basename(file_path)} неизвестна, повтор не выполняется: {e}")
+            return DELIVERY_UNKNOWN
+        except Exception as e:
+            print(f"❌ Ошибка отправки файла: {e}")
+            return False
+    
+    def secure_stream_file(self, file_path):
+        """
+        Потоковая отправка файла (протокол STREAM): файл читается и шифруется
+        кусками, в памяти не держится целиком
+        
+        Returns:
+            bool: Отправлен и проверен сервером (или DELIVERY_UNKNOWN)
+        """
+        from stream_pipeline import stream_file
+        
+        if not os.path.exists(file_path):
+            print(f"❌ Файл не найден: {file_path}")
+            return False
+        
+        try:
+            print(f"📡 Отправляю потоком: {os.path.basename(file_path)}")
+            response_data = stream_file(self, file_path)
             
-            packet_json = json.dumps(packet)
-            packet_size = len(packet_json)
+            if response_data.get('status') != 'success':
+                print(f"❌ Ошибка на сервере: {response_data.get('message')}")
+                return False
             
-            print(f"📦 Подготовлен пакет: {packet_size} байт")
-            print(f"   📁 Исходный размер: {len(file_data)} байт")
-            print(f"   🔐 Зашифрованный: {len(encrypted_data)} байт")
-            print(f"   📊 Коэффициент: {(len(encrypted_data)/len(file_data)):.2f}")
+            print(f"✅ Файл отправлен успешно!")
+            print(f"   📝 {response_data.get('message')}")
+            if response_data.get('verified', False):
+                self.secure_delete(file_path)
+                print(f"🗑️ Исходный файл безопасно удален")
+            return True
             
-            # Подключаемся к серверу
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(30)
-            sock.connect((self.server_ip, self.server_port))
+        except DeliveryUnknownError as e:
+            print(f"⚠️ Доставка {os.path.basename(file_path)} неизвестна, повтор не выполняется: {e}")
+            return DELIVERY_UNKNOWN
+        except Exception as e:
+            print(f"❌ Ошибка потоковой отправки: {e}")
+            return False
+    
+    def open_stream_builder(self, archive_path, pool=None):
+        """
+        Сборщик архива, отправляющий его на сервер по мере сборки
+        (для TelegramArchiver: тома и сегменты не пишутся на диск)
+        """
+        from stream_pipeline import StreamingUploadBuilder
+        return StreamingUploadBuilder(self, archive_path, pool=pool)
+    
+    def secure_send_bundle(self, file_paths):
+        """
+        Отправка нескольких мелких файлов одним зашифрованным пакетом
+        
+        Args:
+            file_paths (list): Пути к файлам
+        
+        Returns:
+            dict: {путь: отправлен и проверен сервером (или DELIVERY_UNKNOWN)}
+        """
+        from file_bundler import pack_bundle
+        
+        results = {path: False for path in file_paths}
+        
+        try:
+            bundle_data, manifest = pack_bundle(file_paths)
+            bundle_name = f"bundle_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{len(file_paths)}.zip"
+            
+            print(f"📦 Упаковано файлов в пакет: {len(file_paths)} -> {bundle_name}")
             
-            # Отправляем заголовок
-            sock.send("SECURE_FILE".ljust(10).encode('utf-8'))
+            response_data = self._send_secure_payload(bundle_data, bundle_name, {
+                'bundle': True,
+                'file_count': len(manifest['files'])
+            })
+            
+            if response_data.get('status') != 'success':
+                print(f"❌ Ошибка на сервере: {response_data.get('message')}")
+                return results
+            
+            # Удаляем только файлы, хэш которых сервер подтвердил
+            verified = {f['name'] for f in response_data.get('files', []) if f.get('verified')}
+            for entry in manifest['files']:
+                if entry['name'] in verified:
+                    results[entry['path']] = True
+                    self.secure_delete(entry['path'])
+            
+            print(f"✅ Пакет отправлен: проверено {len(verified)}/{len(file_paths)} файлов")
+            
+        except DeliveryUnknownError as e:
+            print(f"⚠️ Доставка пакета неизвестна, повтор не выполняется: {e}")
+            results = {path: DELIVERY_UNKNOWN for path in file_paths}
+        except Exception as e:
+            print(f"❌ Ошибка отправки пакета: {e}")
+        
+        return results
+    
+    def secure_send_files(self, file_paths, small_file_size=None, max_bundle_size=None, stream=False):
+        """
+        Отправка списка файлов: мелкие - пакетами, крупные - по одному
+        (stream=True - крупные потоком STREAM, без чтения в память)
+        
+        Returns:
+            dict: {путь: отправлен (или DELIVERY_UNKNOWN)}
+        """
+        from file_bundler import plan_bundles
+        
+        bundles, singles = plan_bundles(file_paths, small_file_size, max_bundle_size)
+        results = {}
+        
+        for bundle in bundles:
+            if len(bundle) == 1:
+                singles.append(bundle[0])
+            else:
+                results.update(self.secure_send_bundle(bundle))
+        
+        for path in singles:
+            if stream:
+                results[path] = self.secure_stream_file(path)
+            else:
+                results[path] = self.secure_send_file(path, "TELEGRAM")
+        
+        return results
+    
+    def _send_secure_payload(self, data, filename, extra_metadata=None):
+        """
+        Шифрование и отправка данных на сервер (пакет SECURE_FILE, заголовок "SECUREFILE")
+        
+        Returns:
+            dict: Ответ сервера
+        """
+        # Шифруем данные
+        encrypted_data, key = self.encrypt_data(data)
+        
+        # Готовим метаданные
+        metadata = {
+            'filename': filename,
+            'original_size': len(data),
+            'encrypted_size': len(encrypted_data),
+            'encrypted': key is not None,
+            'hash': hashlib.sha256(data).hexdigest(),
+            'timestamp': datetime.now().isoformat(),
+            'agent_id': self.agent_id
+        }
+        if extra_metadata:
+            metadata.update(extra_metadata)
+        
+        # Создаем пакет: метаданные + данные
+        packet = {
+            'metadata': metadata,
+            'data': base64.b64encode(encrypted_data).decode('utf-8')
+        }
+        
+        packet_json = json.dumps(packet)
+        packet_size = len(packet_json)
+        
+        print(f"📦 Подготовлен пакет: {packet_size} байт")
+        print(f"   📁 Исходный размер: {len(data)} байт")
+        print(f"   🔐 Зашифрованный: {len(encrypted_data)} байт")
+        print(f"   📊 Коэффициент: {(len(encrypted_data)/max(len(data), 1)):.2f}")
+        
+        def transfer(sock, endpoint):
+            print(f"📡 Сервер: {endpoint.address}")
+            
+            # Отправляем заголовок (ровно 10 байт)
+            sock.sendall(protocol_header("SECUREFILE"))
             
             # Отправляем размер пакета
-            sock.send(f"{packet_size:<20}".encode('utf-8'))
+            sock.sendall(f"{packet_size:<20}".encode('utf-8'))
             
             # Отправляем сам пакет
             total_sent = 0
@@ -165,38 +330,27 @@ class SystemAgent:
             
             while total_sent < packet_size:
                 chunk = packet_json[total_sent:total_sent + chunk_size].encode('utf-8')
-                sock.send(chunk)
+                sock.sendall(chunk)
                 total_sent += len(chunk)
                 
                 percent = (total_sent / packet_size) * 100
                 print(f"  📤 Отправлено: {percent:.1f}% ({total_sent}/{packet_size})", end='\r')
             
             print()
-            
-            # Получаем ответ
-            sock.settimeout(5)
-            response = sock.recv(4096).decode('utf-8')
-            response_data = json.loads(response)
-            
-            sock.close()
-            
-            if response_data.get('status') == 'success':
-                print(f"✅ Файл отправлен успешно!")
-                print(f"   📝 {response_data.get('message')}")
-                
-                # Безопасное удаление исходного файла
-                if response_data.get('verified', False):
-                    self.secure_delete(file_path)
-                    print(f"🗑️ Исходный файл безопасно удален")
-                
-                return True
-            else:
-                print(f"❌ Ошибка на сервере: {response_data.get('message')}")
-                return False
-                
-        except Exception as e:
-            print(f"❌ Ошибка отправки файла: {e}")
-            return False
+        
+        def receive(sock, endpoint):
+            # Получаем ответ (сервер закрывает соединение после ответа)
+            sock.settimeout(30)
+            response = b""
+            while True:
+                chunk = sock.recv(4096)
+                if not chunk:
+                    break
+                response += chunk
+            return json.loads(response.decode('utf-8'))
+        
+        # Отправка с переключением на резервный сервер при сбое до конца отправки
+        return self.server_pool.run(transfer, timeout=30, key=filename, receive=receive)
     
     def secure_delete(self, file_path, passes=3):
         """
@@ -233,16 +387,12 @@ class SystemAgent:
                 pass
     
     def test_connection(self):
-        """Проверка подключения к серверу"""
-        try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(3)
-            sock.connect((self.server_ip, self.server_port))
-            sock.close()
-            return True
-        except Exception as e:
-            print(f"❌ Нет подключения к серверу: {e}")
-            return False
+        """Проверка подключения к серверам (True - доступен хотя бы один)"""
+        results = self.server_pool.probe(timeout=3)
+        for address, ok in results.items():
+            if not ok:
+                print(f"❌ Нет подключения к серверу {address}")
+        return any(results.values())
     
     def collect_system_metrics(self):
         """Сбор метрик системы"""
@@ -275,19 +425,15 @@ class SystemAgent:
             if not metrics:
                 return False
             
-            # Создаем соединение
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(10)
-            sock.connect((self.server_ip, self.server_port))
-            
-            # Отправляем заголовок
-            sock.send("METRICS    ".encode('utf-8'))
-            
-            # Отправляем метрики как JSON
-            metrics_json = json.dumps(metrics)
-            sock.send(metrics_json.encode('utf-8'))
+            def transfer(sock, endpoint):
+                # Отправляем заголовок
+                sock.sendall(protocol_header("METRICS"))
+                
+                # Отправляем метрики как JSON
+                metrics_json = json.dumps(metrics)
+                sock.sendall(metrics_json.encode('utf-8'))
             
-            sock.close()
+            self.server_pool.run(transfer, timeout=10)
             
             print(f"📊 Метрики отправлены: CPU={metrics['cpu_percent']}%, RAM={metrics['memory_percent']}%")
             return True
@@ -323,7 +469,8 @@ class SystemAgent:
     def telegram_menu(self):
         """Меню управления Telegram архиватором"""
         try:
-            from telegram_archiver import get_telegram_credentials, sync_download_channel
+            from telegram_archiver import (get_telegram_credentials, sync_download_channel,
+                                           sync_download_channels, sync_capture_live)
         except ImportError:
             print("❌ Модуль telegram_archiver не найден")
             print("👉 Убедись что файл telegram_archiver.py в той же папке")
@@ -348,6 +495,10 @@ class SystemAgent:
             print("  [2] 📤 Отправить архив на сервер (с шифрованием)")
             print("  [3] 📤 Отправить архив БЕЗ шифрования")
             print("  [4] 🔐 Показать/сменить ключ шифрования")
+            print("  [5] 🔄 Отправить все новые архивы (с шифрованием)")
+            print("  [6] 📚 Скачать несколько каналов параллельно")
+            print("  [7] ⏱️  Замер скорости сборки архивов")
+            print("  [8] 📡 Живой режим (новые сообщения сразу на сервер)")
             print("  [B] ↩️ Назад")
             
             choice = input("> ").lower()
@@ -360,35 +511,50 @@ class SystemAgent:
                 limit = int(limit) if limit.isdigit() else 100
                 
                 if channel:
+                    # Потоком: тома сжимаются, шифруются и уходят на ПК1 во время скачивания
+                    stream = input("Отправлять архив на сервер потоком во время скачивания? (y/n): ").lower() == 'y'
                     print(f"🚀 Начинаю скачивание: {channel}")
-                    archive_path = sync_download_channel(api_id, api_hash, channel, limit)
+                    archive_path = sync_download_channel(api_id, api_hash, channel, limit,
+                                                         open_volume_builder=self.open_stream_builder if stream else None)
                     
                     if archive_path:
+                        from archive_volumes import volume_paths
+                        
+                        all_paths = volume_paths(archive_path)
+                        archive_paths = [path for path in all_paths if os.path.exists(path)]
                         print(f"✅ Архив создан: {archive_path}")
+                        if len(all_paths) > 1:
+                            print(f"📚 Томов: {len(all_paths)}")
                         
-                        # Спросим, отправить ли на сервер
-                        send = input("Отправить архив на сервер ПК1? (y/n): ").lower()
+                        if stream and not archive_paths:
+                            print("📡 Все тома отправлены на сервер потоком")
+                            send = 'n'
+                        else:
+                            # Спросим, отправить ли на сервер (при потоковой отправке - тома из спула)
+                            send = input("Отправить архив на сервер ПК1? (y/n): ").lower()
                         if send == 'y':
                             use_encryption = input("Использовать шифрование? (y/n): ").lower()
                             if use_encryption == 'y':
-                                if self.secure_send_file(archive_path, "TELEGRAM"):
+                                sent = self.secure_send_files(archive_paths)
+                                failed = [path for path, result in sent.items() if result is not True]
+                                if not failed:
                                     print("✅ Архив отправлен на сервер с шифрованием!")
                                 else:
-                                    print("❌ Ошибка отправки архива")
+                                    print(f"❌ Ошибка отправки архива ({len(failed)} томов)")
                             else:
                                 # Старый метод без шифрования
-                                self._send_file_old(archive_path, "TELEGRAM")
+                                for path in archive_paths:
+                                    self._send_file_old(path, "TELEGRAM")
                     else:
                         print("❌ Не удалось скачать канал")
                 
                 input("\nНажми Enter чтобы продолжить...")
                 
-            elif choice == '2':
-                import glob
-                archives = glob.glob("./telegram_archives/*.zip")
+            elif choice in ('2', '3'):
+                archives = self._get_archive_watcher().pending_archives()
                 
                 if archives:
-                    print("📁 Найденные архивы:")
+                    print("📁 Новые (еще не отправленные) архивы:")
                     for i, archive in enumerate(archives, 1):
                         size = os.path.getsize(archive) // 1024
                         print(f"  [{i}] {os.path.basename(archive)} ({size} KB)")
@@ -396,32 +562,87 @@ class SystemAgent:
                     file_num = input("Выберите номер файла: ").strip()
                     if file_num.isdigit() and 1 <= int(file_num) <= len(archives):
                         archive_path = archives[int(file_num)-1]
-                        self.secure_send_file(archive_path, "TELEGRAM")
+                        if choice == '2':
+                            sent = self.secure_send_file(archive_path, "TELEGRAM")
+                        else:
+                            sent = self._send_file_old(archive_path, "TELEGRAM")
+                        if sent == DELIVERY_UNKNOWN:
+                            self._get_archive_watcher().mark_unknown(archive_path)
+                        elif sent:
+                            self._get_archive_watcher().mark_shipped(archive_path)
                     else:
                         print("❌ Неверный выбор")
                 else:
-                    print("📭 Архивы не найдены")
+                    print("📭 Новых архивов нет")
                 
                 input("\nНажми Enter чтобы продолжить...")
                 
-            elif choice == '3':
-                import glob
-                archives = glob.glob("./telegram_archives/*.zip")
+            elif choice == '5':
+                watcher = self._get_archive_watcher()
+                print(f"🔄 Отправляю все новые архивы из {watcher.watch_dir}...")
+                sent, failed = watcher.ship_pending(send_many=self.secure_send_files)
+                print(f"✅ Отправлено: {sent}, ошибок: {failed}")
                 
-                if archives:
-                    print("📁 Найденные архивы:")
-                    for i, archive in enumerate(archives, 1):
-                        size = os.path.getsize(archive) // 1024
-                        print(f"  [{i}] {os.path.basename(archive)} ({size} KB)")
+                input("\nНажми Enter чтобы продолжить...")
+                
+            elif choice == '6':
+                print("Введите ссылки на каналы через пробел или запятую:")
+                channels = [c for c in input("> ").replace(',', ' ').split() if c]
+                limit = input("Сколько сообщений скачать с канала? (по умолчанию 100): ").strip()
+                limit = int(limit) if limit.isdigit() else 100
+                parallel = input("Сколько каналов качать одновременно? (по умолчанию 3): ").strip()
+                parallel = int(parallel) if parallel.isdigit() else 3
+                
+                if channels:
+                    results = sync_download_channels(api_id, api_hash, channels, limit, parallel)
                     
-                    file_num = input("Выберите номер файла: ").strip()
-                    if file_num.isdigit() and 1 <= int(file_num) <= len(archives):
-                        archive_path = archives[int(file_num)-1]
-                        self._send_file_old(archive_path, "TELEGRAM")
-                    else:
-                        print("❌ Неверный выбор")
-                else:
-                    print("📭 Архивы не найдены")
+                    print("\n📊 Итоги по каналам:")
+                    for result in results:
+                        icon = "✅" if result['archive_path'] else ("❌" if result['status'] == 'failed' else "ℹ️")
+                        print(f"  {icon} {result['channel']}: {result['messages']} сообщ., "
+                              f"{result['media']} медиа, {result['seconds']} сек "
+                              f"({result['messages_per_sec']} сообщ/с)")
+                        if result['error']:
+                            print(f"     Ошибка: {result['error']}")
+                    
+                    archives = [r['archive_path'] for r in results if r['archive_path']]
+                    if archives and input("Отправить новые архивы на сервер ПК1? (y/n): ").lower() == 'y':
+                        watcher = self._get_archive_watcher()
+                        watcher.scan()
+                        sent, failed = watcher.ship_pending(send_many=self.secure_send_files)
+                        print(f"✅ Отправлено: {sent}, ошибок: {failed}")
+                
+                input("\nНажми Enter чтобы продолжить...")
+                
+            elif choice == '7':
+                from zip_builder import benchmark
+                
+                size_mb = input("Размер синтетического канала, МБ (по умолчанию 5120): ").strip()
+                size_mb = int(size_mb) if size_mb.isdigit() else 5120
+                
+                print(f"\n⏱️  Сборка архива {size_mb} МБ при разном числе процессов...")
+                for result in benchmark(size_mb):
+                    print(f"   Процессов: {result['workers']:>2} | {result['seconds']:8.1f} сек | "
+                          f"{result['mb_per_sec']:8.1f} МБ/с | ускорение x{result['speedup']}")
+                
+                input("\nНажми Enter чтобы продолжить...")
+                
+            elif choice == '8':
+                print("Введите ссылки на каналы/чаты через пробел или запятую:")
+                chats = [c for c in input("> ").replace(',', ' ').split() if c]
+                seconds = input("Закрывать сегмент каждые N секунд (по умолчанию 300): ").strip()
+                seconds = int(seconds) if seconds.isdigit() else 300
+                stream = input("Отправлять сегменты потоком по мере записи? (y/n): ").lower() == 'y'
+                
+                if chats:
+                    print("📡 Слушаю новые сообщения, Ctrl+C - остановка")
+                    try:
+                        # Сегмент отправляется сразу после закрытия (при потоковой отправке - только из спула)
+                        sync_capture_live(api_id, api_hash, chats, segment_seconds=seconds,
+                                          on_segment=lambda path: self.secure_send_file(path, "TELEGRAM"),
+                                          open_volume_builder=self.open_stream_builder if stream else None)
+                    except KeyboardInterrupt:
+                        print("\n⏹️ Живой режим остановлен")
                 
                 input("\nНажми Enter чтобы продолжить...")
                 
@@ -440,6 +661,13 @@ class SystemAgent:
                 
                 input("\nНажми Enter чтобы продолжить...")
     
+    def _get_archive_watcher(self):
+        """Наблюдатель за папкой архивов (создается при первом обращении)"""
+        if self.archive_watcher is None:
+            from archive_watcher import ArchiveWatcher
+            self.archive_watcher = ArchiveWatcher("./telegram_archives")
+        return self.archive_watcher
+    
     def _send_file_old(self, file_path, file_type):
         """Старый метод отправки файла без шифрования (для обратной совместимости)"""
         try:
@@ -449,37 +677,34 @@ class SystemAgent:
             file_size = len(file_data)
             filename = os.path.basename(file_path)
             
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(30)
-            sock.connect((self.server_ip, self.server_port))
-            
-            header = f"{file_type:<10}"
-            sock.send(header.encode('utf-8'))
-            
-            size_header = f"{file_size:<20}"
-            sock.send(size_header.encode('utf-8'))
-            
-            name_header = f"{filename:<100}"
-            sock.send(name_header.encode('utf-8'))
-            
-            total_sent = 0
-            chunk_size = 4096
-            
-            while total_sent < file_size:
-                chunk = file_data[total_sent:total_sent + chunk_size]
-                sock.send(chunk)
-                total_sent += len(chunk)
+            def transfer(sock, endpoint):
+                sock.sendall(protocol_header(file_type))
                 
-                percent = (total_sent / file_size) * 100
-                print(f"  📤 Отправлено: {percent:.1f}% ({total_sent}/{file_size})", end='\r')
-            
-            print()
+                size_header = f"{file_size:<20}"
+                sock.sendall(size_header.encode('utf-8'))
+                
+                name_header = f"{filename:<100}"
+                sock.sendall(name_header.encode('utf-8'))
+                
+                total_sent = 0
+                chunk_size = 4096
+                
+                while total_sent < file_size:
+                    chunk = file_data[total_sent:total_sent + chunk_size]
+                    sock.sendall(chunk)
+                    total_sent += len(chunk)
+                    
+                    percent = (total_sent / file_size) * 100
+                    print(f"  📤 Отправлено: {percent:.1f}% ({total_sent}/{file_size})", end='\r')
+                
+                print()
             
-            sock.settimeout(5)
-            response = sock.recv(4096).decode('utf-8')
-            response_data = json.loads(response)
+            def receive(sock, endpoint):
+                sock.settimeout(5)
+                response = sock.recv(4096).decode('utf-8')
+                return json.loads(response)
             
-            sock.close()
+            response_data = self.server_pool.run(transfer, timeout=30, key=filename, receive=receive)
             
             if response_data.get('status') == 'success':
                 print(f"✅ Файл отправлен (без шифрования)")
@@ -498,7 +723,6 @@ class SystemAgent:
             print("\n" + "=" * 60)
             print("          🎮 МЕНЮ УПРАВЛЕНИЯ АГЕНТОМ")
             print("=" * 60)
-            print(f"Сервер: {self.server_ip}:{self.server_port}")
             print(f"Агент: {self.agent_id}")
             print(f"Шифрование: {'🟢 ВКЛ' if self.encryption_key else '🔴 ВЫКЛ'}")
             print("-" * 60)
@@ -509,6 +733,10 @@ class SystemAgent:
             else:
                 print("📡 Связь с сервером: 🔴 НЕТ")
             
+            for server in self.server_pool.status():
+                latency = f"{server['latency_ms']} мс" if server['latency_ms'] is not None else "—"
+                print(f"   {'🟢' if server['healthy'] else '🔴'} {server['address']} ({latency})")
+            
             print("-" * 60)
             print("Выберите действие:")
             print("  [1] 📊 Отправить метрики системы")
@@ -519,6 +747,7 @@ class SystemAgent:
             print("  [6] ℹ️  Информация о системе")
             print("  [7] 📱 Telegram архиватор (основное)")
             print("  [8] 🔐 Настройки безопасности")
+            print("  [9] 📦 Отправить папку (мелкие файлы - одним пакетом)")
             print("  [Q] 🚪 Выход")
             print("=" * 60)
             
@@ -554,6 +783,15 @@ class SystemAgent:
                 self.telegram_menu()
             elif choice == '8':
                 self.security_menu()
+            elif choice == '9':
+                folder = input("Введите путь к папке: ").strip()
+                if os.path.isdir(folder):
+                    paths = sorted(entry.path for entry in os.scandir(folder) if entry.is_file())
+                    results = self.secure_send_files(paths)
+                    print(f"✅ Отправлено: {list(results.values()).count(True)}/{len(paths)} файлов")
+                else:
+                    print("❌ Папка не найдена!")
+                input("Нажми Enter чтобы продолжить...")
             else:
                 print("❌ Неверный выбор")
                 time.sleep(1)
@@ -636,6 +874,14 @@ class SystemAgent:
                         print("✅ Шифрование работает корректно!")
                     else:
                         print("❌ Ошибка: данные не совпадают после расшифровки")
+                    
+                    size_mb = input("Объем для замера скорости, МБ (по умолчанию 64): ").strip()
+                    size_mb = int(size_mb) if size_mb.isdigit() else 64
+                    
+                    print(f"\n⏱️  Замер пропускной способности ({size_mb} МБ, куски по {self.crypto.chunk_size // (1024 * 1024)} МБ)...")
+                    for result in self.crypto.benchmark(size_mb):
+                        print(f"   Ядер: {result['workers']:>2} | {result['mb_per_sec']:8.1f} МБ/с | "
+                              f"{result['mb_per_sec_per_core']:8.1f} МБ/с на ядро")
                 else:
                     print("⚠️  Шифрование отключено")
                 
@@ -680,10 +926,19 @@ class SystemAgent:
         input("Нажми Enter чтобы продолжить...")
 
 if __name__ == "__main__":
+    import sys
+    
+    # Фоновый режим: python agent.py --daemon [agent_config.json]
+    if len(sys.argv) > 1 and sys.argv[1] == '--daemon':
+        from agent_daemon import run_daemon
+        run_daemon(sys.argv[2] if len(sys.argv) > 2 else "./agent_config.json")
+        sys.exit(0)
+    
     # Настройки
     SERVER_IP = "192.168.1.100"  # ЗАМЕНИ НА РЕАЛЬНЫЙ IP ПК1
     SERVER_PORT = 9090
+    SERVERS = None  # Несколько ПК1, например: ["192.168.1.100:9090", "192.168.1.101:9090"]
     
     # Создаем и запускаем агента
-    agent = SystemAgent(server_ip=SERVER_IP, server_port=SERVER_PORT)
+    agent = SystemAgent(server_ip=SERVER_IP, server_port=SERVER_PORT, servers=SERVERS)
     agent.run_menu()
\ No newline at end of file
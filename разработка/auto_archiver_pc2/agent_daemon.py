@@ -0,0 +1,595 @@
+"""
+Фоновый (headless) режим агента ПК2
+Планировщик периодических задач + управляющий сокет для systemd/мониторинга
+"""
+import socket
+import json
+import os
+import time
+import heapq
+import random
+import signal
+import threading
+from datetime import datetime
+
+# Конфигурация по умолчанию (создается при первом запуске)
+DEFAULT_CONFIG = {
+    "server_ip": "192.168.1.100",
+    "server_port": 9090,
+    "servers": [],
+    "spread_uploads": False,
+    "control_host": "127.0.0.1",
+    "control_port": 9191,
+    "logs_path": "./logs",
+    "live": {"enabled": False, "chats": [], "segment_seconds": 300, "segment_bytes": 67108864,
+             "restart_delay": 30, "stream": False},
+    "jobs": {
+        "metrics": {"enabled": True, "interval": 30, "jitter": 3, "deadline": 25},
+        "archive": {"enabled": False, "interval": 3600, "jitter": 120, "deadline": 3300,
+                    "channels": [], "limit": 100, "max_parallel": 3,
+                    "volume_size": 1073741824, "stream": False},
+        "watch": {"enabled": True, "interval": 5, "jitter": 1, "deadline": 30,
+                  "watch_dir": "./telegram_archives", "stable_seconds": 10},
+        "upload": {"enabled": True, "interval": 60, "jitter": 5, "deadline": 600,
+                   "small_file_size": 1048576, "max_bundle_size": 33554432, "stream": False},
+        "cleanup": {"enabled": True, "interval": 86400, "jitter": 600, "deadline": 600,
+                    "max_age_days": 7}
+    }
+}
+
+
+def load_or_create_config(config_path):
+    """
+    Загрузка конфигурации демона (или создание файла со значениями по умолчанию)
+
+    Args:
+        config_path: Путь к JSON файлу конфигурации
+
+    Returns:
+        dict: Конфигурация, дополненная значениями по умолчанию
+    """
+    config = json.loads(json.dumps(DEFAULT_CONFIG))
+
+    if os.path.exists(config_path):
+        with open(config_path, 'r', encoding='utf-8') as f:
+            user_config = json.load(f)
+
+        jobs = user_config.pop('jobs', {})
+        config['live'].update(user_config.pop('live', {}))
+        config.update(user_config)
+        for name, job_config in jobs.items():
+            config['jobs'].setdefault(name, {}).update(job_config)
+    else:
+        with open(config_path, 'w', encoding='utf-8') as f:
+            json.dump(DEFAULT_CONFIG, f, ensure_ascii=False, indent=2)
+        print(f"📝 Создан файл конфигурации: {config_path}")
+
+    return config
+
+
+class PeriodicJob:
+    def __init__(self, name, func, interval, jitter=0, deadline=None):
+        """
+        Периодическая задача планировщика
+
+        Args:
+            name: Имя задачи
+            func: Вызываемый объект без аргументов
+            interval: Период запуска (сек)
+            jitter: Случайный разброс момента запуска (±сек)
+            deadline: Предельное время выполнения/опоздания запуска (сек)
+        """
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.deadline = deadline if deadline else interval
+
+        self.running = False
+        self.started_at = None
+        self.next_run = None
+        self.overdue = False
+
+        # Статистика для статуса
+        self.runs = 0
+        self.failures = 0
+        self.skipped_overlap = 0
+        self.skipped_late = 0
+        self.deadline_misses = 0
+        self.last_run = None
+        self.last_duration = None
+        self.last_error = None
+
+    def schedule_after(self, base_time):
+        """Расчет следующего запуска с учетом разброса"""
+        offset = random.uniform(-self.jitter, self.jitter) if self.jitter else 0
+        self.next_run = base_time + self.interval + offset
+
+        # Если отстали больше чем на период - не догоняем пропущенные запуски
+        now = time.time()
+        if self.next_run < now:
+            self.next_run = now + random.uniform(0, self.jitter) if self.jitter else now
+
+        return self.next_run
+
+    def status(self):
+        """Состояние задачи для управляющего сокета"""
+        return {
+            "interval": self.interval,
+            "jitter": self.jitter,
+            "deadline": self.deadline,
+            "running": self.running,
+            "overdue": self.overdue,
+            "running_for": round(time.time() - self.started_at, 1) if self.running else None,
+            "next_run": datetime.fromtimestamp(self.next_run).isoformat() if self.next_run else None,
+            "last_run": self.last_run,
+            "last_duration": self.last_duration,
+            "last_error": self.last_error,
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped_overlap": self.skipped_overlap,
+            "skipped_late": self.skipped_late,
+            "deadline_misses": self.deadline_misses
+        }
+
+
+class JobScheduler:
+    def __init__(self, log_func=print):
+        """
+        Планировщик периодических задач
+
+        Гарантии:
+            - задача никогда не выполняется параллельно сама с собой;
+            - запуск, опоздавший больше чем на deadline, пропускается;
+            - выполнение дольше deadline отмечается в статусе (overdue).
+        """
+        self.jobs = {}
+        self.log = log_func
+        self._heap = []
+        self._cond = threading.Condition()
+        self._stopped = False
+
+    def add_job(self, job, start_delay=None):
+        """Регистрация задачи (первый запуск через start_delay или со случайным разбросом)"""
+        with self._cond:
+            self.jobs[job.name] = job
+            if start_delay is None:
+                start_delay = random.uniform(0, job.jitter) if job.jitter else 0
+            job.next_run = time.time() + start_delay
+            heapq.heappush(self._heap, (job.next_run, job.name))
+            self._cond.notify()
+
+    def trigger(self, name):
+        """Внеочередной запуск задачи"""
+        with self._cond:
+            job = self.jobs.get(name)
+            if not job:
+                return False
+            job.next_run = time.time()
+            heapq.heappush(self._heap, (job.next_run, job.name))
+            self._cond.notify()
+            return True
+
+    def stop(self):
+        """Остановка планировщика"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def run_forever(self):
+        """Основной цикл планировщика"""
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+
+                run_at, name = self._heap[0]
+                job = self.jobs[name]
+
+                # Устаревшая запись (задача была перепланирована)
+                if run_at != job.next_run:
+                    heapq.heappop(self._heap)
+                    continue
+
+                delay = run_at - time.time()
+                if delay > 0:
+                    self._cond.wait(timeout=min(delay, 1.0))
+                    self._check_deadlines()
+                    continue
+
+                heapq.heappop(self._heap)
+                self._dispatch(job, run_at)
+                heapq.heappush(self._heap, (job.schedule_after(run_at), job.name))
+
+    def _dispatch(self, job, run_at):
+        """Запуск задачи в отдельном потоке (вызывается под блокировкой)"""
+        lateness = time.time() - run_at
+
+        if job.running:
+            job.skipped_overlap += 1
+            self.log(f"⏭️ Задача {job.name} еще выполняется, запуск пропущен", "WARNING")
+            return
+
+        if lateness > job.deadline:
+            job.skipped_late += 1
+            self.log(f"⏭️ Задача {job.name} опоздала на {lateness:.0f} сек, запуск пропущен", "WARNING")
+            return
+
+        job.running = True
+        job.overdue = False
+        job.started_at = time.time()
+
+        worker = threading.Thread(target=self._run_job, args=(job,), name=f"job-{job.name}")
+        worker.daemon = True
+        worker.start()
+
+    def _run_job(self, job):
+        """Выполнение задачи и сбор статистики"""
+        error = None
+        try:
+            job.func()
+        except Exception as e:
+            error = str(e)
+            self.log(f"❌ Ошибка задачи {job.name}: {e}", "ERROR")
+
+        with self._cond:
+            duration = time.time() - job.started_at
+            job.runs += 1
+            job.last_run = datetime.fromtimestamp(job.started_at).isoformat()
+            job.last_duration = round(duration, 2)
+            job.last_error = error
+            if error:
+                job.failures += 1
+            if duration > job.deadline and not job.overdue:
+                job.deadline_misses += 1
+            job.running = False
+            job.overdue = False
+
+    def _check_deadlines(self):
+        """Отметка задач, превысивших предельное время выполнения"""
+        now = time.time()
+        for job in self.jobs.values():
+            if job.running and not job.overdue and now - job.started_at > job.deadline:
+                job.overdue = True
+                job.deadline_misses += 1
+                self.log(f"⏰ Задача {job.name} выполняется дольше {job.deadline} сек", "WARNING")
+
+    def status(self):
+        """Состояние всех задач"""
+        with self._cond:
+            return {name: job.status() for name, job in self.jobs.items()}
+
+
+class AgentDaemon:
+    def __init__(self, config_path="./agent_config.json"):
+        """
+        Фоновый режим агента
+
+        Args:
+            config_path: Путь к файлу конфигурации
+        """
+        self.config_path = config_path
+        self.config = load_or_create_config(config_path)
+        self.started_at = time.time()
+        self.logs_path = self.config['logs_path']
+        os.makedirs(self.logs_path, exist_ok=True)
+
+        # Агент создается первой задачей, которой он нужен (свойство agent)
+        self._agent = None
+        self._agent_lock = threading.Lock()
+
+        from archive_watcher import ArchiveWatcher
+        watch_config = self.config['jobs']['watch']
+        self.watcher = ArchiveWatcher(watch_config.get('watch_dir', "./telegram_archives"),
+                                      stable_seconds=watch_config.get('stable_seconds', 10))
+
+        self.scheduler = JobScheduler(log_func=self.log_event)
+        self._control_socket = None
+        self._live_thread = None
+        self._live_stop = threading.Event()
+        self._live_segments = 0
+        self._register_jobs()
+
+    @property
+    def agent(self):
+        """SystemAgent (импорт и создание при первом обращении, как telethon в задачах)"""
+        with self._agent_lock:
+            if self._agent is None:
+                from agent import SystemAgent
+                self._agent = SystemAgent(server_ip=self.config['server_ip'],
+                                          server_port=self.config['server_port'],
+                                          servers=self.config['servers'],
+                                          spread_uploads=self.config['spread_uploads'])
+            return self._agent
+
+    def log_event(self, message, level="INFO"):
+        """Логирование событий демона"""
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        log_msg = f"[{timestamp}] [{level}] {message}"
+        print(log_msg)
+
+        log_file = f"{self.logs_path}/agent_{datetime.now().strftime('%Y%m%d')}.log"
+        try:
+            with open(log_file, "a", encoding="utf-8") as f:
+                f.write(log_msg + "\n")
+        except Exception as e:
+            print(f"❌ Ошибка записи лога: {e}")
+
+    def _register_jobs(self):
+        """Регистрация задач из конфигурации"""
+        handlers = {
+            "metrics": self.job_metrics,
+            "archive": self.job_archive,
+            "watch": self.job_watch,
+            "upload": self.job_upload,
+            "cleanup": self.job_cleanup
+        }
+
+        for name, job_config in self.config['jobs'].items():
+            if not job_config.get('enabled', True):
+                continue
+            if name not in handlers:
+                self.log_event(f"⚠️ Неизвестная задача в конфигурации: {name}", "WARNING")
+                continue
+
+            job = PeriodicJob(name, handlers[name],
+                              interval=job_config.get('interval', 60),
+                              jitter=job_config.get('jitter', 0),
+                              deadline=job_config.get('deadline'))
+            self.scheduler.add_job(job)
+            self.log_event(f"🗓️ Задача {name}: каждые {job.interval} сек (±{job.jitter}), дедлайн {job.deadline} сек")
+
+    def job_metrics(self):
+        """Задача: сбор и отправка метрик"""
+        if not self.agent.send_metrics():
+            raise RuntimeError("метрики не отправлены")
+
+    def job_archive(self):
+        """Задача: архивация каналов из конфигурации"""
+        job_config = self.config['jobs']['archive']
+        channels = job_config.get('channels', [])
+        if not channels:
+            return
+
+        from telegram_archiver import load_saved_credentials, sync_download_channels
+
+        api_id, api_hash = load_saved_credentials()
+        if not api_id or not api_hash:
+            raise RuntimeError("нет сохраненных учетных данных Telegram")
+
+        results = sync_download_channels(api_id, api_hash, channels, job_config.get('limit', 100),
+                                         job_config.get('max_parallel', 3),
+                                         volume_size=job_config.get('volume_size'),
+                                         open_volume_builder=self._volume_builder(job_config))
+        for result in results:
+            channel = result['channel']
+            if result['archive_path']:
+                self.log_event(f"📦 Канал {channel} заархивирован: {result['archive_path']} "
+                               f"(томов {len(result['volumes'])}, {result['messages']} сообщ., "
+                               f"{result['messages_per_sec']} сообщ/с)")
+            elif result['status'] == 'failed':
+                self.log_event(f"❌ Канал {channel}: ошибка скачивания: {result['error']}")
+            else:
+                self.log_event(f"ℹ️ Канал {channel}: нет новых сообщений")
+
+    def _volume_builder(self, job_config):
+        """Потоковая отправка томов на сервер во время сборки (stream: true), иначе zip на диске"""
+        return self.agent.open_stream_builder if job_config.get('stream') else None
+
+    def job_watch(self):
+        """Задача: поиск новых завершенных архивов"""
+        queued = self.watcher.scan()
+        if queued:
+            self.log_event(f"👀 Новых архивов в очереди: {len(queued)}")
+            self.scheduler.trigger("upload")
+
+    def job_upload(self):
+        """Задача: отправка архивов из очереди наблюдателя на сервер"""
+        upload_config = self.config['jobs']['upload']
+        sent, failed = self.watcher.ship_pending(send_many=lambda paths: self.agent.secure_send_files(
+            paths, upload_config.get('small_file_size'), upload_config.get('max_bundle_size'),
+            stream=upload_config.get('stream', False)))
+
+        if sent:
+            self.log_event(f"📤 Отправлено архивов: {sent}")
+        held = self.watcher.held_archives()
+        if held:
+            self.log_event(f"⚠️ Архивов с неизвестной доставкой (не повторяются): {len(held)}")
+        if failed:
+            raise RuntimeError(f"не удалось отправить архивов: {failed}")
+
+    def job_cleanup(self):
+        """Задача: удаление устаревших временных файлов"""
+        max_age_days = self.config['jobs']['cleanup'].get('max_age_days', 7)
+        cutoff = time.time() - max_age_days * 24 * 3600
+        cleaned = 0
+
+        for folder in (self.agent.temp_dir, self.agent.secure_temp_dir):
+            for entry in os.scandir(folder):
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    self.agent.secure_delete(entry.path)
+                    cleaned += 1
+
+        if cleaned:
+            self.log_event(f"🧹 Удалено устаревших файлов: {cleaned}")
+
+    def _live_loop(self):
+        """Живой режим: слушает чаты до остановки демона, после сбоя переподключается"""
+        from telegram_archiver import load_saved_credentials, sync_capture_live
+
+        live_config = self.config['live']
+        while not self._live_stop.is_set():
+            api_id, api_hash = load_saved_credentials()
+            if not api_id or not api_hash:
+                self.log_event("❌ Живой режим: нет сохраненных учетных данных Telegram", "ERROR")
+                return
+
+            try:
+                sync_capture_live(api_id, api_hash, live_config['chats'],
+                                  segment_seconds=live_config.get('segment_seconds', 300),
+                                  segment_bytes=live_config.get('segment_bytes', 67108864),
+                                  on_segment=self._on_live_segment, stop_event=self._live_stop,
+                                  open_volume_builder=self._volume_builder(live_config))
+            except Exception as e:
+                self.log_event(f"❌ Живой режим: {e}", "ERROR")
+
+            self._live_stop.wait(live_config.get('restart_delay', 30))
+
+    def _on_live_segment(self, archive_path):
+        """Сегмент живого режима закрыт - сразу ищем его наблюдателем (дальше задача upload)"""
+        self._live_segments += 1
+        self.log_event(f"📡 Сегмент живого режима: {os.path.basename(archive_path)}")
+        self.scheduler.trigger("watch")
+
+    def _start_live(self):
+        """Запуск живого режима в отдельном потоке (если включен)"""
+        live_config = self.config['live']
+        if not live_config.get('enabled') or not live_config.get('chats'):
+            return
+
+        self._live_thread = threading.Thread(target=self._live_loop, name="live")
+        self._live_thread.daemon = True
+        self._live_thread.start()
+        self.log_event(f"📡 Живой режим: {len(live_config['chats'])} чатов, "
+                       f"сегмент {live_config.get('segment_seconds', 300)} сек")
+
+    def status(self):
+        """Общее состояние демона"""
+        return {
+            "agent_id": self._agent.agent_id if self._agent else None,
+            "servers": self._agent.server_pool.status() if self._agent else [],
+            "pid": os.getpid(),
+            "uptime": round(time.time() - self.started_at, 1),
+            "upload_queue": self.watcher.queue.qsize(),
+            "upload_held": [os.path.basename(path) for path in self.watcher.held_archives()],
+            "live": {"running": bool(self._live_thread and self._live_thread.is_alive()),
+                     "segments": self._live_segments},
+            "jobs": self.scheduler.status()
+        }
+
+    def _handle_control(self, client_socket):
+        """Обработка команды управляющего сокета: status | run <job> | stop"""
+        try:
+            client_socket.settimeout(5)
+            command = client_socket.recv(1024).decode('utf-8').strip().split()
+
+            if not command or command[0] == 'status':
+                response = self.status()
+            elif command[0] == 'run' and len(command) > 1:
+                response = {"status": "success" if self.scheduler.trigger(command[1]) else "error",
+                            "job": command[1]}
+            elif command[0] == 'stop':
+                response = {"status": "success", "message": "stopping"}
+                self.stop()
+            else:
+                response = {"status": "error", "message": f"Неизвестная команда: {' '.join(command)}"}
+
+            client_socket.sendall(json.dumps(response, ensure_ascii=False).encode('utf-8'))
+        except Exception as e:
+            self.log_event(f"❌ Ошибка управляющего сокета: {e}", "ERROR")
+        finally:
+            client_socket.close()
+
+    def _control_loop(self):
+        """Цикл управляющего сокета"""
+        while self._control_socket:
+            try:
+                client_socket, _ = self._control_socket.accept()
+                self._handle_control(client_socket)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+
+    def _start_control_socket(self):
+        """Запуск управляющего сокета (только локальные подключения)"""
+        host = self.config['control_host']
+        port = self.config['control_port']
+
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server_socket.bind((host, port))
+        server_socket.listen(5)
+        server_socket.settimeout(1)
+        self._control_socket = server_socket
+
+        thread = threading.Thread(target=self._control_loop, name="control")
+        thread.daemon = True
+        thread.start()
+        self.log_event(f"🎛️ Управляющий сокет: {host}:{port}")
+
+    def stop(self, *args):
+        """Остановка демона (также обработчик SIGTERM/SIGINT)"""
+        self.log_event("🛑 Останавливаю демон...")
+        self._live_stop.set()
+        self.scheduler.stop()
+
+    def run(self):
+        """Запуск демона"""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        try:
+            self._start_control_socket()
+        except OSError as e:
+            self.log_event(f"⚠️ Управляющий сокет недоступен: {e}", "WARNING")
+
+        self._start_live()
+
+        self.log_event(f"✅ Демон запущен за {time.time() - self.started_at:.2f} сек")
+        try:
+            self.scheduler.run_forever()
+        finally:
+            if self._control_socket:
+                control_socket, self._control_socket = self._control_socket, None
+                control_socket.close()
+            if self._live_thread:
+                # Дожидаемся закрытия текущих сегментов
+                self._live_stop.set()
+                self._live_thread.join(timeout=60)
+            self.log_event("🔴 Демон остановлен")
+
+
+def query_daemon(command="status", host="127.0.0.1", port=9191):
+    """
+    Отправка команды работающему демону
+
+    Returns:
+        dict: Ответ демона
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.settimeout(5)
+    sock.connect((host, port))
+    sock.sendall(command.encode('utf-8'))
+
+    response = b""
+    while True:
+        chunk = sock.recv(4096)
+        if not chunk:
+            break
+        response += chunk
+    sock.close()
+
+    return json.loads(response.decode('utf-8'))
+
+
+def run_daemon(config_path="./agent_config.json"):
+    """Точка входа фонового режима"""
+    daemon = AgentDaemon(config_path)
+    daemon.run()
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] in ('status', 'run', 'stop'):
+        config = load_or_create_config("./agent_config.json")
+        print(json.dumps(query_daemon(" ".join(sys.argv[1:]),
+                                      config['control_host'], config['control_port']),
+                         ensure_ascii=False, indent=2))
+    else:
+        run_daemon(sys.argv[1] if len(sys.argv) > 1 else "./agent_config.json")
@@ -0,0 +1,215 @@
+"""
+Многотомные архивы канала
+Каждый том - самостоятельный zip (свои messages.ndjson/messages.txt, медиа
+своих сообщений и volume_manifest.json с диапазоном ID). Последний том
+дополнительно содержит channel_index.json со списком всех томов прохода.
+"""
+import os
+import re
+import json
+import shutil
+import hashlib
+from datetime import datetime
+from message_stream import MessageStreamWriter
+from zip_builder import StreamingZipBuilder
+
+VOLUME_MANIFEST = "volume_manifest.json"
+CHANNEL_INDEX = "channel_index.json"
+VOLUME_SIZE = 1024 * 1024 * 1024  # 1 GB
+
+_VOLUME_RE = re.compile(r"^(?P<base>.+)_vol(?P<number>\d{3,})\.zip$")
+
+
+def index_path_for(archive_path):
+    """Путь к локальному индексу канала по пути любого тома, None для обычного архива"""
+    match = _VOLUME_RE.match(os.path.basename(archive_path))
+    if not match:
+        return None
+    return os.path.join(os.path.dirname(archive_path), f"{match.group('base')}_index.json")
+
+
+def volume_paths(archive_path):
+    """Все тома прохода по пути одного из них (для обычного архива - он сам)"""
+    index_path = index_path_for(archive_path)
+    if not index_path or not os.path.exists(index_path):
+        return [archive_path]
+    with open(index_path, 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    folder = os.path.dirname(archive_path)
+    return [os.path.join(folder, volume['archive']) for volume in index['volumes']]
+
+
+def _file_sha256(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class VolumeArchiveWriter:
+    def __init__(self, download_path, channel_folder, safe_name, channel_info, run_id,
+                 volume_size=VOLUME_SIZE, pool=None, closed_volumes=None, on_volume=None,
+                 open_builder=None):
+        """
+        Начало записи томов
+
+        Args:
+            download_path: Папка, куда кладутся готовые тома
+            channel_folder: Папка канала (временные файлы томов - в volumes/)
+            safe_name: Имя папки канала внутри архивов
+            channel_info: Данные канала для заголовков и манифестов
+            run_id: Идентификатор прохода (общий для всех томов)
+            volume_size: Предельный размер тома (байт), None - без ограничения
+            pool: Общий пул процессов сжатия
+            closed_volumes: Тома, уже закрытые до сбоя (при продолжении прохода)
+            on_volume: Функция (info), вызываемая после закрытия тома
+            open_builder: Функция (archive_path, pool=...) -> сборщик тома
+                          (по умолчанию StreamingZipBuilder - zip на диске)
+        """
+        self.download_path = download_path
+        self.channel_folder = channel_folder
+        self.safe_name = safe_name
+        self.channel_info = channel_info
+        self.run_id = run_id
+        self.volume_size = volume_size
+        self.pool = pool
+        self.on_volume = on_volume
+        self.open_builder = open_builder or StreamingZipBuilder
+        self.base_name = f"{channel_info['channel_name']}_{run_id}".replace(' ', '_')
+        self.volumes = list(closed_volumes or [])
+        self._full = False
+        self._open_volume()
+
+    def _open_volume(self):
+        self.number = len(self.volumes) + 1
+        self.archive_name = f"{self.base_name}_vol{self.number:03d}.zip"
+        self.folder = os.path.join(self.channel_folder, "volumes", f"{self.number:03d}")
+
+        # Остатки тома, не закрытого до сбоя
+        shutil.rmtree(self.folder, ignore_errors=True)
+        os.makedirs(self.folder)
+
+        info = dict(self.channel_info, run_id=self.run_id, volume=self.number)
+        self._writer = MessageStreamWriter(self.folder, info)
+        self._builder = self.open_builder(os.path.join(self.download_path, self.archive_name), pool=self.pool)
+        self._media_bytes = 0
+        self._full = False
+
+    @property
+    def size(self):
+        """Примерный размер текущего тома (медиа + сообщения, до сжатия)"""
+        return self._media_bytes + self._writer.bytes_written
+
+    def would_overflow(self, pending_bytes):
+        """Переполнит ли том очередная пачка сообщений"""
+        return bool(self.volume_size) and self.size + pending_bytes >= self.volume_size
+
+    def _rotate_if_full(self):
+        if self._full:
+            self._close_volume()
+            self._open_volume()
+
+    def add_media(self, file_path, arcname):
+        """Медиа сообщения текущего тома"""
+        self._rotate_if_full()
+        if self._builder.add_file(file_path, arcname):
+            self._media_bytes += os.path.getsize(file_path)
+
+    def write_messages(self, messages):
+        """Сообщения пачки (их медиа уже добавлены)"""
+        self._rotate_if_full()
+        for msg in messages:
+            self._writer.write(msg)
+
+    def checkpoint(self):
+        """
+        Граница пачки: если том заполнен, следующая пачка пойдет в новый том
+
+        Сам том закрывается при поступлении следующих данных, чтобы последний
+        том прохода никогда не оказался пустым.
+        """
+        if self.volume_size and self._writer.total_messages and self.size >= self.volume_size:
+            self._full = True
+
+    def _close_volume(self, final=False):
+        totals = self._writer.close()
+        manifest = dict(self.channel_info, run_id=self.run_id, volume=self.number,
+                        created=datetime.now().isoformat(), **totals)
+        if final:
+            manifest['final'] = True
+            manifest['total_volumes'] = self.number
+
+        manifest_path = os.path.join(self.folder, VOLUME_MANIFEST)
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        for path in (self._writer.ndjson_path, self._writer.text_path, manifest_path):
+            self._builder.add_file(path, f"{self.safe_name}/{os.path.basename(path)}")
+
+        if final:
+            # Индекс канала кладем в последний том, чтобы ПК1 знал, сколько томов ждать
+            index_path = os.path.join(self.folder, CHANNEL_INDEX)
+            with open(index_path, 'w', encoding='utf-8') as f:
+                json.dump(self._index(pending=manifest), f, ensure_ascii=False, indent=2)
+            self._builder.add_file(index_path, f"{self.safe_name}/{CHANNEL_INDEX}")
+
+        archive_path = self._builder.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+        info = {
+            'volume': self.number,
+            'archive': self.archive_name,
+            'min_id': totals['min_id'],
+            'max_id': totals['max_id'],
+            'messages': totals['total_messages'],
+            'media': totals['media_count']
+        }
+        if getattr(self._builder, 'uploaded', False):
+            # Том ушел на сервер потоком - локального файла нет
+            info.update(size=self._builder.size, sha256=self._builder.sha256, uploaded=True)
+        else:
+            info.update(size=os.path.getsize(archive_path), sha256=_file_sha256(archive_path))
+        self.volumes.append(info)
+        if self.on_volume:
+            self.on_volume(info)
+
+        print(f"  📚 Том {self.number} закрыт: {self.archive_name} ({info['size'] // 1024} KB, "
+              f"{info['messages']} сообщений, ID {info['min_id']}-{info['max_id']})")
+        return info
+
+    def _index(self, pending=None):
+        volumes = [dict(volume) for volume in self.volumes]
+        if pending:
+            # Последний том еще пишется - его размер и хэш неизвестны
+            volumes.append({
+                'volume': pending['volume'],
+                'archive': self.archive_name,
+                'min_id': pending['min_id'],
+                'max_id': pending['max_id'],
+                'messages': pending['total_messages'],
+                'media': pending['media_count']
+            })
+        return dict(self.channel_info, run_id=self.run_id, total_volumes=len(volumes), volumes=volumes,
+                    total_messages=sum(volume['messages'] for volume in volumes))
+
+    def finish(self):
+        """
+        Закрытие последнего тома и запись локального индекса канала
+
+        Returns:
+            list: Пути ко всем томам прохода (отправленных потоком на диске нет)
+        """
+        self._close_volume(final=True)
+
+        index_path = os.path.join(self.download_path, f"{self.base_name}_index.json")
+        with open(index_path, 'w', encoding='utf-8') as f:
+            json.dump(self._index(), f, ensure_ascii=False, indent=2)
+
+        shutil.rmtree(os.path.join(self.channel_folder, "volumes"), ignore_errors=True)
+        return [os.path.join(self.download_path, volume['archive']) for volume in self.volumes]
+
+    def abort(self):
+        """Отмена текущего тома (закрытые тома остаются)"""
+        self._writer.abort()
+        self._builder.abort()
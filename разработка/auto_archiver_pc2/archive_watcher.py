@@ -0,0 +1,249 @@
+"""
+Наблюдатель за папкой архивов ПК2
+Находит новые завершенные архивы и ставит их в очередь на отправку
+"""
+import json
+import os
+import time
+import queue
+import threading
+import zipfile
+from server_pool import DELIVERY_UNKNOWN
+
+# Расширения недописанных файлов (архиватор пишет во временный файл и переименовывает)
+PARTIAL_SUFFIXES = ('.part', '.tmp')
+
+
+class ArchiveWatcher:
+    def __init__(self, watch_dir="./telegram_archives", index_file=None,
+                 suffix=".zip", stable_seconds=10):
+        """
+        Инициализация наблюдателя
+
+        Args:
+            watch_dir: Папка с архивами
+            index_file: Файл индекса (по умолчанию .<папка>.watch_index.json рядом
+                        с watch_dir: запись индекса внутри папки меняла бы ее mtime
+                        и каждый скан заново читал бы листинг)
+            suffix: Расширение отслеживаемых файлов
+            stable_seconds: Сколько секунд размер/mtime должны не меняться,
+                            чтобы файл считался дописанным
+        """
+        self.watch_dir = watch_dir
+        watch_path = os.path.abspath(watch_dir)
+        self.index_file = index_file or os.path.join(
+            os.path.dirname(watch_path), f".{os.path.basename(watch_path)}.watch_index.json")
+        self.suffix = suffix
+        self.stable_seconds = stable_seconds
+        self.queue = queue.Queue()
+        self._lock = threading.Lock()
+
+        os.makedirs(watch_dir, exist_ok=True)
+        self.index = self._load_index()
+
+        # Архивы, поставленные в очередь в прошлом запуске, но не отправленные
+        for name, entry in self.index['files'].items():
+            if entry['state'] == 'queued':
+                self.queue.put(os.path.join(self.watch_dir, name))
+
+        # Еще не стабилизировавшиеся архивы - только их скан проверяет через stat()
+        self._pending = {name for name, entry in self.index['files'].items() if entry['state'] == 'new'}
+
+    def _load_index(self):
+        """Загрузка индекса mtime/size с диска"""
+        index_file = self.index_file
+        old_index_file = os.path.join(self.watch_dir, ".watch_index.json")
+        if not os.path.exists(index_file) and os.path.exists(old_index_file):
+            # Индекс прежних версий лежал внутри папки - переносим его наружу
+            index_file = old_index_file
+
+        if os.path.exists(index_file):
+            try:
+                with open(index_file, 'r', encoding='utf-8') as f:
+                    index = json.load(f)
+                index.setdefault('dir_mtime_ns', None)
+                index.setdefault('files', {})
+                if index_file != self.index_file:
+                    index['dir_mtime_ns'] = None
+                    self.index = index
+                    self._save_index()
+                    os.remove(old_index_file)
+                return index
+            except Exception as e:
+                print(f"⚠️ Индекс архивов поврежден, пересоздаю: {e}")
+
+        return {'dir_mtime_ns': None, 'files': {}}
+
+    def _save_index(self):
+        """Атомарное сохранение индекса"""
+        tmp_file = self.index_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, ensure_ascii=False)
+        os.replace(tmp_file, self.index_file)
+
+    def _is_candidate(self, name):
+        """Подходит ли имя файла для отслеживания"""
+        return name.endswith(self.suffix) and not name.endswith(PARTIAL_SUFFIXES)
+
+    def scan(self):
+        """
+        Инкрементальное сканирование папки
+
+        Листинг папки выполняется только если изменился mtime самой папки,
+        stat() вызывается только для файлов из набора ожидающих (новые и еще
+        не стабилизировавшиеся), так что проход стоит O(изменений).
+
+        Returns:
+            list: Пути архивов, поставленных в очередь в этом проходе
+        """
+        with self._lock:
+            now = time.time()
+            files = self.index['files']
+            changed = False
+
+            dir_mtime_ns = os.stat(self.watch_dir).st_mtime_ns
+            if dir_mtime_ns != self.index['dir_mtime_ns']:
+                names = {name for name in os.listdir(self.watch_dir) if self._is_candidate(name)}
+
+                # Удаленные файлы (например, после безопасного удаления при отправке)
+                for name in set(files) - names:
+                    del files[name]
+                    self._pending.discard(name)
+                    changed = True
+
+                for name in names - set(files):
+                    files[name] = {'size': None, 'mtime': None, 'stable_since': now, 'state': 'new'}
+                    self._pending.add(name)
+                    changed = True
+
+                # Свежий mtime не кэшируем: файл, созданный в тот же тик часов,
+                # не изменил бы его и остался бы незамеченным
+                recent = now - dir_mtime_ns / 1e9 < 2
+                self.index['dir_mtime_ns'] = None if recent else dir_mtime_ns
+
+            queued = []
+            for name in sorted(self._pending):
+                entry = files[name]
+                path = os.path.join(self.watch_dir, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+
+                if (st.st_size, st.st_mtime) != (entry['size'], entry['mtime']):
+                    entry.update(size=st.st_size, mtime=st.st_mtime, stable_since=now)
+                    changed = True
+                    continue
+
+                if now - entry['stable_since'] < self.stable_seconds:
+                    continue
+
+                # Размер не меняется - проверяем, что zip дописан до конца
+                if self.suffix == '.zip' and not zipfile.is_zipfile(path):
+                    entry['stable_since'] = now
+                    continue
+
+                entry['state'] = 'queued'
+                self._pending.discard(name)
+                self.queue.put(path)
+                queued.append(path)
+                changed = True
+
+            if changed:
+                self._save_index()
+
+            return queued
+
+    def _set_state(self, path, state):
+        with self._lock:
+            name = os.path.basename(path)
+            entry = self.index['files'].get(name)
+            if entry:
+                entry['state'] = state
+                self._pending.discard(name)
+                self._save_index()
+
+    def mark_shipped(self, path):
+        """Архив успешно отправлен"""
+        self._set_state(path, 'shipped')
+
+    def mark_unknown(self, path):
+        """
+        Архив отправлен, но ответ сервера не получен - архив отложен:
+        в очередь он больше не ставится, иначе повтор дал бы дубликат
+        (после проверки на сервере - mark_shipped или mark_failed)
+        """
+        self._set_state(path, DELIVERY_UNKNOWN)
+
+    def held_archives(self):
+        """Архивы с неизвестной доставкой"""
+        with self._lock:
+            return sorted(os.path.join(self.watch_dir, name)
+                          for name, entry in self.index['files'].items()
+                          if entry['state'] == DELIVERY_UNKNOWN)
+
+    def mark_failed(self, path):
+        """Отправка не удалась - архив будет снова поставлен в очередь при следующем скане"""
+        with self._lock:
+            name = os.path.basename(path)
+            entry = self.index['files'].get(name)
+            if entry:
+                entry.update(state='new', stable_since=time.time())
+                self._pending.add(name)
+                self._save_index()
+
+    def drain(self):
+        """Извлечение всех архивов из очереди"""
+        paths = []
+        while True:
+            try:
+                paths.append(self.queue.get_nowait())
+            except queue.Empty:
+                return paths
+
+    def pending_archives(self):
+        """Список завершенных, но еще не отправленных архивов"""
+        self.scan()
+        with self._lock:
+            return sorted(os.path.join(self.watch_dir, name)
+                          for name, entry in self.index['files'].items()
+                          if entry['state'] == 'queued')
+
+    def ship_pending(self, send_func=None, send_many=None):
+        """
+        Отправка всех архивов из очереди
+
+        Args:
+            send_func: Функция отправки одного файла (path) -> bool
+            send_many: Функция отправки списка файлов (paths) -> {path: bool},
+                       позволяет упаковывать мелкие архивы в общий пакет
+            Результат DELIVERY_UNKNOWN откладывает архив (mark_unknown)
+
+        Returns:
+            tuple: (отправлено, ошибок); отложенные архивы - held_archives()
+        """
+        self.scan()
+        paths = []
+        for path in self.drain():
+            entry = self.index['files'].get(os.path.basename(path))
+            if entry and entry['state'] == 'queued' and os.path.exists(path):
+                paths.append(path)
+
+        if send_many:
+            results = send_many(paths) if paths else {}
+        else:
+            results = {path: send_func(path) for path in paths}
+
+        sent = failed = 0
+        for path in paths:
+            result = results.get(path)
+            if result == DELIVERY_UNKNOWN:
+                self.mark_unknown(path)
+                print(f"⚠️ Доставка {os.path.basename(path)} неизвестна - архив отложен")
+            elif result:
+                self.mark_shipped(path)
+                sent += 1
+            else:
+                self.mark_failed(path)
+                failed += 1
+        return sent, failed
@@ -0,0 +1,212 @@
+"""
+Криптографический движок агента ПК2
+Кэширует объекты шифра и шифрует большие буферы параллельно по кускам.
+
+Каждый кусок - отдельный токен Fernet, поэтому в начало его открытого
+текста пишется заголовок: случайный nonce буфера, номер куска и число
+кусков. Подмена порядка, потеря, обрезка или вставка кусков из другого
+буфера обнаруживаются при расшифровке.
+"""
+import os
+import time
+import struct
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from cryptography.fernet import Fernet
+
+# Заголовки формата данных
+LEGACY_HEADER = b"ENCRYPTED::"      # один Fernet токен
+CHUNKED_HEADER = b"CHUNKED_V2::"    # Fernet токены кусков с заголовком, разделенные b"\n"
+UNSAFE_CHUNKED_HEADER = b"CHUNKED::"  # старые куски без заголовка - не принимаются
+
+# Заголовок открытого текста куска: nonce буфера, номер куска, число кусков
+CHUNK_PREFIX = struct.Struct('>16sII')
+
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Шифр рабочего процесса (создается один раз при старте процесса пула)
+_worker_cipher = None
+
+
+def _process_context():
+    """
+    Способ запуска процессов пула без fork
+
+    Шифрование вызывают из потоков демона и сборки архива: fork
+    многопоточного процесса копирует блокировки, занятые другими потоками,
+    и процессы пула могут зависнуть. forkserver (или spawn, где его нет)
+    запускает их с чистого состояния.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _init_worker(key):
+    global _worker_cipher
+    _worker_cipher = Fernet(key)
+
+
+def _encrypt_sealed(item):
+    prefix, chunk = item
+    return _worker_cipher.encrypt(prefix + chunk)
+
+
+def open_chunks(cipher, tokens):
+    """
+    Расшифровка кусков формата CHUNKED_V2 с проверкой заголовков
+
+    Raises:
+        ValueError: Куски переставлены, потеряны или взяты из другого буфера
+    """
+    nonce = None
+    parts = []
+    for index, token in enumerate(tokens):
+        plain = cipher.decrypt(token)
+        if len(plain) < CHUNK_PREFIX.size:
+            raise ValueError("кусок короче заголовка")
+        chunk_nonce, chunk_index, total = CHUNK_PREFIX.unpack_from(plain)
+        if nonce is None:
+            nonce = chunk_nonce
+        if chunk_nonce != nonce or chunk_index != index or total != len(tokens):
+            raise ValueError(f"кусок {index}: нарушен порядок или состав кусков")
+        parts.append(plain[CHUNK_PREFIX.size:])
+    return b"".join(parts)
+
+
+class CryptoEngine:
+    def __init__(self, key=None, chunk_size=DEFAULT_CHUNK_SIZE, workers=None, use_processes=True):
+        """
+        Инициализация движка
+
+        Args:
+            key: Ключ Fernet (None - шифрование отключено)
+            chunk_size: Размер независимо шифруемого куска (байт)
+            workers: Размер пула (по умолчанию - число ядер)
+            use_processes: Пул процессов (True) или потоков (False)
+        """
+        self.chunk_size = chunk_size
+        self.workers = workers or os.cpu_count() or 1
+        self.use_processes = use_processes
+        self._ciphers = {}
+        self._pool = None
+        self._pool_key = None
+        self.key = key
+
+    @property
+    def key(self):
+        return self._key
+
+    @key.setter
+    def key(self, key):
+        """Смена ключа (пул, привязанный к старому ключу, закрывается)"""
+        self._key = key
+        if self._pool is not None and self._pool_key != key:
+            self.shutdown()
+
+    def cipher(self, key=None):
+        """Кэшированный объект Fernet для ключа"""
+        key = key or self._key
+        cipher = self._ciphers.get(key)
+        if cipher is None:
+            cipher = self._ciphers[key] = Fernet(key)
+        return cipher
+
+    def _get_pool(self, workers=None):
+        """Пул рабочих, инициализированных текущим ключом"""
+        workers = workers or self.workers
+        if self._pool is None:
+            if self.use_processes:
+                self._pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                 initargs=(self._key,), mp_context=_process_context())
+            else:
+                _init_worker(self._key)
+                self._pool = ThreadPoolExecutor(max_workers=workers)
+            self._pool_key = self._key
+        return self._pool
+
+    def shutdown(self):
+        """Остановка пула рабочих"""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+            self._pool_key = None
+
+    def _split(self, data):
+        return [data[i:i + self.chunk_size] for i in range(0, len(data), self.chunk_size)]
+
+    def encrypt(self, data):
+        """
+        Шифрование буфера
+
+        Буфер не больше одного куска шифруется одним токеном в старом формате,
+        большие буферы - по кускам в пуле с сохранением порядка кусков.
+        """
+        if len(data) <= self.chunk_size or self.workers == 1:
+            return LEGACY_HEADER + self.cipher().encrypt(data)
+
+        chunks = self._split(data)
+        nonce = os.urandom(16)
+        items = [(CHUNK_PREFIX.pack(nonce, index, len(chunks)), chunk) for index, chunk in enumerate(chunks)]
+        tokens = self._get_pool().map(_encrypt_sealed, items)
+        return CHUNKED_HEADER + b"\n".join(tokens)
+
+    def decrypt(self, data, key=None):
+        """Расшифровка данных любого из форматов"""
+        if data.startswith(CHUNKED_HEADER):
+            tokens = data[len(CHUNKED_HEADER):].split(b"\n")
+            return open_chunks(self.cipher(key), tokens)
+        if data.startswith(UNSAFE_CHUNKED_HEADER):
+            raise ValueError("формат CHUNKED:: без проверки порядка кусков не поддерживается")
+
+        if data.startswith(LEGACY_HEADER):
+            data = data[len(LEGACY_HEADER):]
+        return self.cipher(key).decrypt(data)
+
+    def benchmark(self, size_mb=64, max_workers=None):
+        """
+        Замер пропускной способности шифрования
+
+        Args:
+            size_mb: Объем тестовых данных (МБ)
+            max_workers: Максимальное число рабочих (по умолчанию - число ядер)
+
+        Returns:
+            list: [{'workers', 'seconds', 'mb_per_sec', 'mb_per_sec_per_core'}, ...]
+        """
+        data = os.urandom(size_mb * 1024 * 1024)
+        max_workers = max_workers or os.cpu_count() or 1
+        saved_workers = self.workers
+        results = []
+
+        try:
+            workers = 1
+            while True:
+                self.shutdown()
+                self.workers = workers
+                if workers > 1:
+                    # Прогрев пула, чтобы не мерить запуск процессов
+                    warmup = (CHUNK_PREFIX.pack(bytes(16), 0, 1), b"warmup")
+                    list(self._get_pool(workers).map(_encrypt_sealed, [warmup] * workers))
+
+                started = time.perf_counter()
+                encrypted = self.encrypt(data)
+                seconds = time.perf_counter() - started
+
+                if self.decrypt(encrypted) != data:
+                    raise ValueError("данные не совпадают после расшифровки")
+
+                results.append({
+                    'workers': workers,
+                    'seconds': seconds,
+                    'mb_per_sec': size_mb / seconds,
+                    'mb_per_sec_per_core': size_mb / seconds / workers
+                })
+
+                if workers >= max_workers:
+                    break
+                workers = min(workers * 2, max_workers)
+        finally:
+            self.shutdown()
+            self.workers = saved_workers
+
+        return results
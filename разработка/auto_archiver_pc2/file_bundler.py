@@ -0,0 +1,97 @@
+"""
+Упаковка мелких файлов в один пакет для отправки на ПК1
+Пакет - zip с внутренним манифестом (имя, размер, SHA256 каждого файла)
+"""
+import io
+import json
+import os
+import hashlib
+import zipfile
+
+MANIFEST_NAME = "__bundle_manifest__.json"
+BUNDLE_VERSION = 1
+
+SMALL_FILE_SIZE = 1024 * 1024          # Файлы меньше этого размера идут в пакеты
+MAX_BUNDLE_SIZE = 32 * 1024 * 1024     # Предельный суммарный размер пакета
+
+# Уже сжатые форматы храним без повторного сжатия
+STORED_EXTENSIONS = {'.zip', '.gz', '.bz2', '.xz', '.7z', '.rar', '.jpg', '.jpeg',
+                     '.png', '.gif', '.webp', '.mp4', '.mp3', '.ogg', '.enc'}
+
+
+def plan_bundles(file_paths, small_file_size=None, max_bundle_size=None):
+    """
+    Разбиение списка файлов на пакеты мелких файлов и одиночные крупные файлы
+
+    Returns:
+        tuple: (список пакетов [[путь, ...], ...], список одиночных файлов)
+    """
+    small_file_size = small_file_size or SMALL_FILE_SIZE
+    max_bundle_size = max_bundle_size or MAX_BUNDLE_SIZE
+
+    bundles = []
+    singles = []
+    current = []
+    current_size = 0
+
+    for path in file_paths:
+        size = os.path.getsize(path)
+        if size >= small_file_size:
+            singles.append(path)
+            continue
+
+        if current and current_size + size > max_bundle_size:
+            bundles.append(current)
+            current, current_size = [], 0
+
+        current.append(path)
+        current_size += size
+
+    if current:
+        bundles.append(current)
+
+    return bundles, singles
+
+
+def pack_bundle(file_paths):
+    """
+    Упаковка файлов в пакет
+
+    Returns:
+        tuple: (байты пакета, манифест)
+    """
+    manifest = {'bundle_version': BUNDLE_VERSION, 'files': []}
+    used_names = set()
+    buffer = io.BytesIO()
+
+    with zipfile.ZipFile(buffer, 'w') as zipf:
+        for path in file_paths:
+            with open(path, 'rb') as f:
+                data = f.read()
+
+            # Одинаковые имена из разных папок разводим суффиксом
+            name = os.path.basename(path)
+            base, ext = os.path.splitext(name)
+            counter = 1
+            while name in used_names or name == MANIFEST_NAME:
+                name = f"{base}_{counter}{ext}"
+                counter += 1
+            used_names.add(name)
+
+            compress_type = zipfile.ZIP_STORED if ext.lower() in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+            zipf.writestr(name, data, compress_type=compress_type)
+
+            manifest['files'].append({
+                'name': name,
+                'path': path,
+                'size': len(data),
+                'sha256': hashlib.sha256(data).hexdigest()
+            })
+
+        # Путь на ПК2 серверу не нужен
+        zipf.writestr(MANIFEST_NAME, json.dumps({
+            'bundle_version': BUNDLE_VERSION,
+            'files': [{k: v for k, v in entry.items() if k != 'path'} for entry in manifest['files']]
+        }, ensure_ascii=False))
+
+    return buffer.getvalue(), manifest
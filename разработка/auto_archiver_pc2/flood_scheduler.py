@@ -0,0 +1,67 @@
+"""
+Планировщик запросов к Telegram для одного аккаунта
+Общий лимит запросов в секунду (token bucket) и общая пауза после FloodWait:
+Telegram штрафует аккаунт целиком, а не отдельный канал
+"""
+import asyncio
+import time
+
+
+class FloodWaitScheduler:
+    def __init__(self, requests_per_second=3.0, burst=5):
+        """
+        Инициализация планировщика
+
+        Args:
+            requests_per_second: Средний допустимый темп запросов аккаунта
+            burst: Сколько запросов можно сделать подряд без ожидания
+        """
+        self.rate = requests_per_second
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0
+        self._lock = asyncio.Lock()
+
+        self.stats = {
+            "requests": 0,
+            "throttled_seconds": 0.0,
+            "flood_waits": 0,
+            "flood_wait_seconds": 0
+        }
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """Ожидание права на следующий запрос"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+
+                # После FloodWait ждут все каналы аккаунта
+                if now < self._blocked_until:
+                    delay = self._blocked_until - now
+                else:
+                    self._refill(now)
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        self.stats["requests"] += 1
+                        return
+                    delay = (1 - self._tokens) / self.rate
+
+                self.stats["throttled_seconds"] += delay
+                await asyncio.sleep(delay)
+
+    def penalize(self, seconds):
+        """Учет FloodWait: приостанавливаем все запросы аккаунта"""
+        self.stats["flood_waits"] += 1
+        self.stats["flood_wait_seconds"] += seconds
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    @property
+    def blocked_for(self):
+        """Сколько секунд осталось до снятия паузы"""
+        return max(self._blocked_until - time.monotonic(), 0)
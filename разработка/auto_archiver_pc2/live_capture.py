@@ -0,0 +1,223 @@
+"""
+Живой режим Telegram архиватора
+Новые и отредактированные сообщения приходят событиями Telethon и пишутся
+в текущий сегмент чата; сегмент закрывается по времени или размеру и
+превращается в обычный zip-архив, который подхватывает отправка на ПК1
+"""
+import os
+import time
+import asyncio
+import shutil
+from datetime import datetime
+from media_cache import media_key
+from media_downloader import MediaDownloadPool
+from message_stream import MessageStreamWriter
+from sync_state import ChannelSyncState
+from zip_builder import StreamingZipBuilder
+
+SEGMENT_SECONDS = 300
+SEGMENT_BYTES = 64 * 1024 * 1024
+
+
+def raw_peer_id(peer):
+    """ID канала/чата/пользователя из Peer* без учета префикса -100"""
+    for attr in ('channel_id', 'chat_id', 'user_id'):
+        value = getattr(peer, attr, None)
+        if value:
+            return value
+    return None
+
+
+class LiveSegment:
+    def __init__(self, download_path, chat, pool=None, open_builder=None):
+        """
+        Открытие сегмента чата
+
+        Args:
+            download_path: Папка архиватора (готовые сегменты кладутся туда же, что и архивы)
+            chat: Описание чата (name, safe_name, id, sequence)
+            pool: Общий пул процессов сжатия
+            open_builder: Функция (archive_path, pool=...) -> сборщик архива
+        """
+        # Номер сегмента в имени: при ротации по размеру за секунду может закрыться несколько
+        chat['sequence'] += 1
+        self.segment_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{chat['sequence']:04d}"
+        self.opened = time.time()
+        self.folder = f"{download_path}/live/{chat['safe_name']}/{self.segment_id}"
+        self.media_folder = f"{self.folder}/media"
+        self.media_arcdir = f"{chat['safe_name']}/media"
+        self.safe_name = chat['safe_name']
+        self.min_new_id = 0
+        self.max_new_id = 0
+        self._media_bytes = 0
+        os.makedirs(self.folder, exist_ok=True)
+
+        self.writer = MessageStreamWriter(self.folder, {
+            'channel_name': chat['name'],
+            'channel_link': chat['name'],
+            'channel_id': chat['id'],
+            'capture': 'live',
+            'segment_id': self.segment_id
+        })
+        archive_name = f"{chat['name']}_live_{self.segment_id}.zip".replace(' ', '_')
+        self.builder = (open_builder or StreamingZipBuilder)(f"{download_path}/{archive_name}", pool=pool)
+
+    @property
+    def size(self):
+        return self._media_bytes + self.writer.bytes_written
+
+    def add_media(self, file_path, arcname):
+        if self.builder.add_file(file_path, arcname):
+            self._media_bytes += os.path.getsize(file_path)
+
+    def write(self, msg):
+        self.writer.write(msg)
+        if msg.get('event') == 'new':
+            self.min_new_id = min(self.min_new_id, msg['id']) if self.min_new_id else msg['id']
+            self.max_new_id = max(self.max_new_id, msg['id'])
+
+    def close(self):
+        """
+        Закрытие сегмента и сборка архива (блокирующий вызов)
+
+        Returns:
+            tuple: (путь к архиву, итоги сегмента)
+        """
+        totals = self.writer.close()
+        for path in (self.writer.ndjson_path, self.writer.text_path):
+            self.builder.add_file(path, f"{self.safe_name}/{os.path.basename(path)}")
+        archive_path = self.builder.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+        return archive_path, totals
+
+    def abort(self):
+        self.writer.abort()
+        self.builder.abort()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+
+class LiveCapture:
+    def __init__(self, archiver, entities, segment_seconds=SEGMENT_SECONDS,
+                 segment_bytes=SEGMENT_BYTES, on_segment=None):
+        """
+        Инициализация живого режима
+
+        Args:
+            archiver: Подключенный TelegramArchiver (клиент, кэш медиа, планировщик)
+            entities: Каналы/чаты для наблюдения
+            segment_seconds: Максимальная длительность сегмента (сек)
+            segment_bytes: Максимальный размер сегмента (байт)
+            on_segment: Функция (archive_path), вызываемая после закрытия сегмента
+                        (если сегмент сохранен на диск)
+        """
+        self.archiver = archiver
+        self.segment_seconds = segment_seconds
+        self.segment_bytes = segment_bytes
+        self.on_segment = on_segment
+        # Сеанс: диапазоны живого режима сливаются в состоянии только внутри одного запуска
+        self.session_id = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+
+        self.chats = {}
+        for entity in entities:
+            name = getattr(entity, 'title', None) or getattr(entity, 'username', None) or str(entity.id)
+            self.chats[entity.id] = {
+                'id': entity.id,
+                'name': name,
+                'safe_name': "".join(c for c in name if c.isalnum() or c in (' ', '_')).rstrip(),
+                'segment': None,
+                'sequence': 0
+            }
+
+        self.media_pool = MediaDownloadPool(
+            archiver.client,
+            concurrency=archiver.media_concurrency,
+            retries=archiver.media_retries,
+            scheduler=archiver.scheduler
+        )
+        self.stats = {"new": 0, "edited": 0, "segments": 0, "latency_sum": 0.0}
+
+    async def handle(self, message, edited=False):
+        """Обработка события NewMessage/MessageEdited"""
+        chat = self.chats.get(raw_peer_id(message.peer_id))
+        if chat is None:
+            return
+
+        msg_data, ext = self.archiver._message_record(message)
+        msg_data['event'] = 'edited' if edited else 'new'
+        if edited and getattr(message, 'edit_date', None):
+            msg_data['edit_date'] = message.edit_date.isoformat()
+
+        # Медиа скачиваем до записи: в сегмент сообщение попадает уже со ссылкой на файл
+        sha256 = None
+        if ext:
+            cache = self.archiver.media_cache
+            key = media_key(message.media)
+            sha256 = cache.lookup(key)
+            if not sha256:
+                path = cache.incoming_path(f"live_{chat['id']}_{message.id}_{int(time.time() * 1000)}.{ext}")
+                task = await self.media_pool.submit(message.media, path, msg_data)
+                if await task:
+                    sha256 = cache.store(key, path)
+
+        # Дальше без await: сегмент не может смениться между медиа и сообщением
+        segment = chat['segment']
+        if segment is None:
+            segment = chat['segment'] = LiveSegment(self.archiver.download_path, chat,
+                                                    self.archiver._get_compress_pool(),
+                                                    self.archiver.open_volume_builder)
+            print(f"🟢 Новый сегмент {chat['name']}: {segment.segment_id}")
+        if sha256:
+            self.archiver._attach_cached_media(msg_data, sha256, segment.media_folder,
+                                               segment, segment.media_arcdir)
+        segment.write(msg_data)
+
+        self.stats['edited' if edited else 'new'] += 1
+        if message.date:
+            self.stats['latency_sum'] += max(time.time() - message.date.timestamp(), 0)
+
+        if segment.size >= self.segment_bytes:
+            await self.rotate(chat)
+
+    async def rotate(self, chat):
+        """Закрытие текущего сегмента чата и публикация архива"""
+        segment, chat['segment'] = chat['segment'], None
+        if segment is None:
+            return None
+
+        loop = asyncio.get_running_loop()
+        archive_path, totals = await loop.run_in_executor(None, segment.close)
+        self.archiver.media_cache.save()
+        self.stats['segments'] += 1
+
+        # Пойманные сообщения не нужно скачивать повторно при обычной синхронизации,
+        # но курсор истории сдвигается, только если до них уже нет пропуска
+        if segment.max_new_id:
+            sync_state = ChannelSyncState(self.archiver.sync_state_path, chat['id'])
+            sync_state.record_live(self.session_id, segment.min_new_id, segment.max_new_id)
+
+        print(f"📦 Сегмент {chat['name']} закрыт: {os.path.basename(archive_path)} "
+              f"({totals['total_messages']} сообщений)")
+        # Сегмент, отправленный потоком, на диске не остается - отправлять нечего
+        if self.on_segment and os.path.exists(archive_path):
+            await loop.run_in_executor(None, self.on_segment, archive_path)
+        return archive_path
+
+    async def rotate_expired(self):
+        """Закрытие сегментов старше segment_seconds"""
+        now = time.time()
+        for chat in self.chats.values():
+            segment = chat['segment']
+            if segment and now - segment.opened >= self.segment_seconds:
+                await self.rotate(chat)
+
+    async def run(self, stop_event):
+        """Проверка сроков сегментов, пока не установлен stop_event"""
+        while not stop_event.is_set():
+            await asyncio.sleep(1)
+            await self.rotate_expired()
+
+    async def close(self):
+        """Остановка: дожидаемся загрузок и закрываем все непустые сегменты"""
+        await self.media_pool.join()
+        for chat in self.chats.values():
+            await self.rotate(chat)
@@ -0,0 +1,191 @@
+"""
+Кэш медиафайлов Telegram архиватора между запусками
+Файлы хранятся по SHA256 содержимого, ID фото/документа Telegram указывает на хэш.
+Известное медиа не скачивается повторно, а связывается жесткой ссылкой с папкой канала.
+Размер кэша ограничен, при переполнении удаляются давно не использованные файлы (LRU).
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+from datetime import datetime
+
+INDEX_NAME = "index.json"
+MAX_CACHE_SIZE = 2 * 1024 * 1024 * 1024  # 2 GB
+
+
+def media_key(media):
+    """
+    Ключ медиа по ID фото/документа Telegram, None если ID нет
+
+    Проверка по атрибутам, а не по типам telethon - ключ одинаков
+    для MessageMediaPhoto/MessageMediaDocument и их вложенных объектов.
+    """
+    photo = getattr(media, 'photo', None)
+    if photo is not None and getattr(photo, 'id', None):
+        return f"photo:{photo.id}"
+    document = getattr(media, 'document', None)
+    if document is not None and getattr(document, 'id', None):
+        return f"document:{document.id}"
+    return None
+
+
+def file_sha256(path, block_size=1024 * 1024):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class MediaCache:
+    def __init__(self, cache_dir="./telegram_archives/media_cache", max_size=MAX_CACHE_SIZE):
+        """
+        Инициализация кэша
+
+        Args:
+            cache_dir: Папка кэша (blobs/ и index.json)
+            max_size: Предельный суммарный размер файлов кэша (байт)
+        """
+        self.cache_dir = cache_dir
+        self.blobs_dir = os.path.join(cache_dir, "blobs")
+        self.incoming_dir = os.path.join(cache_dir, "incoming")
+        self.index_file = os.path.join(cache_dir, INDEX_NAME)
+        self.max_size = max_size
+
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        os.makedirs(self.incoming_dir, exist_ok=True)
+
+        self.keys = {}     # ключ Telegram -> sha256
+        self.blobs = {}    # sha256 -> {ext, size, last_used}
+        self.stats = {"hits": 0, "misses": 0, "stored": 0, "deduplicated": 0, "evicted": 0}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.index_file):
+            return
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.keys = data.get('keys', {})
+            self.blobs = data.get('blobs', {})
+        except Exception as e:
+            print(f"⚠️ Индекс кэша медиа поврежден, начинаю заново: {e}")
+
+    def save(self):
+        """Атомарное сохранение индекса"""
+        tmp_path = self.index_file + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'keys': self.keys,
+                'blobs': self.blobs,
+                'updated': datetime.now().isoformat()
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_file)
+
+    @property
+    def total_size(self):
+        return sum(blob['size'] for blob in self.blobs.values())
+
+    def blob_path(self, sha256):
+        blob = self.blobs[sha256]
+        return os.path.join(self.blobs_dir, sha256[:2], f"{sha256}{blob['ext']}")
+
+    def lookup(self, key):
+        """
+        Поиск медиа в кэше
+
+        Returns:
+            str: SHA256 файла или None (нужно скачивать)
+        """
+        sha256 = self.keys.get(key) if key else None
+        if sha256 and sha256 in self.blobs and os.path.exists(self.blob_path(sha256)):
+            self.blobs[sha256]['last_used'] = time.time()
+            self.stats["hits"] += 1
+            return sha256
+
+        if sha256:
+            # Файл удален вручную или вытеснен - забываем ключ
+            self.keys.pop(key, None)
+        self.stats["misses"] += 1
+        return None
+
+    def incoming_path(self, name):
+        """Временный путь для скачивания нового медиа"""
+        return os.path.join(self.incoming_dir, name)
+
+    def store(self, key, path):
+        """
+        Перенос скачанного файла в кэш
+
+        Одинаковое содержимое (пересланное медиа с другим ID) хранится один раз.
+
+        Returns:
+            str: SHA256 файла
+        """
+        sha256 = file_sha256(path)
+        ext = os.path.splitext(path)[1]
+
+        if sha256 in self.blobs and os.path.exists(self.blob_path(sha256)):
+            os.remove(path)
+            self.stats["deduplicated"] += 1
+        else:
+            self.blobs[sha256] = {'ext': ext, 'size': os.path.getsize(path), 'last_used': time.time()}
+            target = self.blob_path(sha256)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(path, target)
+            self.stats["stored"] += 1
+
+        if key:
+            self.keys[key] = sha256
+        self.blobs[sha256]['last_used'] = time.time()
+        return sha256
+
+    def link_into(self, sha256, folder):
+        """
+        Размещение файла кэша в папке (жесткая ссылка, иначе копия)
+
+        Returns:
+            str: Имя файла в папке
+        """
+        source = self.blob_path(sha256)
+        name = os.path.basename(source)
+        target = os.path.join(folder, name)
+        if not os.path.exists(target):
+            os.makedirs(folder, exist_ok=True)
+            try:
+                os.link(source, target)
+            except OSError:
+                # Другая файловая система или ФС без жестких ссылок
+                shutil.copy2(source, target)
+        return name
+
+    def evict(self):
+        """
+        Вытеснение давно не использованных файлов до предельного размера
+
+        Файлы, уже размещенные в папках каналов, остаются там
+        (жесткие ссылки), удаляется только копия в кэше.
+        """
+        total = self.total_size
+        if total <= self.max_size:
+            return 0
+
+        evicted = 0
+        for sha256, blob in sorted(self.blobs.items(), key=lambda item: item[1]['last_used']):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(self.blob_path(sha256))
+            except FileNotFoundError:
+                pass
+            total -= blob['size']
+            del self.blobs[sha256]
+            evicted += 1
+
+        self.keys = {key: sha256 for key, sha256 in self.keys.items() if sha256 in self.blobs}
+        self.stats["evicted"] += evicted
+        self.save()
+        print(f"🧹 Кэш медиа: вытеснено файлов {evicted}, размер {total // (1024 * 1024)} MB")
+        return evicted
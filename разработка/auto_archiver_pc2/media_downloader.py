@@ -0,0 +1,122 @@
+"""
+Параллельная загрузка медиа для Telegram архиватора
+Пул задач с ограничением одновременных загрузок, повторами и учетом FloodWait
+"""
+import asyncio
+
+
+def flood_wait_seconds(error):
+    """
+    Сколько секунд требует подождать Telegram (FloodWaitError), иначе None
+
+    Проверка по имени класса и атрибуту seconds - чтобы модуль работал
+    и с поддельным клиентом в тестах, без импорта telethon.
+    """
+    if type(error).__name__ in ('FloodWaitError', 'FloodPremiumWaitError', 'SlowModeWaitError'):
+        return getattr(error, 'seconds', None)
+    return None
+
+
+class MediaDownloadPool:
+    def __init__(self, client, concurrency=4, retries=3, base_delay=1.0,
+                 max_flood_wait=900, max_pending=None, on_complete=None, scheduler=None):
+        """
+        Инициализация пула
+
+        Args:
+            client: Telegram клиент (нужен только метод download_media)
+            concurrency: Максимум одновременных загрузок
+            retries: Количество повторов при ошибке (FloodWait не считается)
+            base_delay: Начальная пауза между повторами (сек, удваивается)
+            max_flood_wait: Максимальный FloodWait, который имеет смысл ждать (сек)
+            max_pending: Максимум поставленных в очередь загрузок; когда очередь
+                         заполнена, submit() ждет (ограничивает память)
+            on_complete: Функция (msg_data, path), вызываемая после успешной загрузки
+            scheduler: Общий FloodWaitScheduler аккаунта (при архивации нескольких
+                       каналов одним клиентом); None - только локальные паузы
+        """
+        self.client = client
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_flood_wait = max_flood_wait
+        self.on_complete = on_complete
+        self.scheduler = scheduler
+
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._pending = asyncio.Semaphore(max_pending or concurrency * 50)
+        self._tasks = set()
+
+        self.stats = {
+            "downloaded": 0,
+            "failed": 0,
+            "retries": 0,
+            "flood_waits": 0,
+            "flood_wait_seconds": 0
+        }
+
+    async def submit(self, media, path, msg_data):
+        """
+        Постановка загрузки в очередь
+
+        Возвращает управление сразу (пока очередь не заполнена), чтобы
+        итерация по сообщениям продолжалась параллельно с загрузками.
+        """
+        await self._pending.acquire()
+        task = asyncio.ensure_future(self._download(media, path, msg_data))
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task):
+        self._tasks.discard(task)
+        self._pending.release()
+
+    async def _download(self, media, path, msg_data):
+        """Загрузка одного файла с повторами"""
+        attempt = 0
+
+        async with self._semaphore:
+            while True:
+                if self.scheduler:
+                    await self.scheduler.acquire()
+                try:
+                    await self.client.download_media(media, file=path)
+                    msg_data['media_path'] = path
+                    self.stats["downloaded"] += 1
+                    if self.on_complete:
+                        self.on_complete(msg_data, path)
+                    return path
+
+                except Exception as e:
+                    wait = flood_wait_seconds(e)
+                    if wait is not None and wait <= self.max_flood_wait:
+                        self.stats["flood_waits"] += 1
+                        self.stats["flood_wait_seconds"] += wait
+                        print(f"  ⏳ FloodWait {wait} сек для {path}")
+                        if self.scheduler:
+                            # Пауза для всего аккаунта - дождемся ее в acquire()
+                            self.scheduler.penalize(wait)
+                        else:
+                            await asyncio.sleep(wait)
+                        continue
+
+                    attempt += 1
+                    if attempt > self.retries or wait is not None:
+                        self.stats["failed"] += 1
+                        print(f"  ⚠️ Ошибка скачивания медиа {path}: {e}")
+                        return None
+
+                    self.stats["retries"] += 1
+                    await asyncio.sleep(self.base_delay * 2 ** (attempt - 1))
+
+    async def join(self):
+        """Ожидание завершения всех загрузок"""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks))
+
+    async def cancel(self):
+        """Отмена незавершенных загрузок (при ошибке скачивания канала)"""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,134 @@
+"""
+Потоковая запись сообщений канала
+messages.ndjson (строка заголовка, по строке на сообщение, итоговая строка)
+и messages.txt формируются за один проход, без накопления сообщений в памяти
+"""
+import json
+import os
+from datetime import datetime
+
+NDJSON_NAME = "messages.ndjson"
+TEXT_NAME = "messages.txt"
+
+
+class MessageStreamWriter:
+    def __init__(self, channel_folder, channel_info, keep_existing=None):
+        """
+        Открытие потоков записи
+
+        Args:
+            channel_folder: Папка канала
+            channel_info: Данные канала для заголовка (channel_name, channel_link, ...)
+            keep_existing: Для продолжения прерванного прохода - функция (msg) -> bool,
+                           отбирающая уже записанные сообщения; None - начать заново
+        """
+        self.ndjson_path = os.path.join(channel_folder, NDJSON_NAME)
+        self.text_path = os.path.join(channel_folder, TEXT_NAME)
+        self.channel_info = channel_info
+        self.total_messages = 0
+        self.media_count = 0
+        self.min_id = None
+        self.max_id = None
+
+        if keep_existing is not None and os.path.exists(self.ndjson_path):
+            self._reopen(keep_existing)
+        else:
+            self._ndjson = open(self.ndjson_path, 'w', encoding='utf-8')
+            self._text = open(self.text_path, 'w', encoding='utf-8')
+            self._write_header()
+
+    def _write_header(self):
+        header = {'type': 'header', 'download_date': datetime.now().isoformat()}
+        header.update(self.channel_info)
+        self._ndjson.write(json.dumps(header, ensure_ascii=False) + "\n")
+
+        self._text.write(f"Канал: {self.channel_info.get('channel_name')}\n")
+        self._text.write(f"Ссылка: {self.channel_info.get('channel_link')}\n")
+        self._text.write(f"Дата архивации: {datetime.now()}\n")
+        self._text.write("=" * 50 + "\n\n")
+
+    def _reopen(self, keep_existing):
+        """
+        Продолжение прерванного прохода: копируем подтвержденные сообщения
+        (построчно, без загрузки в память) и пересоздаем текстовый дамп
+        """
+        tmp_path = self.ndjson_path + ".tmp"
+        with open(self.ndjson_path, 'r', encoding='utf-8') as src:
+            self._ndjson = open(tmp_path, 'w', encoding='utf-8')
+            self._text = open(self.text_path, 'w', encoding='utf-8')
+            self._write_header()
+
+            for line in src:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # Недописанная строка после сбоя
+                if record.get('type') == 'message' and keep_existing(record):
+                    self.write(record)
+
+        self._ndjson.close()
+        os.replace(tmp_path, self.ndjson_path)
+        self._ndjson = open(self.ndjson_path, 'a', encoding='utf-8')
+
+    def write(self, msg):
+        """Запись одного сообщения в оба потока"""
+        record = {'type': 'message'}
+        record.update(msg)
+        self._ndjson.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        self._text.write(f"[{msg['date']}] ID:{msg['id']}\n")
+        if msg['text']:
+            self._text.write(f"{msg['text']}\n")
+        if msg['media_type']:
+            self._text.write(f"[{msg['media_type'].upper()}: {msg['media_path']}]\n")
+        self._text.write("-" * 30 + "\n")
+
+        self.total_messages += 1
+        if msg['media_type']:
+            self.media_count += 1
+        self.min_id = msg['id'] if self.min_id is None else min(self.min_id, msg['id'])
+        self.max_id = msg['id'] if self.max_id is None else max(self.max_id, msg['id'])
+
+    @property
+    def bytes_written(self):
+        """Объем записанных сообщений (NDJSON + текст)"""
+        return self._ndjson.tell() + self._text.tell()
+
+    def sync(self):
+        """Сброс потоков на диск (контрольная точка)"""
+        for stream in (self._ndjson, self._text):
+            stream.flush()
+            os.fsync(stream.fileno())
+
+    def close(self):
+        """
+        Запись итоговых строк и закрытие потоков
+
+        Returns:
+            dict: Итоги (total_messages, media_count, min_id, max_id)
+        """
+        totals = {
+            'total_messages': self.total_messages,
+            'media_count': self.media_count,
+            'min_id': self.min_id,
+            'max_id': self.max_id
+        }
+
+        footer = {'type': 'footer', 'completed': datetime.now().isoformat()}
+        footer.update(totals)
+        self._ndjson.write(json.dumps(footer, ensure_ascii=False) + "\n")
+
+        self._text.write("=" * 50 + "\n")
+        self._text.write(f"Сообщений: {self.total_messages}\n")
+        self._text.write(f"Медиа: {self.media_count}\n")
+
+        self._ndjson.close()
+        self._text.close()
+        return totals
+
+    def abort(self):
+        """Закрытие без итоговых строк (проход будет продолжен позже)"""
+        for stream in (self._ndjson, self._text):
+            if not stream.closed:
+                stream.close()
+
@@ -0,0 +1,228 @@
+"""
+Пул серверов приема (ПК1) для агента
+Выбор сервера по здоровью и задержке, прозрачное переключение при отказе.
+Переключение возможно только до конца отправки: если данные ушли целиком,
+а ответ не прочитан, сервер мог их уже принять, и повтор на другом сервере
+дал бы дубликат.
+"""
+import socket
+import hashlib
+import time
+import threading
+
+HEADER_SIZE = 10  # Заголовок запроса к серверу - ровно 10 байт ASCII
+# Результат отправки файла, когда данные ушли, а ответ не получен (см. DeliveryUnknownError)
+DELIVERY_UNKNOWN = "unknown"
+
+
+def protocol_header(name):
+    """Заголовок запроса, дополненный пробелами до HEADER_SIZE"""
+    if len(name) > HEADER_SIZE:
+        raise ValueError(f"Заголовок длиннее {HEADER_SIZE} байт: {name}")
+    return name.ljust(HEADER_SIZE).encode('ascii')
+
+
+class DeliveryUnknownError(ConnectionError):
+    """Данные отправлены целиком, но ответ сервера не получен"""
+
+    def __init__(self, endpoint, error):
+        super().__init__(f"доставка на {endpoint.address} неизвестна: {error}")
+        self.endpoint = endpoint
+        self.error = error
+
+
+class ServerEndpoint:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = int(port)
+        self.latency = None        # Сглаженная задержка подключения (сек)
+        self.failures = 0          # Подряд идущие ошибки
+        self.down_until = 0        # До какого момента сервер считается недоступным
+        self.last_error = None
+        self.requests = 0
+
+    @property
+    def address(self):
+        return f"{self.host}:{self.port}"
+
+    def is_healthy(self, now=None):
+        return (now or time.time()) >= self.down_until
+
+    def status(self):
+        return {
+            "address": self.address,
+            "healthy": self.is_healthy(),
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "failures": self.failures,
+            "requests": self.requests,
+            "last_error": self.last_error
+        }
+
+
+class ServerPool:
+    def __init__(self, endpoints, spread=False, ewma_alpha=0.3, base_backoff=5, max_backoff=300):
+        """
+        Инициализация пула
+
+        Args:
+            endpoints: Список серверов: "host:port" или (host, port)
+            spread: Распределять отправки по серверам по хэшу ключа
+            ewma_alpha: Вес нового замера в сглаженной задержке
+            base_backoff: Начальная пауза для отказавшего сервера (сек)
+            max_backoff: Максимальная пауза (сек)
+        """
+        self.endpoints = [self._parse(e) for e in endpoints]
+        if not self.endpoints:
+            raise ValueError("Не указан ни один сервер")
+
+        self.spread = spread
+        self.ewma_alpha = ewma_alpha
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _parse(endpoint):
+        if isinstance(endpoint, str):
+            host, _, port = endpoint.rpartition(':')
+            return ServerEndpoint(host, port)
+        host, port = endpoint
+        return ServerEndpoint(host, port)
+
+    @property
+    def primary(self):
+        return self.endpoints[0]
+
+    def candidates(self, key=None):
+        """
+        Порядок перебора серверов
+
+        Здоровые серверы идут первыми: при распределении по хэшу - в порядке
+        rendezvous-хэширования ключа, иначе - по возрастанию задержки.
+        Недоступные серверы остаются в конце как последний шанс.
+        """
+        now = time.time()
+        with self._lock:
+            healthy = [e for e in self.endpoints if e.is_healthy(now)]
+            down = sorted((e for e in self.endpoints if not e.is_healthy(now)),
+                          key=lambda e: e.down_until)
+
+            if self.spread and key is not None:
+                healthy.sort(key=lambda e: hashlib.sha256(f"{e.address}|{key}".encode('utf-8')).digest(),
+                             reverse=True)
+            else:
+                # Серверы без замеров пробуем раньше, чтобы получить их задержку
+                healthy.sort(key=lambda e: -1 if e.latency is None else e.latency)
+
+        return healthy + down
+
+    def record_success(self, endpoint, latency):
+        with self._lock:
+            if endpoint.latency is None:
+                endpoint.latency = latency
+            else:
+                endpoint.latency += self.ewma_alpha * (latency - endpoint.latency)
+            endpoint.failures = 0
+            endpoint.down_until = 0
+            endpoint.last_error = None
+            endpoint.requests += 1
+
+    def record_failure(self, endpoint, error):
+        with self._lock:
+            endpoint.failures += 1
+            endpoint.last_error = str(error)
+            backoff = min(self.base_backoff * 2 ** (endpoint.failures - 1), self.max_backoff)
+            endpoint.down_until = time.time() + backoff
+
+    def _connect(self, endpoint, timeout):
+        started = time.perf_counter()
+        sock = socket.create_connection((endpoint.host, endpoint.port), timeout=timeout)
+        return sock, time.perf_counter() - started
+
+    def run(self, send, timeout=30, key=None, receive=None):
+        """
+        Выполнение запроса с переключением на следующий сервер при ошибке
+        подключения или отправки
+
+        Args:
+            send: Функция (sock, endpoint), отправляющая запрос целиком
+            timeout: Таймаут сокета (сек)
+            key: Ключ распределения (например, имя файла)
+            receive: Функция (sock, endpoint) -> ответ сервера (None - ответа нет)
+
+        Returns:
+            Результат receive (или send, если receive не задана)
+
+        Raises:
+            DeliveryUnknownError: Запрос отправлен, но ответ не прочитан -
+                                  на другие серверы он не повторяется
+            ConnectionError: Ни один сервер не принял запрос
+        """
+        last_error = None
+
+        for endpoint in self.candidates(key):
+            sock = None
+            try:
+                try:
+                    sock, latency = self._connect(endpoint, timeout)
+                    result = send(sock, endpoint)
+                except OSError as e:
+                    last_error = e
+                    self.record_failure(endpoint, e)
+                    print(f"⚠️ Сервер {endpoint.address} недоступен: {e}")
+                    continue
+
+                if receive is not None:
+                    try:
+                        result = receive(sock, endpoint)
+                    except (OSError, ValueError) as e:
+                        # OSError - сеть/таймаут, ValueError - оборванный/битый ответ
+                        self.record_failure(endpoint, e)
+                        raise DeliveryUnknownError(endpoint, e) from e
+
+                self.record_success(endpoint, latency)
+                return result
+            finally:
+                if sock:
+                    sock.close()
+
+        raise ConnectionError(f"Все серверы недоступны: {last_error}")
+
+    def connect(self, timeout=30, key=None):
+        """
+        Подключение к первому доступному серверу для долгой передачи,
+        которая идет вне run() (успех/ошибку отмечает вызывающий код)
+
+        Returns:
+            tuple: (сокет, сервер, задержка подключения)
+        """
+        last_error = None
+
+        for endpoint in self.candidates(key):
+            try:
+                sock, latency = self._connect(endpoint, timeout)
+                return sock, endpoint, latency
+            except OSError as e:
+                last_error = e
+                self.record_failure(endpoint, e)
+                print(f"⚠️ Сервер {endpoint.address} недоступен: {e}")
+
+        raise ConnectionError(f"Все серверы недоступны: {last_error}")
+
+    def probe(self, timeout=3):
+        """Проверка всех серверов (обновляет здоровье и задержку)"""
+        results = {}
+        for endpoint in self.endpoints:
+            try:
+                sock, latency = self._connect(endpoint, timeout)
+                sock.close()
+                self.record_success(endpoint, latency)
+                results[endpoint.address] = True
+            except OSError as e:
+                self.record_failure(endpoint, e)
+                results[endpoint.address] = False
+        return results
+
+    def status(self):
+        with self._lock:
+            return [e.status() for e in self.endpoints]
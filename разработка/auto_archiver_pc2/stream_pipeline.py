@@ -0,0 +1,313 @@
+"""
+Потоковая отправка архивов на ПК1 без промежуточных файлов
+Записи архива сжимаются (пул процессов zip_builder), шифруются кусками
+и уходят в сокет отдельным потоком. Очередь между шифрованием и отправкой
+ограничена: если сеть медленнее сжатия, сборка архива ждет (backpressure).
+
+Протокол STREAM (поля размеров - 20 байт ASCII, как в SECURE_FILE):
+    "STREAM    " | размер + JSON метаданных | кадры: размер + токен Fernet куска |
+    кадр нулевого размера | размер + итоги (original_size, hash, frames) | ответ сервера (JSON)
+
+При шифровании открытый текст каждого кадра начинается с заголовка: nonce
+потока, номер кадра и признак последнего кадра. Итоги тоже идут кадром -
+зашифрованным, с номером после последнего кадра данных, поэтому обрезку,
+перестановку кадров или подмену итогов сервер обнаруживает.
+
+Если сервер недоступен или передача оборвалась, архив собирается заново
+в локальный файл (спул) - его отправит обычная очередь наблюдателя.
+"""
+import os
+import json
+import queue
+import struct
+import hashlib
+import threading
+from datetime import datetime
+from zip_builder import StreamingZipBuilder
+from server_pool import DeliveryUnknownError, protocol_header
+
+STREAM_HEADER = "STREAM"
+FRAME_SIZE = 4 * 1024 * 1024       # Кусок, шифруемый одним токеном
+MAX_QUEUED_FRAMES = 4              # Кадров в очереди на отправку (ограничивает память)
+
+# Заголовок открытого текста кадра: nonce потока, номер кадра, 1 - кадр итогов
+FRAME_PREFIX = struct.Struct('>16sIB')
+
+
+def _field(value):
+    return f"{value:<20}".encode('utf-8')
+
+
+class EncryptedStreamSender:
+    def __init__(self, agent, filename, extra_metadata=None, frame_size=FRAME_SIZE,
+                 max_queued=MAX_QUEUED_FRAMES, timeout=30):
+        """
+        Открытие потока на сервер
+
+        Args:
+            agent: SystemAgent (пул серверов, ключ шифрования, agent_id)
+            filename: Имя файла на сервере
+            extra_metadata: Дополнительные поля метаданных
+            frame_size: Размер куска данных в кадре (байт)
+            max_queued: Максимум кадров, ожидающих отправки
+            timeout: Таймаут сокета (сек)
+        """
+        self.filename = filename
+        self.frame_size = frame_size
+        self.cipher = agent.crypto.cipher() if agent.encryption_key else None
+        self._server_pool = agent.server_pool
+
+        self.sock, self.endpoint, self._latency = self._server_pool.connect(timeout=timeout, key=filename)
+
+        metadata = {
+            'filename': filename,
+            'encrypted': self.cipher is not None,
+            'frame_size': frame_size,
+            'timestamp': datetime.now().isoformat(),
+            'agent_id': agent.agent_id
+        }
+        if extra_metadata:
+            metadata.update(extra_metadata)
+
+        try:
+            metadata_json = json.dumps(metadata).encode('utf-8')
+            self.sock.sendall(protocol_header(STREAM_HEADER))
+            self.sock.sendall(_field(len(metadata_json)) + metadata_json)
+        except OSError as e:
+            self._fail(e)
+            raise
+
+        self._buffer = bytearray()
+        self._hash = hashlib.sha256()
+        self._nonce = os.urandom(16)
+        self._sequence = 0
+        self.size = 0
+        self.sent_bytes = 0
+        self.frames = 0
+
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._error = None
+        self._thread = threading.Thread(target=self._send_loop, name=f"stream:{filename}", daemon=True)
+        self._thread.start()
+
+    @property
+    def sha256(self):
+        return self._hash.hexdigest()
+
+    def _fail(self, error):
+        self._server_pool.record_failure(self.endpoint, error)
+        self.sock.close()
+
+    # ===== Сторона записи (поток сборки архива) =====
+
+    def write(self, data):
+        """Данные архива; полные куски шифруются и ставятся в очередь отправки"""
+        if self._error:
+            raise self._error
+        self._hash.update(data)
+        self.size += len(data)
+        self._buffer += data
+        while len(self._buffer) >= self.frame_size:
+            self._put_frame(bytes(self._buffer[:self.frame_size]))
+            del self._buffer[:self.frame_size]
+
+    def _seal(self, chunk, final=False):
+        """Токен кадра с номером (без шифрования - сам кусок)"""
+        if not self.cipher:
+            return chunk
+        token = self.cipher.encrypt(FRAME_PREFIX.pack(self._nonce, self._sequence, final) + chunk)
+        self._sequence += 1
+        return token
+
+    def _put_frame(self, chunk):
+        token = self._seal(chunk)
+        # Очередь ограничена: при медленной сети запись ждет здесь
+        self._queue.put(token)
+
+    # ===== Поток отправки =====
+
+    def _send_loop(self):
+        while True:
+            token = self._queue.get()
+            if token is None:
+                return
+            if self._error:
+                # Передача уже оборвалась - только освобождаем очередь
+                continue
+            try:
+                self.sock.sendall(_field(len(token)) + token)
+                self.sent_bytes += len(token)
+                self.frames += 1
+            except OSError as e:
+                self._error = e
+
+    def close(self):
+        """
+        Последний кусок, итоги передачи и ответ сервера
+
+        Returns:
+            dict: Ответ сервера
+
+        Raises:
+            DeliveryUnknownError: Итоги отправлены, но ответ не прочитан -
+                                  сервер мог уже принять файл
+        """
+        if self._buffer and not self._error:
+            self._put_frame(bytes(self._buffer))
+            self._buffer.clear()
+        self._queue.put(None)
+        self._thread.join()
+
+        try:
+            if self._error:
+                raise self._error
+
+            trailer = self._seal(json.dumps({
+                'original_size': self.size,
+                'hash': self.sha256,
+                'frames': self.frames
+            }).encode('utf-8'), final=True)
+            self.sock.sendall(_field(0) + _field(len(trailer)) + trailer)
+        except OSError as e:
+            self._fail(e)
+            raise
+
+        try:
+            # Сервер закрывает соединение после ответа
+            response = b""
+            while True:
+                chunk = self.sock.recv(4096)
+                if not chunk:
+                    break
+                response += chunk
+            result = json.loads(response.decode('utf-8'))
+        except (OSError, ValueError) as e:
+            # OSError - сеть/таймаут, ValueError - оборванный/битый ответ
+            self._fail(e)
+            raise DeliveryUnknownError(self.endpoint, e) from e
+
+        self._server_pool.record_success(self.endpoint, self._latency)
+        self.sock.close()
+        return result
+
+    def abort(self):
+        """Обрыв передачи (сервер удалит недописанный файл)"""
+        self._error = self._error or ConnectionAbortedError("передача отменена")
+        self._queue.put(None)
+        self._thread.join()
+        self.sock.close()
+
+
+class StreamingUploadBuilder:
+    def __init__(self, agent, archive_path, pool=None, extra_metadata=None):
+        """
+        Сборщик архива, который отправляет его на сервер по мере сборки
+
+        Интерфейс как у StreamingZipBuilder. Если сервер недоступен или
+        передача не подтверждена, архив сохраняется по archive_path (спул).
+        Если итоги ушли, а ответа нет, спула нет: close() поднимает
+        DeliveryUnknownError, иначе повторная отправка дала бы дубликат.
+
+        Args:
+            agent: SystemAgent
+            archive_path: Путь локальной копии на случай сбоя отправки
+            pool: Общий пул процессов сжатия
+            extra_metadata: Дополнительные поля метаданных
+        """
+        self.archive_path = archive_path
+        self.pool = pool
+        self.uploaded = False
+        self.response = None
+        self.size = None
+        self.sha256 = None
+        self._files = []
+
+        try:
+            self._sender = EncryptedStreamSender(agent, os.path.basename(archive_path), extra_metadata)
+            self._builder = StreamingZipBuilder(pool=pool, stream=self._sender)
+        except (OSError, ConnectionError) as e:
+            print(f"⚠️ Потоковая отправка недоступна, архив сохраняется локально: {e}")
+            self._sender = None
+            self._builder = StreamingZipBuilder(archive_path, pool=pool)
+
+    @property
+    def stats(self):
+        return self._builder.stats
+
+    def add_file(self, file_path, arcname):
+        added = self._builder.add_file(file_path, arcname)
+        if added and self._sender:
+            # Запоминаем состав на случай повторной сборки в спул
+            self._files.append((file_path, arcname))
+        return added
+
+    def add_folder(self, folder_path, base_path):
+        for root, dirs, files in os.walk(folder_path):
+            for file in sorted(files):
+                file_path = os.path.join(root, file)
+                self.add_file(file_path, os.path.relpath(file_path, base_path).replace(os.sep, '/'))
+
+    def close(self):
+        """
+        Завершение архива
+
+        Returns:
+            str: archive_path (файл существует, только если архив ушел в спул)
+
+        Raises:
+            DeliveryUnknownError: Архив отправлен целиком, но ответ не получен
+        """
+        if not self._sender:
+            return self._builder.close()
+
+        try:
+            self._builder.close()
+            self.response = self._sender.close()
+            if not self.response.get('verified'):
+                raise ValueError(self.response.get('message') or "сервер не подтвердил целостность")
+        except DeliveryUnknownError as e:
+            print(f"⚠️ Доставка {os.path.basename(self.archive_path)} неизвестна, в спул не сохраняется: {e}")
+            raise
+        except Exception as e:
+            print(f"⚠️ Потоковая отправка {os.path.basename(self.archive_path)} не удалась: {e}")
+            self._sender.abort()
+            return self._spool()
+
+        self.uploaded = True
+        self.size = self._sender.size
+        self.sha256 = self._sender.sha256
+        print(f"📡 Архив {os.path.basename(self.archive_path)} отправлен потоком: "
+              f"{self.size // 1024} KB, кадров {self._sender.frames}")
+        return self.archive_path
+
+    def _spool(self):
+        """Повторная сборка архива в локальный файл из тех же источников"""
+        builder = StreamingZipBuilder(self.archive_path, pool=self.pool)
+        for file_path, arcname in self._files:
+            builder.add_file(file_path, arcname)
+        path = builder.close()
+        print(f"💾 Архив сохранен в спул: {path}")
+        return path
+
+    def abort(self):
+        self._builder.abort()
+        if self._sender:
+            self._sender.abort()
+
+
+def stream_file(agent, file_path, extra_metadata=None):
+    """
+    Потоковая отправка готового файла (без чтения целиком в память)
+
+    Returns:
+        dict: Ответ сервера
+    """
+    sender = EncryptedStreamSender(agent, os.path.basename(file_path), extra_metadata)
+    try:
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(sender.frame_size), b''):
+                sender.write(block)
+    except Exception:
+        sender.abort()
+        raise
+    return sender.close()
@@ -0,0 +1,162 @@
+"""
+Состояние синхронизации каналов для Telegram архиватора
+Последний заархивированный ID сообщения и контрольные точки незавершенного прохода.
+Сообщения, пойманные живым режимом, учитываются отдельно (<канал>.live.json):
+курсор истории переносится за них только когда история дошла до их начала.
+"""
+import json
+import os
+from datetime import datetime
+
+
+class ChannelSyncState:
+    def __init__(self, state_dir, channel_key):
+        """
+        Состояние синхронизации одного канала
+
+        Args:
+            state_dir: Папка с файлами состояния
+            channel_key: Ключ канала (ID entity)
+        """
+        os.makedirs(state_dir, exist_ok=True)
+        self.path = os.path.join(state_dir, f"{channel_key}.json")
+        self.live_path = os.path.join(state_dir, f"{channel_key}.live.json")
+        self.last_message_id = 0
+        self.run = None
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.last_message_id = data.get('last_message_id', 0)
+            self.run = data.get('run')
+        except Exception as e:
+            print(f"⚠️ Состояние синхронизации повреждено, начинаю заново: {e}")
+
+    @staticmethod
+    def _write(path, data):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def save(self):
+        """Атомарное сохранение состояния"""
+        self._write(self.path, {
+            'last_message_id': self.last_message_id,
+            'run': self.run,
+            'updated': datetime.now().isoformat()
+        })
+
+    def load_live(self):
+        """Диапазон живого режима {'session', 'first_id', 'live_max_id'} или None"""
+        if not os.path.exists(self.live_path):
+            return None
+        try:
+            with open(self.live_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception:
+            return None
+
+    def record_live(self, session, first_id, last_id):
+        """
+        Учет сообщений, пойманных живым режимом
+
+        Живой сеанс ловит все новые сообщения подряд, начиная с first_id;
+        прежний сеанс заменяется новым (между ними мог быть пропуск, его
+        дозагрузит история). Курсор истории не сдвигается, пока история
+        не дошла до начала живого диапазона - иначе сообщения до запуска
+        живого режима никогда не попадут в архив.
+
+        Args:
+            session: ID сеанса живого режима
+            first_id: Первый пойманный ID сообщения сегмента
+            last_id: Последний пойманный ID сообщения сегмента
+        """
+        live = self.load_live()
+        if live and live.get('session') == session:
+            live['first_id'] = min(live['first_id'], first_id)
+            live['live_max_id'] = max(live['live_max_id'], last_id)
+        else:
+            live = {'session': session, 'first_id': first_id, 'live_max_id': last_id}
+        live['updated'] = datetime.now().isoformat()
+        self._write(self.live_path, live)
+
+        if self.run is None and self._absorb_live(live):
+            self.save()
+
+    def _absorb_live(self, live=None):
+        """Перенос курсора за живой диапазон, если история уже дошла до его начала"""
+        live = live or self.load_live()
+        if (live and self.last_message_id >= live['first_id'] - 1
+                and live['live_max_id'] > self.last_message_id):
+            self.last_message_id = live['live_max_id']
+            return True
+        return False
+
+    def begin_run(self):
+        """
+        Начало нового прохода
+
+        Первый проход идет от новых сообщений к старым (последние limit сообщений),
+        последующие - от last_message_id вверх, чтобы не оставлять пропусков.
+        """
+        self.run = {
+            'mode': 'incremental' if self.last_message_id else 'initial',
+            'cursor': self.last_message_id,
+            'top_id': self.last_message_id,
+            'processed': 0,
+            'started': datetime.now().isoformat(),
+            'run_id': datetime.now().strftime("%Y%m%d_%H%M%S"),
+            'volumes': []
+        }
+        self.save()
+        return self.run
+
+    def iter_kwargs(self, limit):
+        """Параметры iter_messages для продолжения текущего прохода"""
+        remaining = max(limit - self.run['processed'], 0)
+        if self.run['mode'] == 'incremental':
+            return {'limit': remaining, 'min_id': self.run['cursor'], 'reverse': True}
+        return {'limit': remaining, 'offset_id': self.run['cursor']}
+
+    def is_committed(self, msg):
+        """Подтверждено ли сообщение контрольной точкой текущего прохода"""
+        if not self.run or not self.run['processed']:
+            return False
+        if self.run['mode'] == 'incremental':
+            return msg['id'] <= self.run['cursor']
+        return msg['id'] >= self.run['cursor']
+
+    def checkpoint(self, message_ids):
+        """
+        Контрольная точка: сдвигаем курсор
+
+        Вызывается после сброса потока сообщений на диск, поэтому при сбое
+        между ними сообщения могут повториться, но не потеряться.
+        """
+        if not message_ids:
+            return
+
+        if self.run['mode'] == 'incremental':
+            self.run['cursor'] = max(message_ids)
+        else:
+            self.run['cursor'] = min(message_ids)
+        self.run['top_id'] = max(self.run['top_id'], max(message_ids))
+        self.run['processed'] += len(message_ids)
+        self.save()
+
+    def record_volume(self, info):
+        """Закрытый том прохода (при продолжении после сбоя его не пересобираем)"""
+        self.run.setdefault('volumes', []).append(info)
+        self.save()
+
+    def complete(self):
+        """Проход завершен - новые сообщения в следующий раз берем после top_id"""
+        self.last_message_id = max(self.last_message_id, self.run['top_id'])
+        self.run = None
+        self._absorb_live()
+        self.save()
@@ -5,12 +5,25 @@ Telegram архиватор для ПК2
 import asyncio
 import json
 import os
+import time
+import shutil
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 from telethon import TelegramClient, events
 from telethon.tl.types import MessageMediaPhoto, MessageMediaDocument
+from media_downloader import MediaDownloadPool, flood_wait_seconds
+from flood_scheduler import FloodWaitScheduler
+from media_cache import MediaCache, MAX_CACHE_SIZE, media_key
+from archive_volumes import VolumeArchiveWriter, VOLUME_SIZE
+from sync_state import ChannelSyncState
+from message_stream import MessageStreamWriter
+from live_capture import LiveCapture, SEGMENT_SECONDS, SEGMENT_BYTES
 
 class TelegramArchiver:
-    def __init__(self, api_id=None, api_hash=None, session_name='telegram_session'):
+    def __init__(self, api_id=None, api_hash=None, session_name='telegram_session',
+                 media_concurrency=4, media_retries=3, checkpoint_every=500,
+                 requests_per_second=3.0, media_cache_size=MAX_CACHE_SIZE, compress_workers=None,
+                 volume_size=VOLUME_SIZE, open_volume_builder=None):
         """
         Инициализация Telegram клиента
         
@@ -18,17 +31,38 @@ class TelegramArchiver:
             api_id: API ID из my.telegram.org
             api_hash: API Hash из my.telegram.org
             session_name: Имя сессии
+            media_concurrency: Максимум одновременных загрузок медиа
+            media_retries: Количество повторов загрузки медиа при ошибке
+            checkpoint_every: Через сколько сообщений сохранять контрольную точку
+            requests_per_second: Лимит запросов аккаунта (общий для всех каналов)
+            media_cache_size: Предельный размер кэша медиа (байт)
+            compress_workers: Процессов для сжатия архивов (по умолчанию - число ядер)
+            volume_size: Предельный размер тома архива (байт), None - один том
+            open_volume_builder: Функция (archive_path, pool=...) -> сборщик тома/сегмента;
+                                 например SystemAgent.open_stream_builder - тома уходят
+                                 на сервер по мере сборки, без zip на диске
         """
         self.api_id = api_id
         self.api_hash = api_hash
         self.session_name = session_name
         self.client = None
+        self.media_concurrency = media_concurrency
+        self.media_retries = media_retries
+        self.checkpoint_every = checkpoint_every
+        self.scheduler = FloodWaitScheduler(requests_per_second)
+        self.compress_workers = compress_workers or os.cpu_count() or 1
+        self._compress_pool = None
+        self.volume_size = volume_size
+        self.open_volume_builder = open_volume_builder
         self.download_path = "./telegram_archives"
+        self.sync_state_path = f"{self.download_path}/sync_state"
         
         # Создаем папки
         os.makedirs(self.download_path, exist_ok=True)
         os.makedirs(f"{self.download_path}/chats", exist_ok=True)
-        os.makedirs(f"{self.download_path}/media", exist_ok=True)
+        
+        # Кэш медиа между запусками и каналами
+        self.media_cache = MediaCache(f"{self.download_path}/media_cache", media_cache_size)
         
     async def connect(self):
         """Подключение к Telegram"""
@@ -50,22 +84,38 @@ class TelegramArchiver:
             print(f"❌ Ошибка подключения к Telegram: {e}")
             return False
     
-    async def download_channel(self, channel_link, limit=100):
+    async def download_channel(self, channel_link, limit=100, progress=None):
         """
-        Скачивание канала
+        Скачивание канала (инкрементальное)
+        
+        Первый запуск берет последние limit сообщений, следующие - только
+        новые сообщения (min_id). Прерванный проход продолжается с последней
+        контрольной точки. Сообщения пишутся потоком в messages.ndjson
+        и messages.txt, поэтому память не растет с размером канала.
         
         Args:
             channel_link: Ссылка на канал (@username или https://t.me/...)
-            limit: Максимальное количество сообщений
+            limit: Максимальное количество сообщений за проход
+            progress: Словарь для отчета о прогрессе (заполняется по ходу работы)
         """
         if not self.client:
             print("❌ Клиент не инициализирован")
             return None
         
+        if progress is None:
+            progress = {}
+        progress.update({'status': 'running', 'messages': 0, 'media': 0,
+                         'seconds': None, 'error': None, 'flood_wait': None})
+        progress.setdefault('started', time.time())
+        
+        writer = None
+        volumes = None
+        media_pool = None
         try:
-            print(f"📥 Скачиваю канал: {channel_link}")
+            print(f"📥 Скачиваю канал: {channel_link if isinstance(channel_link, str) else getattr(channel_link, 'title', channel_link)}")
             
             # Получаем entity (канал/чат)
+            await self.scheduler.acquire()
             entity = await self.client.get_entity(channel_link)
             channel_name = getattr(entity, 'title', getattr(entity, 'username', 'unknown'))
             
@@ -74,126 +124,388 @@ class TelegramArchiver:
             channel_folder = f"{self.download_path}/chats/{safe_name}"
             os.makedirs(channel_folder, exist_ok=True)
             
-            # Собираем сообщения
-            messages_data = []
-            media_count = 0
+            # Состояние синхронизации канала
+            sync_state = ChannelSyncState(self.sync_state_path, getattr(entity, 'id', safe_name))
+            resuming = sync_state.run is not None
+            if not resuming:
+                sync_state.begin_run()
+                if sync_state.last_message_id:
+                    print(f"  🔄 Скачиваю только новые сообщения (после ID {sync_state.last_message_id})")
+                
+                # metadata.json от старых версий архиватора не должен попасть в новый архив
+                legacy_metadata = f"{channel_folder}/metadata.json"
+                if os.path.exists(legacy_metadata):
+                    os.remove(legacy_metadata)
+                
+                # В архив идут только медиа текущего прохода (файлы - ссылки на кэш)
+                shutil.rmtree(f"{channel_folder}/media", ignore_errors=True)
+            
+            # Потоковая запись сообщений
+            writer = MessageStreamWriter(channel_folder, {
+                'channel_name': channel_name,
+                'channel_link': channel_link if isinstance(channel_link, str) else channel_name,
+                'channel_id': getattr(entity, 'id', None),
+                'sync_mode': sync_state.run['mode']
+            }, keep_existing=sync_state.is_committed if resuming else None)
+            
+            # Тома архива собираются по мере скачивания медиа, а не после
+            run = sync_state.run
+            run.setdefault('run_id', datetime.now().strftime("%Y%m%d_%H%M%S"))
+            volumes = VolumeArchiveWriter(
+                self.download_path, channel_folder, safe_name, writer.channel_info, run['run_id'],
+                volume_size=self.volume_size, pool=self._get_compress_pool(),
+                closed_volumes=run.get('volumes'), on_volume=sync_state.record_volume,
+                open_builder=self.open_volume_builder)
+            print(f"📦 Собираю архив по мере загрузки: {volumes.base_name}")
+            media_folder = f"{channel_folder}/media"
+            media_arcdir = f"{safe_name}/media"
+            
+            if resuming:
+                print(f"  ↩️ Продолжаю прерванный проход: уже сохранено {writer.total_messages} сообщений")
+                # Сообщения, сохраненные до сбоя, но не попавшие в закрытые тома
+                self._refill_volume(volumes, writer.ndjson_path, channel_folder, media_arcdir)
+            
+            # Собираем сообщения (медиа качаются параллельно, не блокируя итерацию)
+            media_count = writer.media_count
+            processed = writer.total_messages
+            pending_checkpoint = []
+            progress['messages'] = processed
+            progress['media'] = media_count
+            cached_count = 0
+            cache_keys = {}
+            pending_bytes = [0]  # Ожидаемый объем медиа текущей пачки
+            
+            def on_media_downloaded(msg_data, path):
+                # Скачанный файл переносим в кэш и ссылаемся на него из папки канала
+                sha256 = self.media_cache.store(cache_keys.pop(path, None), path)
+                self._attach_cached_media(msg_data, sha256, media_folder, volumes, media_arcdir)
+                print(f"  📷 Скачано медиа: {msg_data['media_path']}")
+            
+            media_pool = MediaDownloadPool(
+                self.client,
+                concurrency=self.media_concurrency,
+                retries=self.media_retries,
+                on_complete=on_media_downloaded,
+                scheduler=self.scheduler
+            )
+            entity_key = getattr(entity, 'id', safe_name)
             
-            async for message in self.client.iter_messages(entity, limit=limit):
-                msg_data = {
-                    'id': message.id,
-                    'date': message.date.isoformat() if message.date else None,
-                    'sender_id': message.sender_id,
-                    'text': message.text,
-                    'media_type': None,
-                    'media_path': None
-                }
+            async def flush_checkpoint():
+                # Сообщения пишем после загрузки их медиа (нужен media_path)
+                await media_pool.join()
+                for msg in pending_checkpoint:
+                    writer.write(msg)
+                volumes.write_messages(pending_checkpoint)
+                writer.sync()
+                self.media_cache.save()
+                sync_state.checkpoint([msg['id'] for msg in pending_checkpoint])
+                volumes.checkpoint()
+                pending_checkpoint.clear()
+                pending_bytes[0] = 0
+            
+            async for message in self.client.iter_messages(entity, **sync_state.iter_kwargs(limit)):
+                # Telethon запрашивает историю пачками по 100 сообщений
+                if processed % 100 == 0:
+                    await self.scheduler.acquire()
+                
+                msg_data, ext = self._message_record(message)
                 
                 # Скачиваем медиа если есть
                 if message.media:
                     media_count += 1
-                    media_filename = f"media_{message.id}_{media_count}"
+                    media_filename = f"media_{entity_key}_{message.id}_{media_count}"
                     
-                    if isinstance(message.media, MessageMediaPhoto):
-                        msg_data['media_type'] = 'photo'
-                        media_path = f"{self.download_path}/media/{media_filename}.jpg"
-                    elif isinstance(message.media, MessageMediaDocument):
-                        msg_data['media_type'] = 'document'
-                        # Получаем расширение файла
-                        doc = message.media.document
-                        mime_type = doc.mime_type if doc.mime_type else 'bin'
-                        ext = mime_type.split('/')[-1]
-                        media_path = f"{self.download_path}/media/{media_filename}.{ext}"
+                    key = media_key(message.media)
+                    sha256 = self.media_cache.lookup(key)
+                    if sha256:
+                        # Уже скачано раньше (в этом или другом канале)
+                        self._attach_cached_media(msg_data, sha256, media_folder, volumes, media_arcdir)
+                        cached_count += 1
                     else:
-                        media_path = f"{self.download_path}/media/{media_filename}.bin"
-                    
-                    # Скачиваем медиа
-                    try:
-                        await self.client.download_media(message.media, file=media_path)
-                        msg_data['media_path'] = media_path
-                        print(f"  📷 Скачано медиа: {media_path}")
-                    except Exception as e:
-                        print(f"  ⚠️ Ошибка скачивания медиа: {e}")
+                        # Ставим медиа в очередь загрузки
+                        media_path = self.media_cache.incoming_path(f"{media_filename}.{ext}")
+                        cache_keys[media_path] = key
+                        await media_pool.submit(message.media, media_path, msg_data)
+                        pending_bytes[0] += getattr(getattr(message, 'file', None), 'size', None) or 0
                 
-                messages_data.append(msg_data)
+                pending_checkpoint.append(msg_data)
+                processed += 1
+                progress['messages'] = processed
+                progress['media'] = media_count
+                
+                # Контрольная точка (раньше - если пачка не помещается в том)
+                if len(pending_checkpoint) >= self.checkpoint_every or volumes.would_overflow(pending_bytes[0]):
+                    await flush_checkpoint()
                 
                 # Прогресс
-                if len(messages_data) % 10 == 0:
-                    print(f"  📝 Обработано сообщений: {len(messages_data)}/{limit}")
+                if processed % 10 == 0:
+                    print(f"  📝 Обработано сообщений: {processed}/{limit}")
             
-            # Сохраняем метаданные
-            metadata = {
-                'channel_name': channel_name,
-                'channel_link': channel_link,
-                'total_messages': len(messages_data),
-                'media_count': media_count,
-                'download_date': datetime.now().isoformat(),
-                'messages': messages_data
-            }
+            # Дожидаемся оставшихся загрузок медиа
+            await flush_checkpoint()
+            stats = media_pool.stats
+            if stats['downloaded'] or stats['failed'] or cached_count:
+                print(f"  📷 Медиа: скачано {stats['downloaded']}, из кэша {cached_count}, "
+                      f"ошибок {stats['failed']}, повторов {stats['retries']}, FloodWait {stats['flood_waits']}")
             
-            metadata_file = f"{channel_folder}/metadata.json"
-            with open(metadata_file, 'w', encoding='utf-8') as f:
-                json.dump(metadata, f, ensure_ascii=False, indent=2)
+            totals = writer.close()
+            progress['messages'] = totals['total_messages']
+            progress['media'] = totals['media_count']
             
-            # Создаем текстовый дамп
-            text_dump_file = f"{channel_folder}/messages.txt"
-            with open(text_dump_file, 'w', encoding='utf-8') as f:
-                f.write(f"Канал: {channel_name}\n")
-                f.write(f"Ссылка: {channel_link}\n")
-                f.write(f"Сообщений: {len(messages_data)}\n")
-                f.write(f"Медиа: {media_count}\n")
-                f.write(f"Дата архивации: {datetime.now()}\n")
-                f.write("="*50 + "\n\n")
-                
-                for msg in messages_data:
-                    f.write(f"[{msg['date']}] ID:{msg['id']}\n")
-                    if msg['text']:
-                        f.write(f"{msg['text']}\n")
-                    if msg['media_type']:
-                        f.write(f"[{msg['media_type'].upper()}: {msg['media_path']}]\n")
-                    f.write("-"*30 + "\n")
+            if not totals['total_messages']:
+                volumes.abort()
+                sync_state.complete()
+                progress['status'] = 'empty'
+                print(f"✅ Новых сообщений нет: {channel_name}")
+                return None
             
             print(f"✅ Канал скачан: {channel_name}")
-            print(f"   📊 Сообщений: {len(messages_data)}")
-            print(f"   📷 Медиафайлов: {media_count}")
+            print(f"   📊 Сообщений: {totals['total_messages']} (ID {totals['min_id']}-{totals['max_id']})")
+            print(f"   📷 Медиафайлов: {totals['media_count']}")
             print(f"   💾 Файлы сохранены в: {channel_folder}")
             
-            # Создаем архив для отправки
-            archive_path = self._create_archive(channel_folder, channel_name)
+            # Закрываем последний том (в потоке, чтобы не останавливать другие каналы)
+            progress['status'] = 'archiving'
+            archive_started = time.time()
+            archive_paths = await asyncio.get_running_loop().run_in_executor(None, volumes.finish)
+            archive_path = archive_paths[-1]
+            print(f"✅ Архив создан: {len(archive_paths)} том(ов), последний {archive_path} "
+                  f"({time.time() - archive_started:.1f} сек после загрузки)")
+            sync_state.complete()
+            self.media_cache.evict()
+            progress['status'] = 'done'
+            progress['archive_path'] = archive_path
+            progress['volumes'] = archive_paths
             return archive_path
             
         except Exception as e:
+            if media_pool:
+                await media_pool.cancel()
+            if writer:
+                writer.abort()
+            if volumes:
+                volumes.abort()
+            progress['status'] = 'failed'
+            progress['error'] = str(e)
+            progress['flood_wait'] = flood_wait_seconds(e)
             print(f"❌ Ошибка скачивания канала: {e}")
             return None
+        finally:
+            progress['seconds'] = time.time() - progress['started']
+    
+    async def download_channels(self, channels, limit=100, max_parallel=3,
+                                report_every=10, max_flood_wait=900):
+        """
+        Пакетная архивация нескольких каналов одним клиентом
+        
+        Каналы качаются параллельно (не больше max_parallel одновременно),
+        все запросы проходят через общий планировщик аккаунта. Канал, упавший
+        на FloodWait, повторяется после паузы с последней контрольной точки.
+        
+        Args:
+            channels: Ссылки на каналы или словари из get_available_chats()
+            limit: Максимальное количество сообщений за проход на канал
+            max_parallel: Максимум одновременно скачиваемых каналов
+            report_every: Период вывода прогресса (сек)
+            max_flood_wait: Максимальный FloodWait, который имеет смысл ждать (сек)
+        
+        Returns:
+            list: Результаты по каналам (channel, status, archive_path, volumes, messages,
+                  media, seconds, messages_per_sec, error)
+        """
+        if not self.client:
+            print("❌ Клиент не инициализирован")
+            return []
+        
+        semaphore = asyncio.Semaphore(max_parallel)
+        progress = {}
+        
+        async def archive_one(channel):
+            # Диалог из get_available_chats или ссылка
+            if isinstance(channel, dict):
+                label, target = channel['name'], channel['entity']
+            else:
+                label, target = channel, channel
+            state = progress.setdefault(label, {'status': 'queued'})
+            
+            async with semaphore:
+                while True:
+                    archive_path = await self.download_channel(target, limit, state)
+                    wait = state.get('flood_wait')
+                    if state['status'] != 'failed' or wait is None or wait > max_flood_wait:
+                        break
+                    self.scheduler.penalize(wait)
+                    print(f"⏳ {label}: FloodWait {wait} сек, продолжу с контрольной точки")
+            
+            return {
+                'channel': label,
+                'status': state['status'],
+                'archive_path': archive_path,
+                'volumes': state.get('volumes', []),
+                'messages': state.get('messages', 0),
+                'media': state.get('media', 0),
+                'seconds': round(state.get('seconds', 0), 1),
+                'messages_per_sec': round(state.get('messages', 0) / max(state.get('seconds', 0), 0.001), 1),
+                'error': state.get('error')
+            }
+        
+        async def report():
+            while True:
+                await asyncio.sleep(report_every)
+                self._print_batch_progress(progress)
+        
+        print(f"🚀 Пакетная архивация: {len(channels)} каналов, по {max_parallel} одновременно")
+        reporter = asyncio.ensure_future(report())
+        try:
+            results = await asyncio.gather(*(archive_one(channel) for channel in channels))
+        finally:
+            reporter.cancel()
+        
+        done = sum(1 for r in results if r['archive_path'])
+        failed = sum(1 for r in results if r['status'] == 'failed')
+        print(f"✅ Пакетная архивация завершена: архивов {done}, ошибок {failed}, "
+              f"FloodWait {self.scheduler.stats['flood_waits']} "
+              f"({self.scheduler.stats['flood_wait_seconds']} сек)")
+        return results
     
-    def _create_archive(self, folder_path, channel_name):
+    async def capture_live(self, chats, segment_seconds=SEGMENT_SECONDS, segment_bytes=SEGMENT_BYTES,
+                           on_segment=None, stop_event=None):
         """
-        Создание архива из папки
+        Живой режим: новые и отредактированные сообщения приходят событиями
+        Telethon и через несколько секунд оказываются в сегменте чата
+        
+        Сегмент закрывается в zip-архив по времени (segment_seconds) или
+        размеру (segment_bytes), так что задержка доставки на ПК1 - минуты,
+        а не интервал периодической архивации.
         
         Args:
-            folder_path: Путь к папке с данными
-            channel_name: Имя канала
+            chats: Список ссылок на каналы/чаты
+            segment_seconds: Максимальная длительность сегмента (сек)
+            segment_bytes: Максимальный размер сегмента (байт)
+            on_segment: Функция (archive_path), вызываемая после закрытия сегмента
+            stop_event: asyncio.Event/threading.Event для остановки (None - до Ctrl+C)
         
         Returns:
-            str: Путь к созданному архиву
+            dict: Статистика (new, edited, segments, latency_sum)
         """
-        import zipfile
+        if not self.client:
+            print("❌ Клиент не инициализирован")
+            return None
+        
+        entities = []
+        for chat in chats:
+            await self.scheduler.acquire()
+            entities.append(await self.client.get_entity(chat))
+        
+        capture = LiveCapture(self, entities, segment_seconds, segment_bytes, on_segment)
+        
+        async def on_new(event):
+            await capture.handle(event.message)
+        
+        async def on_edited(event):
+            await capture.handle(event.message, edited=True)
         
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        archive_name = f"{channel_name}_{timestamp}.zip".replace(' ', '_')
-        archive_path = f"{self.download_path}/{archive_name}"
+        self.client.add_event_handler(on_new, events.NewMessage(chats=entities))
+        self.client.add_event_handler(on_edited, events.MessageEdited(chats=entities))
+        print(f"📡 Живой режим: {len(entities)} чатов, сегмент {segment_seconds} сек / "
+              f"{segment_bytes // (1024 * 1024)} MB")
         
-        print(f"📦 Создаю архив: {archive_name}")
+        try:
+            await capture.run(stop_event or asyncio.Event())
+        except (asyncio.CancelledError, KeyboardInterrupt):
+            pass
+        finally:
+            self.client.remove_event_handler(on_new)
+            self.client.remove_event_handler(on_edited)
+            await capture.close()
+        
+        stats = capture.stats
+        received = stats['new'] + stats['edited']
+        if received:
+            print(f"📊 Живой режим: новых {stats['new']}, правок {stats['edited']}, "
+                  f"сегментов {stats['segments']}, средняя задержка {stats['latency_sum'] / received:.1f} сек")
+        return stats
+    
+    def _print_batch_progress(self, progress):
+        """Вывод прогресса пакетной архивации по каналам"""
+        now = time.time()
+        print("📊 Прогресс архивации:")
+        for label, state in progress.items():
+            if state['status'] == 'queued':
+                print(f"   ⏸️ {label}: в очереди")
+                continue
+            elapsed = max(state.get('seconds') or now - state['started'], 0.001)
+            print(f"   {label}: {state['status']}, сообщений {state['messages']}, "
+                  f"медиа {state['media']}, {state['messages'] / elapsed:.1f} сообщ/с")
+        if self.scheduler.blocked_for:
+            print(f"   ⏳ Пауза FloodWait: еще {self.scheduler.blocked_for:.0f} сек")
+    
+    def _message_record(self, message):
+        """
+        Запись сообщения для архива
         
-        with zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, dirs, files in os.walk(folder_path):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    arcname = os.path.relpath(file_path, os.path.dirname(folder_path))
-                    zipf.write(file_path, arcname)
-                    print(f"  📎 Добавлен файл: {file}")
+        Returns:
+            tuple: (словарь сообщения, расширение файла медиа или None)
+        """
+        msg_data = {
+            'id': message.id,
+            'date': message.date.isoformat() if message.date else None,
+            'sender_id': message.sender_id,
+            'text': message.text,
+            'media_type': None,
+            'media_path': None
+        }
+        
+        if not message.media:
+            return msg_data, None
         
-        print(f"✅ Архив создан: {archive_path} ({os.path.getsize(archive_path)//1024} KB)")
-        return archive_path
+        if isinstance(message.media, MessageMediaPhoto):
+            msg_data['media_type'] = 'photo'
+            ext = 'jpg'
+        elif isinstance(message.media, MessageMediaDocument):
+            msg_data['media_type'] = 'document'
+            # Получаем расширение файла
+            doc = message.media.document
+            mime_type = doc.mime_type if doc.mime_type else 'bin'
+            ext = mime_type.split('/')[-1]
+        else:
+            ext = 'bin'
+        return msg_data, ext
+    
+    def _attach_cached_media(self, msg_data, sha256, media_folder, volumes, media_arcdir):
+        """
+        Ссылка сообщения на файл кэша (путь внутри архива и хэш содержимого)
+        и постановка файла в собираемый том
+        """
+        name = self.media_cache.link_into(sha256, media_folder)
+        msg_data['media_path'] = f"media/{name}"
+        msg_data['media_sha256'] = sha256
+        volumes.add_media(f"{media_folder}/{name}", f"{media_arcdir}/{name}")
+    
+    def _refill_volume(self, volumes, ndjson_path, channel_folder, media_arcdir):
+        """Повторная запись в текущий том сообщений, сохраненных до сбоя"""
+        closed = [(volume['min_id'], volume['max_id']) for volume in volumes.volumes]
+        batch = []
+        with open(ndjson_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                if record.pop('type') != 'message':
+                    continue
+                if any(low <= record['id'] <= high for low, high in closed):
+                    continue
+                if record.get('media_path'):
+                    media_file = f"{channel_folder}/{record['media_path']}"
+                    if os.path.exists(media_file):
+                        volumes.add_media(media_file, f"{media_arcdir}/{os.path.basename(media_file)}")
+                batch.append(record)
+        volumes.write_messages(batch)
+        volumes.checkpoint()
+    
+    def _get_compress_pool(self):
+        """Общий пул процессов сжатия (на все каналы пакета), None - сжатие в одном потоке"""
+        if self._compress_pool is None and self.compress_workers > 1:
+            self._compress_pool = ProcessPoolExecutor(max_workers=self.compress_workers)
+        return self._compress_pool
     
     async def get_available_chats(self):
         """Получение списка доступных чатов/каналов"""
@@ -218,16 +530,21 @@ class TelegramArchiver:
     
     async def close(self):
         """Закрытие соединения"""
+        if self._compress_pool:
+            self._compress_pool.shutdown(wait=True)
+            self._compress_pool = None
         if self.client:
             await self.client.disconnect()
             print("🔌 Соединение с Telegram закрыто")
 
-def sync_download_channel(api_id, api_hash, channel_link, limit=100):
+def sync_download_channel(api_id, api_hash, channel_link, limit=100, media_concurrency=4,
+                          open_volume_builder=None):
     """
     Синхронная версия скачивания канала
     (для использования из обычного кода)
     """
-    archiver = TelegramArchiver(api_id, api_hash)
+    archiver = TelegramArchiver(api_id, api_hash, media_concurrency=media_concurrency,
+                                open_volume_builder=open_volume_builder)
     
     # Запускаем асинхронную функцию
     async def run():
@@ -239,22 +556,74 @@ def sync_download_channel(api_id, api_hash, channel_link, limit=100):
     
     return asyncio.run(run())
 
-def get_telegram_credentials():
+def sync_download_channels(api_id, api_hash, channels, limit=100, max_parallel=3, media_concurrency=4,
+                           volume_size=VOLUME_SIZE, open_volume_builder=None):
     """
-    Получение или запрос учетных данных Telegram
+    Синхронная версия пакетной архивации каналов
+    
+    Returns:
+        list: Результаты по каналам (см. TelegramArchiver.download_channels)
     """
-    creds_file = "./telegram_credentials.json"
+    archiver = TelegramArchiver(api_id, api_hash, media_concurrency=media_concurrency, volume_size=volume_size,
+                                open_volume_builder=open_volume_builder)
     
-    # Пробуем загрузить из файла
+    async def run():
+        if await archiver.connect():
+            results = await archiver.download_channels(channels, limit, max_parallel)
+            await archiver.close()
+            return results
+        return []
+    
+    return asyncio.run(run())
+
+def sync_capture_live(api_id, api_hash, chats, segment_seconds=SEGMENT_SECONDS, segment_bytes=SEGMENT_BYTES,
+                      on_segment=None, stop_event=None, open_volume_builder=None):
+    """
+    Синхронная версия живого режима
+    Работает до установки stop_event (threading.Event) или Ctrl+C
+    """
+    archiver = TelegramArchiver(api_id, api_hash, open_volume_builder=open_volume_builder)
+    
+    async def run():
+        if not await archiver.connect():
+            return None
+        try:
+            return await archiver.capture_live(chats, segment_seconds, segment_bytes, on_segment, stop_event)
+        finally:
+            await archiver.close()
+    
+    return asyncio.run(run())
+
+def load_saved_credentials(creds_file="./telegram_credentials.json"):
+    """
+    Загрузка сохраненных учетных данных Telegram без запроса у пользователя
+    (для фонового режима)
+    
+    Returns:
+        tuple: (api_id, api_hash) или (None, None)
+    """
     if os.path.exists(creds_file):
         try:
             with open(creds_file, 'r') as f:
                 creds = json.load(f)
-                print("✅ Учетные данные загружены из файла")
                 return creds.get('api_id'), creds.get('api_hash')
         except:
             pass
     
+    return None, None
+
+def get_telegram_credentials():
+    """
+    Получение или запрос учетных данных Telegram
+    """
+    creds_file = "./telegram_credentials.json"
+    
+    # Пробуем загрузить из файла
+    api_id, api_hash = load_saved_credentials(creds_file)
+    if api_id and api_hash:
+        print("✅ Учетные данные загружены из файла")
+        return api_id, api_hash
+    
     # Запрашиваем у пользователя
     print("=" * 60)
     print("📱 НАСТРОЙКА TELEGRAM АРХИВАТОРА")
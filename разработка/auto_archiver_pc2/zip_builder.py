@@ -0,0 +1,508 @@
+"""
+Потоковая сборка zip-архива канала
+Файлы добавляются по мере готовности, способ сжатия выбирается по типу файла.
+Сжатие идет параллельно в пуле процессов блоками (как pigz): каждый блок -
+независимый поток deflate, блоки склеиваются в один поток записи zip,
+CRC32 блоков объединяется. Запись архива (заголовки, центральный каталог,
+ZIP64 для больших файлов) - в одном фоновом потоке, в порядке добавления.
+Результат - обычный zip, читается zipfile.ZipFile. Вместо файла архив можно
+писать в поток без seek (например, в сокет): тогда CRC и размеры файлов
+пишутся в дескрипторы данных после содержимого.
+"""
+import os
+import sys
+import time
+import zlib
+import queue
+import shutil
+import struct
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+# Уже сжатые форматы: повторное сжатие только тратит время
+STORED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic',
+                     '.mp4', '.mov', '.quicktime', '.mkv', '.x-matroska', '.webm', '.avi',
+                     '.mp3', '.mpeg', '.ogg', '.oga', '.opus', '.m4a', '.aac',
+                     '.zip', '.gz', '.bz2', '.xz', '.7z', '.rar', '.x-tgsticker', '.enc'}
+
+# Текст сжимается хорошо - не жалеем времени
+TEXT_EXTENSIONS = {'.txt', '.ndjson', '.json', '.csv', '.html', '.xml', '.md', '.log'}
+
+TEXT_LEVEL = 6
+BINARY_LEVEL = 1
+
+METHOD_STORED = 0
+METHOD_DEFLATED = 8
+
+CHUNK_SIZE = 4 * 1024 * 1024       # Блок сжатия
+COPY_BLOCK = 1024 * 1024
+ZIP64_LIMIT = 0xF0000000           # С запасом: сжатый блок может быть чуть больше исходного
+UTF8_FLAG = 0x800
+DESCRIPTOR_FLAG = 0x08             # CRC и размеры - в дескрипторе после данных
+
+
+def compression_for(name):
+    """
+    Способ и уровень сжатия для файла
+
+    Returns:
+        tuple: (метод zip, уровень deflate или None)
+    """
+    ext = os.path.splitext(name)[1].lower()
+    if ext in STORED_EXTENSIONS:
+        return METHOD_STORED, None
+    if ext in TEXT_EXTENSIONS:
+        return METHOD_DEFLATED, TEXT_LEVEL
+    return METHOD_DEFLATED, BINARY_LEVEL
+
+
+def deflate_chunk(path, offset, length, level, final):
+    """
+    Сжатие одного блока файла (выполняется в процессе пула)
+
+    Блок заканчивается Z_SYNC_FLUSH (граница байта), последний - Z_FINISH,
+    поэтому сжатые блоки можно просто записать подряд.
+
+    Returns:
+        tuple: (сжатые байты, CRC32 блока, длина блока)
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read(length)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data)
+    compressed += compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+    return compressed, zlib.crc32(data), len(data)
+
+
+def _gf2_times(matrix, vector):
+    result = 0
+    i = 0
+    while vector:
+        if vector & 1:
+            result ^= matrix[i]
+        vector >>= 1
+        i += 1
+    return result
+
+
+def _gf2_square(matrix):
+    return [_gf2_times(matrix, row) for row in matrix]
+
+
+def crc32_combine(crc1, crc2, length2):
+    """CRC32 склейки двух блоков по их CRC (алгоритм crc32_combine из zlib)"""
+    if length2 <= 0:
+        return crc1
+
+    odd = [0xedb88320] + [1 << n for n in range(31)]
+    even = _gf2_square(odd)
+    odd = _gf2_square(even)
+
+    while True:
+        even = _gf2_square(odd)
+        if length2 & 1:
+            crc1 = _gf2_times(even, crc1)
+        length2 >>= 1
+        if not length2:
+            break
+        odd = _gf2_square(even)
+        if length2 & 1:
+            crc1 = _gf2_times(odd, crc1)
+        length2 >>= 1
+        if not length2:
+            break
+
+    return crc1 ^ crc2
+
+
+def _dos_datetime(timestamp):
+    t = time.localtime(timestamp)
+    year = min(max(t.tm_year, 1980), 2107)
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday)
+
+
+class _Entry:
+    def __init__(self, file_path, arcname):
+        self.file_path = file_path
+        self.name = arcname.encode('utf-8')
+        self.size = os.path.getsize(file_path)
+        self.method, self.level = compression_for(arcname)
+        self.dos_time, self.dos_date = _dos_datetime(os.path.getmtime(file_path))
+        self.zip64 = self.size >= ZIP64_LIMIT
+        self.crc = 0
+        self.compressed_size = 0
+        self.offset = 0
+
+
+class _StreamOutput:
+    """Поток без seek с подсчетом записанных байт (смещения для центрального каталога)"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._position = 0
+
+    def write(self, data):
+        self._stream.write(data)
+        self._position += len(data)
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        pass
+
+
+class StreamingZipBuilder:
+    def __init__(self, archive_path=None, workers=1, pool=None, max_inflight=None, stream=None):
+        """
+        Открытие архива на запись
+
+        Пишем во временный файл .part и атомарно переименовываем при закрытии,
+        чтобы наблюдатель за папкой не подхватил недописанный архив.
+
+        Args:
+            archive_path: Итоговый путь архива
+            workers: Процессов сжатия (1 - сжатие в потоке записи)
+            pool: Общий ProcessPoolExecutor (например, на все каналы пакета)
+            max_inflight: Максимум блоков в работе (ограничивает память)
+            stream: Объект с методом write() вместо файла (архив не попадает на диск)
+        """
+        self.archive_path = archive_path
+        self._streaming = stream is not None
+        if self._streaming:
+            self.partial_path = None
+            self._file = _StreamOutput(stream)
+        else:
+            self.partial_path = archive_path + ".part"
+            self._file = open(self.partial_path, 'wb')
+
+        self._own_pool = pool is None and workers > 1
+        self._pool = ProcessPoolExecutor(max_workers=workers) if self._own_pool else pool
+        self.max_inflight = max_inflight or max(workers, getattr(pool, '_max_workers', 1)) * 4
+
+        self._entries = []
+        self._names = set()
+        self._queue = queue.Queue()
+        self._error = None
+        self._cancelled = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+        self.stats = {"files": 0, "stored": 0, "deflated": 0, "bytes_in": 0, "bytes_out": 0}
+
+    def add_file(self, file_path, arcname):
+        """
+        Постановка файла в очередь на добавление (возвращает управление сразу)
+
+        Повторно добавленное имя пропускается (одно медиа в нескольких сообщениях).
+
+        Returns:
+            bool: Добавлен ли файл
+        """
+        if arcname in self._names:
+            return False
+        self._names.add(arcname)
+        self._queue.put((file_path, arcname))
+        return True
+
+    def add_folder(self, folder_path, base_path):
+        """Добавление всех файлов папки (имена относительно base_path)"""
+        for root, dirs, files in os.walk(folder_path):
+            for file in sorted(files):
+                file_path = os.path.join(root, file)
+                self.add_file(file_path, os.path.relpath(file_path, base_path).replace(os.sep, '/'))
+
+    # ===== Поток записи =====
+
+    def _submit(self, *args):
+        if self._pool is not None:
+            return self._pool.submit(deflate_chunk, *args)
+        future = Future()
+        future.set_result(deflate_chunk(*args))
+        return future
+
+    def _jobs_for(self, file_path, arcname):
+        """Задания записи одного файла: заголовок, блоки данных, завершение"""
+        entry = _Entry(file_path, arcname)
+        yield ('begin', entry, None)
+
+        if entry.method == METHOD_DEFLATED:
+            offset = 0
+            while True:
+                length = min(CHUNK_SIZE, entry.size - offset)
+                final = offset + length >= entry.size
+                yield ('chunk', entry, self._submit(file_path, offset, length, entry.level, final))
+                offset += length
+                if final:
+                    break
+        else:
+            yield ('copy', entry, None)
+
+        yield ('end', entry, None)
+
+    def _run(self):
+        """
+        Очередь заданий со скользящим окном: блоки следующих файлов
+        сжимаются, пока текущий файл записывается
+        """
+        window = deque()
+        jobs = None
+        input_done = False
+
+        try:
+            while True:
+                while len(window) < self.max_inflight:
+                    if jobs is None:
+                        if input_done:
+                            break
+                        try:
+                            item = self._queue.get(block=not window)
+                        except queue.Empty:
+                            break
+                        if item is None:
+                            input_done = True
+                            break
+                        jobs = self._jobs_for(*item)
+                    job = next(jobs, None)
+                    if job is None:
+                        jobs = None
+                        continue
+                    window.append(job)
+
+                if not window:
+                    if input_done:
+                        break
+                    continue
+                if self._cancelled:
+                    break
+                self._write_job(*window.popleft())
+        except Exception as e:
+            self._error = e
+            for kind, entry, future in window:
+                if future is not None:
+                    future.cancel()
+
+    def _local_header(self, entry):
+        extra = b''
+        if entry.zip64:
+            extra = struct.pack('<HHQQ', 0x0001, 16, entry.size, entry.compressed_size)
+        sizes = (0xFFFFFFFF, 0xFFFFFFFF) if entry.zip64 else (entry.compressed_size, entry.size)
+        return struct.pack('<IHHHHHIIIHH', 0x04034b50, 45 if entry.zip64 else 20, self._flags,
+                           entry.method, entry.dos_time, entry.dos_date, entry.crc,
+                           sizes[0], sizes[1], len(entry.name), len(extra)) + entry.name + extra
+
+    @property
+    def _flags(self):
+        return UTF8_FLAG | DESCRIPTOR_FLAG if self._streaming else UTF8_FLAG
+
+    def _write_job(self, kind, entry, future):
+        f = self._file
+
+        if kind == 'begin':
+            # Заголовок с нулевыми CRC/размерами, исправим в 'end' (или допишем дескриптор)
+            entry.offset = f.tell()
+            f.write(self._local_header(entry))
+
+        elif kind == 'chunk':
+            compressed, crc, length = future.result()
+            f.write(compressed)
+            entry.crc = crc32_combine(entry.crc, crc, length)
+            entry.compressed_size += len(compressed)
+
+        elif kind == 'copy':
+            crc = 0
+            with open(entry.file_path, 'rb') as src:
+                for block in iter(lambda: src.read(COPY_BLOCK), b''):
+                    crc = zlib.crc32(block, crc)
+                    f.write(block)
+                    entry.compressed_size += len(block)
+            entry.crc = crc
+
+        elif kind == 'end':
+            if self._streaming:
+                if entry.zip64:
+                    f.write(struct.pack('<IIQQ', 0x08074b50, entry.crc, entry.compressed_size, entry.size))
+                else:
+                    f.write(struct.pack('<IIII', 0x08074b50, entry.crc, entry.compressed_size, entry.size))
+            else:
+                end = f.tell()
+                f.seek(entry.offset)
+                f.write(self._local_header(entry))
+                f.seek(end)
+
+            self._entries.append(entry)
+            self.stats["files"] += 1
+            self.stats["bytes_in"] += entry.size
+            self.stats["bytes_out"] += entry.compressed_size
+            self.stats["stored" if entry.method == METHOD_STORED else "deflated"] += 1
+
+    def _write_central_directory(self):
+        f = self._file
+        cd_offset = f.tell()
+
+        for entry in self._entries:
+            zip64_fields = []
+            size, compressed_size, offset = entry.size, entry.compressed_size, entry.offset
+            if entry.zip64:
+                zip64_fields += [entry.size, entry.compressed_size]
+                size = compressed_size = 0xFFFFFFFF
+            if entry.offset >= 0xFFFFFFFF:
+                zip64_fields.append(entry.offset)
+                offset = 0xFFFFFFFF
+
+            extra = b''
+            if zip64_fields:
+                extra = struct.pack('<HH', 0x0001, 8 * len(zip64_fields)) + struct.pack(
+                    f'<{len(zip64_fields)}Q', *zip64_fields)
+            version = 45 if zip64_fields else 20
+
+            f.write(struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50, version, version, self._flags,
+                                entry.method, entry.dos_time, entry.dos_date, entry.crc,
+                                compressed_size, size, len(entry.name), len(extra), 0, 0, 0,
+                                0o100644 << 16, offset))
+            f.write(entry.name + extra)
+
+        cd_size = f.tell() - cd_offset
+        count = len(self._entries)
+
+        if count >= 0xFFFF or cd_offset >= 0xFFFFFFFF or cd_size >= 0xFFFFFFFF:
+            zip64_end = f.tell()
+            f.write(struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, 45, 45, 0, 0,
+                                count, count, cd_size, cd_offset))
+            f.write(struct.pack('<IIQI', 0x07064b50, 0, zip64_end, 1))
+            count = min(count, 0xFFFF)
+            cd_size = min(cd_size, 0xFFFFFFFF)
+            cd_offset = min(cd_offset, 0xFFFFFFFF)
+
+        f.write(struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, count, count, cd_size, cd_offset, 0))
+
+    def _finish_thread(self):
+        self._queue.put(None)
+        self._thread.join()
+        if self._own_pool:
+            self._pool.shutdown(wait=True)
+
+    def close(self):
+        """
+        Дописывание очереди, центрального каталога и публикация архива
+
+        Returns:
+            str: Путь к архиву (None при записи в поток)
+        """
+        self._finish_thread()
+        try:
+            if self._error:
+                raise self._error
+            self._write_central_directory()
+        except Exception:
+            self._file.close()
+            if self.partial_path:
+                os.remove(self.partial_path)
+            raise
+        self._file.close()
+        if self._streaming:
+            return None
+        os.replace(self.partial_path, self.archive_path)
+        return self.archive_path
+
+    def abort(self):
+        """Отмена сборки и удаление временного файла"""
+        self._cancelled = True
+        self._finish_thread()
+        self._file.close()
+        if self.partial_path and os.path.exists(self.partial_path):
+            os.remove(self.partial_path)
+
+
+def _make_synthetic_channel(folder, total_mb):
+    """
+    Синтетический канал: текст сообщений, документы (сжимаемые данные)
+    и фото (несжимаемые, хранятся без сжатия)
+    """
+    os.makedirs(f"{folder}/media", exist_ok=True)
+    words = ("привет канал новости сегодня завтра хорошо плохо отлично важно "
+             "message update channel photo video link https telegram").split()
+    line = " ".join(words[(i * 7) % len(words)] for i in range(200))
+
+    text_bytes = total_mb * 1024 * 1024 * 3 // 10
+    with open(f"{folder}/messages.ndjson", 'w', encoding='utf-8') as f:
+        written, n = 0, 0
+        while written < text_bytes:
+            record = f'{{"type": "message", "id": {n}, "text": "{line[n % 97:]}"}}\n'
+            f.write(record)
+            written += len(record.encode('utf-8'))
+            n += 1
+
+    file_size = 8 * 1024 * 1024
+    media_bytes = total_mb * 1024 * 1024 - text_bytes
+    seed = os.urandom(file_size // 4)
+    for i in range(max(media_bytes // file_size, 1)):
+        if i % 3 == 2:
+            with open(f"{folder}/media/photo_{i}.jpg", 'wb') as f:
+                f.write(os.urandom(file_size))
+        else:
+            # Частично сжимаемый документ
+            with open(f"{folder}/media/doc_{i}.pdf", 'wb') as f:
+                f.write(seed + bytes(file_size // 4) + seed + line.encode('utf-8') * (file_size // 4 // len(line.encode('utf-8'))))
+
+
+def benchmark(total_mb=5120, max_workers=None, workdir=None):
+    """
+    Замер скорости сборки архива синтетического канала
+    при разном количестве процессов сжатия
+
+    Args:
+        total_mb: Размер синтетического канала (MB)
+        max_workers: Максимум процессов (по умолчанию - число ядер)
+        workdir: Папка для временных файлов
+
+    Returns:
+        list: Результаты [{workers, seconds, mb_per_sec, speedup}, ...]
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    temp_dir = tempfile.mkdtemp(prefix="zip_bench_", dir=workdir)
+    results = []
+
+    try:
+        channel = os.path.join(temp_dir, "channel")
+        print(f"🧪 Создаю синтетический канал {total_mb} MB...")
+        _make_synthetic_channel(channel, total_mb)
+        size_mb = sum(os.path.getsize(os.path.join(root, file))
+                      for root, dirs, files in os.walk(channel) for file in files) / (1024 * 1024)
+
+        workers = 1
+        while True:
+            started = time.perf_counter()
+            builder = StreamingZipBuilder(os.path.join(temp_dir, "bench.zip"), workers=workers)
+            builder.add_folder(channel, temp_dir)
+            builder.close()
+            seconds = time.perf_counter() - started
+
+            results.append({
+                "workers": workers,
+                "seconds": round(seconds, 2),
+                "mb_per_sec": round(size_mb / seconds, 1),
+                "speedup": round(results[0]["seconds"] / seconds, 2) if results else 1.0
+            })
+            os.remove(os.path.join(temp_dir, "bench.zip"))
+
+            if workers >= max_workers:
+                break
+            workers = min(workers * 2, max_workers)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return results
+
+
+if __name__ == "__main__":
+    # Замер: python zip_builder.py [размер_MB] [макс_процессов]
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 5120
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    for result in benchmark(size, workers):
+        print(f"   Процессов: {result['workers']:>2} | {result['seconds']:8.1f} сек | "
+              f"{result['mb_per_sec']:8.1f} МБ/с | ускорение x{result['speedup']}")